@@ -6,25 +6,313 @@
 # flake8: noqa: E401
 # flake8: noqa: E722
 
-import xmltodict
-import urllib.request
+import os
+import asyncio
+import logging
+import threading
 import urllib.parse
-import urllib.error
-import socket
 import hashlib
 import random
+from xml.etree import ElementTree
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from yarl import URL
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a connection to, and then for data from, a server
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+# Connections kept alive per server and process, about the threads of a worker
+POOL_SIZE = 10
+# Calls an asyncio client makes at once
+MAX_CONCURRENCY = 50
+CHUNK_SIZE = 8192
+
+# The clients of this process keyed by server, see get_client and
+# get_async_client
+_clients = {}
+_clients_lock = threading.Lock()
+_async_clients = {}
+
+
+class ResponseParser:
+    """Parses an XML document fed in chunks into a dictionary the way
+    xmltodict does: children keyed by tag, repeated tags as lists, attributes
+    prefixed with @ and leaves as their text.
+
+    The document is parsed as the chunks come, each element is converted and
+    dropped once closed, so long meeting lists aren't held twice in memory.
+
+    Raises xml.etree.ElementTree.ParseError if the document isn't XML.
+    """
+
+    def __init__(self):
+        self.parser = ElementTree.XMLPullParser(events=("start", "end"))
+        self.stack = [{}]
+
+    def feed(self, chunk):
+        self.parser.feed(chunk)
+        self._read_events()
+
+    def close(self):
+        self.parser.close()
+        self._read_events()
+        return self.stack[0]
+
+    def _read_events(self):
+        for event, element in self.parser.read_events():
+            if event == "start":
+                self.stack.append({"@" + k: v for k, v in element.attrib.items()})
+                continue
+            node = self.stack.pop()
+            text = (element.text or "").strip()
+            if node:
+                if text:
+                    node["#text"] = text
+                value = node
+            else:
+                value = text or None
+            parent = self.stack[-1]
+            if element.tag not in parent:
+                parent[element.tag] = value
+            elif isinstance(parent[element.tag], list):
+                parent[element.tag].append(value)
+            else:
+                parent[element.tag] = [parent[element.tag], value]
+            element.clear()
+
+
+def parse_response(chunks):
+    """Parses an XML document given as an iterable of byte chunks, see
+    ResponseParser.
+    """
+    parser = ResponseParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+def get_response_content(document):
+    response = document.get("response")
+    return response if isinstance(response, dict) else {}
+
+
+def log_failure(url, error):
+    # The URL is left out, its checksum is as good as the secret
+    logger.warning(
+        "BigBlueButton call %s failed: %s",
+        urllib.parse.urlsplit(url).path,
+        type(error).__name__,
+    )
+
+
+class BaseBBBClient:
+    """The calls of the API of a BigBlueButton server, made by ``get``.
+
+    Calls return the content of the response element of the answer, or {} if
+    the server couldn't be reached or didn't answer in XML.
+    """
 
+    def __init__(self, url, secret):
+        self.url = url
+        self.secret = secret
 
-def bbb_wrap_load_file(url):
-    timeout = 10
-    socket.setdefaulttimeout(timeout)
+    def get(self, url):
+        raise NotImplementedError
 
-    try:
-        req = urllib.request.urlopen(url)
-        reqdict = xmltodict.parse(req.read())
-        return dict(reqdict.get("response"))
-    except:
-        return False
+    def create_meeting(
+        self,
+        name,
+        meeting_id,
+        moderator_pw,
+        attendee_pw,
+        welcome_message,
+        logout_url,
+        callback_url,
+        duration=0,
+        allow_start_stop_recording=True,
+        auto_start_recording=False,
+        **kwargs
+    ):
+        return self.get(
+            create_meeting_url(
+                name,
+                meeting_id,
+                attendee_pw,
+                moderator_pw,
+                welcome_message,
+                logout_url,
+                callback_url,
+                self.url,
+                self.secret,
+                duration,
+                allow_start_stop_recording,
+                auto_start_recording,
+                **kwargs
+            )
+        )
+
+    def join_meeting_url(self, meeting_id, full_name, user_id, password, **kwargs):
+        return join_meeting_url(
+            meeting_id, full_name, user_id, password, self.url, self.secret, **kwargs
+        )
+
+    def is_meeting_running(self, meeting_id):
+        return self.get(is_meeting_running_url(meeting_id, self.url, self.secret))
+
+    def get_meeting_info(self, meeting_id, moderator_pw):
+        return self.get(
+            get_meeting_info_url(meeting_id, moderator_pw, self.url, self.secret)
+        )
+
+    def get_meetings(self):
+        return self.get(get_meetings_url(self.url, self.secret))
+
+    def end_meeting(self, meeting_id, moderator_pw):
+        return self.get(
+            end_meeting_url(meeting_id, moderator_pw, self.url, self.secret)
+        )
+
+
+class BBBClient(BaseBBBClient):
+    """Calls the API of a BigBlueButton server.
+
+    Connections are kept alive in a pool shared by the threads of the process,
+    so a burst of calls, like a class joining at once, doesn't pay a TCP and
+    TLS handshake each. Every call has its own connect and read timeouts.
+    """
+
+    def __init__(
+        self,
+        url,
+        secret,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        pool_size=POOL_SIZE,
+    ):
+        super().__init__(url, secret)
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        # Connections the server closed while idle in the pool are reopened
+        # once, the API calls can all be repeated
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=2, read=1, redirect=0, status=0),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url):
+        try:
+            with self.session.get(url, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                document = parse_response(response.iter_content(CHUNK_SIZE))
+        except (requests.RequestException, ElementTree.ParseError) as error:
+            log_failure(url, error)
+            return {}
+        return get_response_content(document)
+
+
+class AsyncBBBClient(BaseBBBClient):
+    """Calls the API of a BigBlueButton server from asyncio code, the calls
+    are coroutines.
+
+    Like BBBClient, connections are kept alive in a pool and every call has
+    its own timeouts. At most ``max_concurrency`` calls are made at once, the
+    others wait for their turn, so a burst of requests doesn't flood the
+    server.
+
+    The session is bound to the event loop of the first call, see
+    get_async_client.
+    """
+
+    def __init__(
+        self,
+        url,
+        secret,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        pool_size=POOL_SIZE,
+        max_concurrency=MAX_CONCURRENCY,
+    ):
+        super().__init__(url, secret)
+        self.timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        self.session = None
+        self.semaphore = None
+
+    async def get(self, url):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=self.timeout,
+            )
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            async with self.semaphore:
+                # Sent as signed, aiohttp would otherwise quote the query
+                # again and the server reject its checksum
+                async with self.session.get(URL(url, encoded=True)) as response:
+                    response.raise_for_status()
+                    parser = ResponseParser()
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        parser.feed(chunk)
+                    document = parser.close()
+        except (
+            aiohttp.ClientError,
+            asyncio.TimeoutError,
+            ElementTree.ParseError,
+        ) as error:
+            log_failure(url, error)
+            return {}
+        return get_response_content(document)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+def get_client(url, secret):
+    """Returns the BBBClient of the server at url for this process.
+
+    Clients are keyed by process too, as connections can't be shared with the
+    workers forked after they were opened.
+    """
+    key = (os.getpid(), url, secret)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = BBBClient(url, secret)
+    return client
+
+
+def get_async_client(url, secret):
+    """Returns the AsyncBBBClient of the server at url for the running event
+    loop.
+    """
+    clients = _async_clients.setdefault(asyncio.get_event_loop(), {})
+    client = clients.get((url, secret))
+    if client is None:
+        client = clients[(url, secret)] = AsyncBBBClient(url, secret)
+    return client
+
+
+async def close_async_clients():
+    """Closes the AsyncBBBClients of the running event loop, before it's
+    closed.
+    """
+    for client in _async_clients.pop(asyncio.get_event_loop(), {}).values():
+        await client.close()
 
 
 def join_meeting_url(
@@ -247,29 +535,20 @@ def create_meeting(
         - False if an error occurs while parsing
         - Dictionary containing the values of the xml packet
     """
-    create_url = create_meeting_url(
+    return get_client(url, secret).create_meeting(
         name,
         meeting_id,
-        attendee_pw,
         moderator_pw,
+        attendee_pw,
         welcome_message,
         logout_url,
         callback_url,
-        url,
-        secret,
         duration,
         allow_start_stop_recording,
         auto_start_recording,
         **kwargs
     )
 
-    response = bbb_wrap_load_file(create_url)
-    if response:
-        return response
-
-    # if unable to reach the server
-    return {}
-
 
 def get_meeting_info(meetingID, modPW, URL, SALT):
     """This method calls the get_meeting_info on the bigbluebutton server and returns an array.
@@ -286,14 +565,7 @@ def get_meeting_info(meetingID, modPW, URL, SALT):
             - If the returncode == 'SUCCESS' it returns a dictionary containing a meetingID, moderatorPW, attendeePW,
                 hasBeenForciblyEnded, running, startTime, endTime, participantCount, moderatorCount, and attendees.
     """
-    _get_meeting_info_url = get_meeting_info_url(meetingID, modPW, URL, SALT)
-    response = bbb_wrap_load_file(_get_meeting_info_url)
-
-    if response:
-        return response
-
-    # if unable to reach the server
-    return {}
+    return get_client(URL, SALT).get_meeting_info(meetingID, modPW)
 
 
 def get_meetings(URL, SALT):
@@ -315,14 +587,7 @@ def get_meetings(URL, SALT):
         - If SUCCESS then returns an array of all the meetings. Each element in the array is an array containing a meetingID,
             moderatorPW, attendeePW, hasBeenForciblyEnded, running.
     """
-    _get_meetings_url = get_meetings_url(URL, SALT)
-    response = bbb_wrap_load_file(_get_meetings_url)
-
-    if response:
-        return response
-
-    # if unable to reach the server
-    return {}
+    return get_client(URL, SALT).get_meetings()
 
 
 def end_meeting(meetingID, modPW, URL, SALT):
@@ -337,14 +602,7 @@ def end_meeting(meetingID, modPW, URL, SALT):
         - {} if the server is unreachable
         - A dictionary containing a returncode, messageKey, message.
     """
-    _end_meeting_url = end_meeting_url(meetingID, modPW, URL, SALT)
-    response = bbb_wrap_load_file(_end_meeting_url)
-
-    if response:
-        return response
-
-    # if unable to reach the server
-    return {}
+    return get_client(URL, SALT).end_meeting(meetingID, modPW)
 
 
 def is_meeting_running(meetingID, URL, SALT):
@@ -357,11 +615,4 @@ def is_meeting_running(meetingID, URL, SALT):
 
     @return A boolean of true if the meeting is running and false if it is not running
     """
-    _is_meeting_running_url = is_meeting_running_url(meetingID, URL, SALT)
-    response = bbb_wrap_load_file(_is_meeting_running_url)
-
-    if response:
-        return response
-
-    # if unable to reach the server
-    return {}
+    return get_client(URL, SALT).is_meeting_running(meetingID)
@@ -0,0 +1,390 @@
+import asyncio
+import time
+from collections import namedtuple
+from hashlib import md5
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from .bbb import get_async_client, get_client
+
+CREATED_KEY = "bbb:meeting:{}:{}"
+MEETINGS_KEY = "bbb:meetings:{}"
+REFRESH_LOCK_KEY = "bbb:meetings:{}:refresh"
+PLACEMENT_KEY = "bbb:placement:{}"
+# Participants a server takes when BBB_SERVERS doesn't say
+DEFAULT_CAPACITY = 100
+# Seconds a sweep may take before another process takes over, and between two
+# looks at the cache while waiting for one
+REFRESH_TIMEOUT = 15
+REFRESH_POLL = 0.1
+END_TOKEN_SALT = "meetings.end"
+
+
+def parse_meetings(response):
+    """
+    Returns the ``{"created_at", "running", "participants"}`` state of the
+    meetings of a getMeetings response, keyed by meeting id.
+    """
+    meetings = (response.get("meetings") or {}).get("meeting") or []
+    if isinstance(meetings, dict):
+        meetings = [meetings]
+    return {
+        meeting["meetingID"]: {
+            "created_at": int(meeting.get("createTime") or 0) / 1000,
+            "running": meeting.get("running") == "true",
+            "participants": int(meeting.get("participantCount") or 0),
+        }
+        for meeting in meetings
+        if meeting.get("meetingID")
+    }
+
+
+def make_end_token(meeting_id):
+    """
+    Returns the token of the end of meeting callback of a meeting. The server
+    calls it back without credentials, so the token is signed.
+    """
+    return signing.Signer(salt=END_TOKEN_SALT).sign(str(meeting_id))
+
+
+def parse_end_token(token):
+    """
+    Returns the meeting id of an end of meeting callback token, None if it
+    isn't valid.
+    """
+    try:
+        return signing.Signer(salt=END_TOKEN_SALT).unsign(token)
+    except signing.BadSignature:
+        return None
+
+
+# A BigBlueButton server of BBB_SERVERS
+BBBServer = namedtuple("BBBServer", ["url", "secret", "capacity"])
+
+
+def get_servers():
+    """
+    Returns the BigBlueButton servers meetings are placed on, those of
+    BBB_SERVERS or else the server of BBB_URL.
+    """
+    servers = settings.BBB_SERVERS or [
+        {"url": settings.BBB_URL, "secret": settings.BBB_SECRET}
+    ]
+    return [
+        BBBServer(
+            server["url"], server["secret"], server.get("capacity") or DEFAULT_CAPACITY
+        )
+        for server in servers
+    ]
+
+
+def get_server(url):
+    """
+    Returns the server at ``url``, or the first one if it isn't one of
+    them anymore.
+    """
+    servers = get_servers()
+    for server in servers:
+        if server.url == url:
+            return server
+    return servers[0]
+
+
+def rank_servers(meeting_id, servers):
+    """
+    Returns ``servers`` in an order of their own for each meeting, the order
+    of rendezvous hashing: adding or removing a server only moves the
+    meetings which rank it first.
+    """
+    return sorted(
+        servers,
+        key=lambda server: md5(
+            "{}:{}".format(server.url, meeting_id).encode()
+        ).hexdigest(),
+        reverse=True,
+    )
+
+
+def choose_server(meeting_id, loads):
+    """
+    Returns the server with the fewest participants for its capacity, given
+    the load of every server, None for those which didn't answer. Ties, and
+    meetings for which no server answered, go to the first server of the
+    meeting's ranking.
+    """
+    ranked = rank_servers(meeting_id, list(loads))
+    answered = [server for server in ranked if loads[server] is not None]
+    if not answered:
+        return ranked[0]
+    return min(answered, key=lambda server: loads[server] / server.capacity)
+
+
+def get_placement(meeting_id, server):
+    """
+    Returns the server a meeting was placed on lately, placing it on
+    ``server`` if it wasn't, so a meeting created by several requests at once
+    lands on a single server.
+    """
+    key = PLACEMENT_KEY.format(meeting_id)
+    cache.add(key, server.url, settings.BBB_MEETING_TTL)
+    return get_server(cache.get(key) or server.url)
+
+
+def place_meeting(meeting_id):
+    """
+    Returns the server on which to create a meeting, see choose_server.
+    """
+    placed = cache.get(PLACEMENT_KEY.format(meeting_id))
+    if placed is not None:
+        return get_server(placed)
+    servers = get_servers()
+    if len(servers) == 1:
+        return servers[0]
+    loads = {
+        server: MeetingStates(server.url, server.secret).get_load()
+        for server in servers
+    }
+    return get_placement(meeting_id, choose_server(meeting_id, loads))
+
+
+async def async_place_meeting(meeting_id):
+    placed = await sync_to_async(cache.get, thread_sensitive=True)(
+        PLACEMENT_KEY.format(meeting_id)
+    )
+    if placed is not None:
+        return get_server(placed)
+    servers = get_servers()
+    if len(servers) == 1:
+        return servers[0]
+    loads = await asyncio.gather(
+        *(MeetingStates(s.url, s.secret).async_get_load() for s in servers)
+    )
+    server = choose_server(meeting_id, dict(zip(servers, loads)))
+    return await sync_to_async(get_placement, thread_sensitive=True)(meeting_id, server)
+
+
+class MeetingStates:
+    """
+    The state of the meetings of a BigBlueButton server, kept in the cache so
+    joins and the status polls of a class don't each call the server.
+
+    The meetings are refreshed all at once by a getMeetings sweep, at most
+    every ``BBB_RUNNING_TTL`` seconds. A single process sweeps at a time, the
+    others answer from the last sweep meanwhile, or wait for the first one.
+    Meetings created from here are known for ``BBB_MEETING_TTL`` seconds
+    without a sweep, unless a sweep sent since no longer lists them. Creating
+    or ending a meeting updates the last sweep and has it made again.
+
+    Every method has a coroutine version for the async views, prefixed with
+    ``async_``.
+    """
+
+    def __init__(self, url, secret):
+        self.url = url
+        self.secret = secret
+        self.server = md5(url.encode()).hexdigest()
+        self.meetings_key = MEETINGS_KEY.format(self.server)
+        self.lock_key = REFRESH_LOCK_KEY.format(self.server)
+
+    def get_created_key(self, meeting_id):
+        return CREATED_KEY.format(self.server, meeting_id)
+
+    def make_snapshot(self, response, previous, started):
+        """
+        Returns the sweep to cache from a getMeetings response sent at
+        ``started``, keeping the previous meetings for another while if the
+        server didn't answer.
+        """
+        if response.get("returncode") == "SUCCESS":
+            meetings, failed = parse_meetings(response), False
+        else:
+            meetings, failed = previous["meetings"] if previous else {}, True
+        return {
+            "time": time.time(),
+            "started": started,
+            "meetings": meetings,
+            "failed": failed,
+        }
+
+    def set_snapshot(self, snapshot):
+        # Kept past the sweep interval, to be answered during the next sweep
+        cache.set(
+            self.meetings_key,
+            snapshot,
+            settings.BBB_MEETING_TTL + settings.BBB_RUNNING_TTL,
+        )
+
+    def is_fresh(self, snapshot):
+        return (
+            snapshot is not None
+            and time.time() - snapshot["time"] < settings.BBB_RUNNING_TTL
+        )
+
+    def refresh(self, previous=None):
+        """
+        Sweeps the meetings of the server, returns the sweep cached.
+        """
+        started = time.time()
+        response = get_client(self.url, self.secret).get_meetings()
+        snapshot = self.make_snapshot(response, previous, started)
+        self.set_snapshot(snapshot)
+        return snapshot
+
+    def get_snapshot(self):
+        """
+        Returns the last sweep of the server, sweeping it again if it wasn't
+        lately.
+        """
+        snapshot = cache.get(self.meetings_key)
+        if self.is_fresh(snapshot):
+            return snapshot
+        if cache.add(self.lock_key, True, REFRESH_TIMEOUT):
+            try:
+                return self.refresh(snapshot)
+            finally:
+                cache.delete(self.lock_key)
+        if snapshot is not None:
+            return snapshot
+
+        deadline = time.monotonic() + REFRESH_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(REFRESH_POLL)
+            snapshot = cache.get(self.meetings_key)
+            if snapshot is not None:
+                return snapshot
+        return self.refresh()
+
+    def get_meetings(self):
+        """
+        Returns the state of the meetings of the server keyed by meeting id.
+        """
+        return self.get_snapshot()["meetings"]
+
+    def get_load(self):
+        """
+        Returns the participants of the server, counting a meeting nobody
+        joined yet as one, or None if it didn't answer the last sweep.
+        """
+        return self.count_load(self.get_snapshot())
+
+    def count_load(self, snapshot):
+        if snapshot.get("failed"):
+            return None
+        return sum(
+            max(meeting.get("participants", 0), 1)
+            for meeting in snapshot["meetings"].values()
+        )
+
+    def was_created(self, meeting_id, created_at, snapshot):
+        """
+        Returns whether a meeting created from here at ``created_at`` may
+        still be, that is unless a sweep sent since succeeded without it.
+        """
+        if (
+            snapshot is None
+            or snapshot["failed"]
+            or snapshot.get("started", 0) <= created_at
+        ):
+            return True
+        return str(meeting_id) in snapshot["meetings"]
+
+    def is_created(self, meeting_id):
+        created_key = self.get_created_key(meeting_id)
+        values = cache.get_many([created_key, self.meetings_key])
+        if created_key in values:
+            snapshot = values.get(self.meetings_key)
+            if self.was_created(meeting_id, values[created_key], snapshot):
+                return True
+            cache.delete(created_key)
+        return str(meeting_id) in self.get_meetings()
+
+    def is_running(self, meeting_id):
+        meeting = self.get_meetings().get(str(meeting_id), {})
+        return meeting.get("running", False)
+
+    def created(self, meeting_id):
+        now = time.time()
+        cache.set(self.get_created_key(meeting_id), now, settings.BBB_MEETING_TTL)
+        self.update(
+            meeting_id, {"created_at": now, "running": False, "participants": 0}
+        )
+
+    def ended(self, meeting_id):
+        cache.delete(self.get_created_key(meeting_id))
+        self.update(meeting_id, None)
+
+    def update(self, meeting_id, state):
+        """
+        Sets the state of a meeting in the last sweep, or drops it if
+        ``state`` is None, and has the sweep made again on the next read.
+        Until then, it's answered with the change, so the meetings placed
+        meanwhile count in the load of the server.
+        """
+        snapshot = cache.get(self.meetings_key)
+        if snapshot is None:
+            return
+        meetings = dict(snapshot["meetings"])
+        if state is None:
+            meetings.pop(str(meeting_id), None)
+        else:
+            meetings[str(meeting_id)] = state
+        self.set_snapshot(dict(snapshot, time=0, meetings=meetings))
+
+    async def async_refresh(self, previous=None):
+        started = time.time()
+        response = await get_async_client(self.url, self.secret).get_meetings()
+        snapshot = self.make_snapshot(response, previous, started)
+        await sync_to_async(self.set_snapshot, thread_sensitive=True)(snapshot)
+        return snapshot
+
+    async def async_get_snapshot(self):
+        cache_get = sync_to_async(cache.get, thread_sensitive=True)
+        snapshot = await cache_get(self.meetings_key)
+        if self.is_fresh(snapshot):
+            return snapshot
+        if await sync_to_async(cache.add, thread_sensitive=True)(
+            self.lock_key, True, REFRESH_TIMEOUT
+        ):
+            try:
+                return await self.async_refresh(snapshot)
+            finally:
+                await sync_to_async(cache.delete, thread_sensitive=True)(self.lock_key)
+        if snapshot is not None:
+            return snapshot
+
+        deadline = time.monotonic() + REFRESH_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(REFRESH_POLL)
+            snapshot = await cache_get(self.meetings_key)
+            if snapshot is not None:
+                return snapshot
+        return await self.async_refresh()
+
+    async def async_get_meetings(self):
+        return (await self.async_get_snapshot())["meetings"]
+
+    async def async_get_load(self):
+        return self.count_load(await self.async_get_snapshot())
+
+    async def async_is_created(self, meeting_id):
+        created_key = self.get_created_key(meeting_id)
+        values = await sync_to_async(cache.get_many, thread_sensitive=True)(
+            [created_key, self.meetings_key]
+        )
+        if created_key in values:
+            snapshot = values.get(self.meetings_key)
+            if self.was_created(meeting_id, values[created_key], snapshot):
+                return True
+            await sync_to_async(cache.delete, thread_sensitive=True)(created_key)
+        return str(meeting_id) in await self.async_get_meetings()
+
+    async def async_is_running(self, meeting_id):
+        meeting = (await self.async_get_meetings()).get(str(meeting_id), {})
+        return meeting.get("running", False)
+
+    async def async_created(self, meeting_id):
+        await sync_to_async(self.created, thread_sensitive=True)(meeting_id)
+
+    async def async_ended(self, meeting_id):
+        await sync_to_async(self.ended, thread_sensitive=True)(meeting_id)
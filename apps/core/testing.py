@@ -0,0 +1,124 @@
+import hashlib
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+
+class FakeBBBHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.fake.lock:
+            self.server.fake.connections += 1
+
+    def do_GET(self):
+        fake = self.server.fake
+        path, _, query = self.path.partition("?")
+        call = path.rsplit("/", 1)[-1]
+        query, _, checksum = query.rpartition("&checksum=")
+        expected = hashlib.sha1((call + query + fake.secret).encode("utf-8"))
+        params = dict(urllib.parse.parse_qsl(query))
+
+        with fake.lock:
+            fake.calls.append((call, params))
+            fake.active += 1
+            fake.max_active = max(fake.max_active, fake.active)
+        try:
+            time.sleep(fake.delay)
+            if checksum != expected.hexdigest():
+                fields = {"returncode": "FAILED", "messageKey": "checksumError"}
+            else:
+                fields = fake.answer(call, params)
+        finally:
+            with fake.lock:
+                fake.active -= 1
+
+        body = "<response>{}</response>".format(
+            "".join(
+                "<{0}>{1}</{0}>".format(tag, value) for tag, value in fields.items()
+            )
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeBBBServer:
+    """
+    A BigBlueButton server answering the API calls of the clients of
+    apps.core.bbb on a local port, for tests. Meetings are kept in memory, in
+    ``meetings``, and are running once created. Their ``participantCount``
+    can be set there.
+
+    The server keeps connections alive and answers every call after ``delay``
+    seconds. It records the calls made, the connections opened and the most
+    calls it answered at once. Start it, or use it as a context manager,
+    ``url`` is then the URL to give the clients.
+    """
+
+    def __init__(self, secret="secret", delay=0):
+        self.secret = secret
+        self.delay = delay
+        self.meetings = {}
+        self.calls = []
+        self.connections = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeBBBHandler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self.url = "http://127.0.0.1:{}/bigbluebutton/".format(
+            self.server.server_address[1]
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def answer(self, call, params):
+        meeting_id = params.get("meetingID")
+        with self.lock:
+            if call == "create":
+                params = dict(params, createTime=int(time.time() * 1000))
+                self.meetings.setdefault(meeting_id, params)
+            elif call == "getMeetings":
+                meetings = "".join(
+                    "<meeting><meetingID>{}</meetingID><createTime>{}</createTime>"
+                    "<running>true</running>"
+                    "<participantCount>{}</participantCount></meeting>".format(
+                        escape(meeting_id),
+                        params["createTime"],
+                        params.get("participantCount", 0),
+                    )
+                    for meeting_id, params in self.meetings.items()
+                )
+                return {"returncode": "SUCCESS", "meetings": meetings}
+            elif call == "isMeetingRunning":
+                running = meeting_id in self.meetings
+                return {"returncode": "SUCCESS", "running": str(running).lower()}
+            elif meeting_id not in self.meetings:
+                return {"returncode": "FAILED", "messageKey": "notFound"}
+            elif call == "end":
+                del self.meetings[meeting_id]
+        return {"returncode": "SUCCESS", "meetingID": escape(meeting_id or "")}
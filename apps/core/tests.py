@@ -1,3 +1,333 @@
-from django.test import TestCase
+import asyncio
+import io
+import socket
+import threading
+import time
+from unittest import mock
+import requests
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from .bbb import (
+    AsyncBBBClient,
+    BBBClient,
+    close_async_clients,
+    get_async_client,
+    get_client,
+    parse_response,
+)
+from .meetings import (
+    BBBServer,
+    MeetingStates,
+    choose_server,
+    get_servers,
+    place_meeting,
+)
+from .testing import FakeBBBServer
 
-# Create your tests here.
+MEETINGS = b"""<response>
+  <returncode>SUCCESS</returncode>
+  <meetings>
+    <meeting><meetingID>1</meetingID><running>true</running></meeting>
+    <meeting>
+      <meetingID>2</meetingID>
+      <metadata><tag kind="a">b</tag></metadata>
+    </meeting>
+  </meetings>
+  <messageKey/>
+</response>"""
+
+
+def make_response(content, status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO(content)
+    return response
+
+
+class ParseResponseTest(SimpleTestCase):
+    def test_documents_are_parsed_like_xmltodict(self):
+        # Split mid-tag, the parser is fed as the chunks come
+        chunks = [MEETINGS[i : i + 7] for i in range(0, len(MEETINGS), 7)]
+        self.assertEqual(
+            parse_response(chunks)["response"],
+            {
+                "returncode": "SUCCESS",
+                "meetings": {
+                    "meeting": [
+                        {"meetingID": "1", "running": "true"},
+                        {
+                            "meetingID": "2",
+                            "metadata": {"tag": {"@kind": "a", "#text": "b"}},
+                        },
+                    ]
+                },
+                "messageKey": None,
+            },
+        )
+
+
+class BBBClientTest(SimpleTestCase):
+    def setUp(self):
+        self.client = BBBClient("https://bbb.darasa.test/bigbluebutton/", "secret")
+
+    def test_calls_are_made_on_the_pooled_session(self):
+        with mock.patch.object(
+            self.client.session, "get", return_value=make_response(MEETINGS)
+        ) as get:
+            response = self.client.get_meetings()
+
+        self.assertEqual(response["returncode"], "SUCCESS")
+        self.assertEqual(len(response["meetings"]["meeting"]), 2)
+        url = get.call_args[0][0]
+        self.assertTrue(url.startswith("https://bbb.darasa.test/bigbluebutton/api/"))
+        self.assertEqual(get.call_args[1], {"timeout": (3.05, 10), "stream": True})
+        # Timeouts are per request, not for every socket of the process
+        self.assertIsNone(socket.getdefaulttimeout())
+
+    def test_failures_answer_nothing(self):
+        for side_effect in (
+            requests.ConnectTimeout(),
+            [make_response(b"<html><body>Bad gateway", 502)],
+            [make_response(b"<html><body>Not XML")],
+        ):
+            with mock.patch.object(self.client.session, "get", side_effect=side_effect):
+                self.assertEqual(self.client.is_meeting_running("1"), {})
+
+    def test_clients_are_shared_per_server(self):
+        client = get_client("https://bbb.darasa.test/", "secret")
+        self.assertIs(get_client("https://bbb.darasa.test/", "secret"), client)
+        self.assertIsNot(get_client("https://other.darasa.test/", "secret"), client)
+
+    def test_connections_are_kept_alive(self):
+        with FakeBBBServer() as fake:
+            client = BBBClient(fake.url, fake.secret)
+            for meeting_id in ("1", "2", "3"):
+                response = client.create_meeting(
+                    meeting_id, meeting_id, "mp", "ap", "", "", ""
+                )
+                self.assertEqual(response["returncode"], "SUCCESS")
+
+        self.assertEqual(len(fake.calls), 3)
+        self.assertEqual(fake.connections, 1)
+
+
+class AsyncBBBClientTest(SimpleTestCase):
+    def test_calls_answer_like_the_sync_client(self):
+        async def run(url, secret):
+            client = AsyncBBBClient(url, secret)
+            try:
+                await client.create_meeting("Algebra", "1", "mp", "ap", "", "", "")
+                return (
+                    await client.is_meeting_running("1"),
+                    await client.end_meeting("1", "mp"),
+                    await client.end_meeting("1", "mp"),
+                )
+            finally:
+                await client.close()
+
+        with FakeBBBServer() as fake:
+            running, ended, missing = asyncio.run(run(fake.url, fake.secret))
+
+        self.assertEqual(running, {"returncode": "SUCCESS", "running": "true"})
+        self.assertEqual(ended["returncode"], "SUCCESS")
+        self.assertEqual(missing["messageKey"], "notFound")
+
+    def test_concurrency_is_bounded(self):
+        async def run(url, secret):
+            client = AsyncBBBClient(url, secret, max_concurrency=2)
+            try:
+                return await asyncio.gather(
+                    *(client.is_meeting_running(str(i)) for i in range(6))
+                )
+            finally:
+                await client.close()
+
+        with FakeBBBServer(delay=0.05) as fake:
+            responses = asyncio.run(run(fake.url, fake.secret))
+
+        self.assertEqual([r["running"] for r in responses], ["false"] * 6)
+        self.assertEqual(len(fake.calls), 6)
+        self.assertEqual(fake.max_active, 2)
+
+    def test_failures_answer_nothing(self):
+        async def run():
+            client = AsyncBBBClient("http://127.0.0.1:1/bigbluebutton/", "secret")
+            try:
+                return await client.get_meetings()
+            finally:
+                await client.close()
+
+        self.assertEqual(asyncio.run(run()), {})
+
+
+@override_settings(BBB_MEETING_TTL=60, BBB_RUNNING_TTL=60)
+class MeetingStatesTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.fake = FakeBBBServer()
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+        self.states = MeetingStates(self.fake.url, self.fake.secret)
+        self.client = get_client(self.fake.url, self.fake.secret)
+
+    def get_calls(self):
+        return [call for call, _ in self.fake.calls]
+
+    def test_rooms_are_swept_at_once(self):
+        for meeting_id in ("1", "2"):
+            self.client.create_meeting(meeting_id, meeting_id, "mp", "ap", "", "", "")
+        self.fake.calls.clear()
+
+        self.assertTrue(self.states.is_running(1))
+        self.assertTrue(self.states.is_running("2"))
+        self.assertFalse(self.states.is_running(3))
+        self.assertTrue(self.states.is_created(2))
+        self.assertEqual(self.get_calls(), ["getMeetings"])
+
+    def test_created_and_ended_meetings_are_known(self):
+        self.assertFalse(self.states.is_created(1))
+        self.client.create_meeting("1", "1", "mp", "ap", "", "", "")
+        self.states.created(1)
+        self.assertTrue(self.states.is_created(1))
+        self.assertEqual(self.get_calls(), ["getMeetings", "create"])
+
+        self.assertTrue(self.states.is_running(1))
+        self.client.end_meeting("1", "mp")
+        self.states.ended(1)
+        self.assertFalse(self.states.is_running(1))
+        self.assertFalse(self.states.is_created(1))
+        self.assertEqual(
+            self.get_calls(),
+            ["getMeetings", "create", "getMeetings", "end", "getMeetings"],
+        )
+
+    def test_meetings_gone_from_a_later_sweep_are_forgotten(self):
+        self.client.create_meeting("1", "1", "mp", "ap", "", "", "")
+        self.states.created(1)
+        # A sweep sent before the meeting was created doesn't list it yet
+        self.states.set_snapshot(
+            {"time": time.time(), "started": 0, "meetings": {}, "failed": False}
+        )
+        self.assertTrue(self.states.is_created(1))
+
+        # The meeting ended on its own, without the callback coming through
+        self.fake.meetings.clear()
+        self.states.refresh()
+        self.assertFalse(self.states.is_created(1))
+        self.assertIsNone(cache.get(self.states.get_created_key(1)))
+
+    def test_concurrent_refreshes_are_made_once(self):
+        self.fake.delay = 0.2
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.states.is_running(1)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [False] * 5)
+        self.assertEqual(self.get_calls(), ["getMeetings"])
+
+    @override_settings(BBB_RUNNING_TTL=0)
+    def test_last_sweep_is_kept_while_the_server_is_down(self):
+        self.client.create_meeting("1", "1", "mp", "ap", "", "", "")
+        self.assertTrue(self.states.is_running(1))
+        self.fake.secret = "rotated"
+        self.assertTrue(self.states.is_running(1))
+        self.assertEqual(self.get_calls(), ["create", "getMeetings", "getMeetings"])
+
+    def test_async_states_share_the_cache(self):
+        async def run():
+            try:
+                created = await self.states.async_is_created(1)
+                await get_async_client(self.fake.url, self.fake.secret).create_meeting(
+                    "1", "1", "mp", "ap", "", "", ""
+                )
+                await self.states.async_created(1)
+                return (
+                    created,
+                    await self.states.async_is_created(1),
+                    await self.states.async_is_running(1),
+                )
+            finally:
+                await close_async_clients()
+
+        self.assertEqual(asyncio.run(run()), (False, True, True))
+        self.assertTrue(self.states.is_running(1))
+        self.assertEqual(self.get_calls(), ["getMeetings", "create", "getMeetings"])
+
+
+class ChooseServerTest(SimpleTestCase):
+    def setUp(self):
+        self.servers = [
+            BBBServer("https://bbb{}.darasa.test/".format(i), "secret", 100)
+            for i in range(4)
+        ]
+
+    def test_the_least_loaded_server_is_chosen(self):
+        loads = dict(zip(self.servers, [40, 10, None, 30]))
+        self.assertEqual(choose_server(1, loads), self.servers[1])
+        # Relative to the capacity
+        self.servers[3] = self.servers[3]._replace(capacity=400)
+        loads = dict(zip(self.servers, [40, 10, None, 30]))
+        self.assertEqual(choose_server(1, loads), self.servers[3])
+
+    def test_meetings_are_hashed_when_no_server_answers(self):
+        loads = dict.fromkeys(self.servers)
+        chosen = {
+            meeting_id: choose_server(meeting_id, loads) for meeting_id in range(100)
+        }
+        self.assertEqual(set(chosen.values()), set(self.servers))
+
+        # Only the meetings of a removed server move
+        del loads[self.servers[0]]
+        for meeting_id, server in chosen.items():
+            if server != self.servers[0]:
+                self.assertEqual(choose_server(meeting_id, loads), server)
+
+
+@override_settings(BBB_MEETING_TTL=60, BBB_RUNNING_TTL=60)
+class PlaceMeetingTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.fakes = [FakeBBBServer(), FakeBBBServer()]
+        for fake in self.fakes:
+            fake.start()
+            self.addCleanup(fake.stop)
+        settings = override_settings(
+            BBB_SERVERS=[
+                {"url": fake.url, "secret": fake.secret} for fake in self.fakes
+            ]
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_meetings_are_placed_on_the_least_loaded_server(self):
+        busy, idle = get_servers()
+        get_client(busy.url, busy.secret).create_meeting(
+            "1", "1", "mp", "ap", "", "", ""
+        )
+        self.fakes[0].meetings["1"]["participantCount"] = 30
+
+        self.assertEqual(place_meeting(2), idle)
+        self.fakes[1].meetings["3"] = {"createTime": 0, "participantCount": 50}
+        MeetingStates(idle.url, idle.secret).refresh()
+        self.assertEqual(place_meeting(4), busy)
+        # Meetings created by several requests at once land on one server
+        self.assertEqual(place_meeting(2), idle)
+
+    def test_unreachable_servers_are_left_out(self):
+        fake = self.fakes[1]
+        servers = [
+            {"url": "http://127.0.0.1:1/bigbluebutton/", "secret": "secret"},
+            {"url": fake.url, "secret": fake.secret},
+        ]
+        with override_settings(BBB_SERVERS=servers):
+            self.assertEqual(
+                {place_meeting(meeting_id).url for meeting_id in range(10)}, {fake.url},
+            )
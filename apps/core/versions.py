@@ -0,0 +1,91 @@
+import time
+import uuid
+from hashlib import md5
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+# Versions are random tokens rather than counters, so a version lost by the
+# cache (eviction, restart) can never come back and validate a stale response.
+VERSION_KEY = "version:{}:{}"
+
+
+def get_cache():
+    """
+    Returns the cache of the versions, shared by every process, see the
+    ``versions`` cache of the settings.
+    """
+    return caches["versions"]
+
+
+def get_versions(keys):
+    """
+    Returns the ``(token, modified timestamp)`` version of every
+    ``(scope, id)`` key, starting a version for the keys the cache doesn't
+    know yet.
+    """
+    cache_keys = {VERSION_KEY.format(scope, pk): (scope, pk) for scope, pk in keys}
+    cache = get_cache()
+    versions = cache.get_many(cache_keys)
+    missing = [key for key in cache_keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, (uuid.uuid4().hex, time.time()), None)
+        versions.update(cache.get_many(missing))
+    return {cache_keys[key]: version for key, version in versions.items()}
+
+
+def bump_versions(scope, ids):
+    """
+    Invalidates every response validated by the versions of ``ids`` in
+    ``scope``.
+    """
+    keys = [VERSION_KEY.format(scope, pk) for pk in ids]
+
+    def bump():
+        now = time.time()
+        get_cache().set_many({key: (uuid.uuid4().hex, now) for key in keys}, None)
+
+    bump()
+    # Responses built between the bump and the commit would be validated
+    # by the new version while showing the old data, so bump again after it
+    transaction.on_commit(bump)
+
+
+def get_validators(keys, *extra):
+    """
+    Returns the ETag and Last-Modified timestamp of a response built from the
+    objects versioned under ``keys``, and anything else in ``extra`` it
+    depends on, such as the query string or the user.
+    """
+    versions = get_versions(keys)
+    digest = md5()
+    for key in sorted(versions, key=str):
+        digest.update("{}={};".format(key, versions[key][0]).encode())
+    for part in extra:
+        digest.update("{};".format(part).encode())
+    last_modified = max((modified for _, modified in versions.values()), default=None)
+    return quote_etag(digest.hexdigest()), last_modified
+
+
+def not_modified_response(request, etag, last_modified):
+    """
+    Returns a ``304 Not Modified`` response if the client's copy is still
+    valid, None otherwise.
+    """
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified) if last_modified else None,
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    # Responses differ per user, and must be revalidated before each reuse
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
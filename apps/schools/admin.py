@@ -2,6 +2,7 @@ from django.contrib import admin
 from .models import (
     School,
     Level,
+    Blackout,
     Student,
     Teacher,
     Course,
@@ -59,6 +60,12 @@ class LevelAdmin(admin.ModelAdmin):
     list_display = ("name", "description")
 
 
+@admin.register(Blackout)
+class BlackoutAdmin(admin.ModelAdmin):
+    list_display = ("name", "start", "end", "level")
+    list_filter = ("level",)
+
+
 @admin.register(Student)
 class StudentAdmin(admin.ModelAdmin):
     list_display = ("user", "level")
@@ -103,6 +110,7 @@ class CourseAdmin(admin.ModelAdmin):
                     "assistant_teachers",
                     "students",
                     "levels",
+                    "weekly_hours",
                     "classroom_join_mode",
                 )
             },
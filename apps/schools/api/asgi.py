@@ -0,0 +1,111 @@
+import re
+from asgiref.sync import sync_to_async
+from corsheaders.middleware import CorsMiddleware
+from django.core.exceptions import RequestAborted
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.http import Http404, JsonResponse
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from apps.core.bbb import close_async_clients
+from . import async_views as views
+
+# Method and path of the calls served by the async views, everything else is
+# left to Django
+ROUTES = [
+    ("POST", r"rooms/(?P<room_id>.+)/join/", views.create_join_meeting_room_link),
+    ("GET", r"rooms/(?P<room_id>.+)/running/", views.check_running_meeting),
+    ("PATCH", r"rooms/(?P<room_id>.+)/end/", views.end_meeting),
+]
+
+
+class AsyncRoomsApplication:
+    """
+    Serves the meeting room calls, which wait on BigBlueButton, from the event
+    loop with the async views, and passes every other request on to
+    ``application``, the ASGI handler of Django.
+
+    Django 3.0 runs its views in a thread, one per request, so a worker would
+    otherwise have as many BigBlueButton calls waiting as threads at most.
+
+    Only requests carrying a JWT are routed to the async views, the others,
+    like the browsable API with a session, are served by the Django views.
+    The end of meeting callback of the server has a path of its own, also
+    served by Django.
+    """
+
+    def __init__(self, application, version="v1"):
+        self.application = application
+        self.routes = [
+            (method, re.compile(r"^/{}/{}$".format(version, path)), view)
+            for method, path, view in ROUTES
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        match = self.match(scope)
+        if match is None:
+            return await self.application(scope, receive, send)
+
+        view, kwargs = match
+        try:
+            body_file = await self.application.read_body(receive)
+        except RequestAborted:
+            return
+        request = ASGIRequest(scope, body_file)
+        await sync_to_async(close_old_connections, thread_sensitive=True)()
+        try:
+            response = await self.get_response(request, view, kwargs)
+        finally:
+            body_file.close()
+            await sync_to_async(close_old_connections, thread_sensitive=True)()
+        await self.application.send_response(response, send)
+
+    def match(self, scope):
+        if scope["type"] != "http":
+            return None
+        headers = dict(scope["headers"])
+        if b"authorization" not in headers:
+            return None
+        for method, pattern, view in self.routes:
+            match = pattern.match(scope["path"])
+            if match is not None and scope["method"] == method:
+                return view, match.groupdict()
+        return None
+
+    async def get_response(self, request, view, kwargs):
+        authentication = JWTAuthentication()
+        try:
+            authenticated = await sync_to_async(
+                authentication.authenticate, thread_sensitive=True
+            )(request)
+            if authenticated is None:
+                raise NotAuthenticated()
+            request.user = authenticated[0]
+            response = await view(request, **kwargs)
+        except APIException as error:
+            # Like the exception handler of the Django views
+            data = error.detail
+            if not isinstance(data, dict):
+                data = {"detail": data}
+            response = JsonResponse(data, status=error.status_code)
+            if error.status_code == 401:
+                header = authentication.authenticate_header(request)
+                response["WWW-Authenticate"] = header
+        except Http404:
+            response = JsonResponse({"detail": "Not found."}, status=404)
+        # The CORS headers Django would have added
+        return await sync_to_async(
+            CorsMiddleware(lambda request: response), thread_sensitive=True
+        )(request)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await close_async_clients()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
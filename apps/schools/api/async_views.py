@@ -0,0 +1,33 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from ..models import Classroom
+from .serializers import ClassroomSerializer
+
+
+def get_classroom(room_id):
+    return get_object_or_404(
+        Classroom.objects.select_related("course__teacher__user"), room_id=room_id
+    )
+
+
+def serialize_classroom(classroom):
+    return ClassroomSerializer(instance=classroom).data
+
+
+async def create_join_meeting_room_link(request, room_id):
+    classroom = await sync_to_async(get_classroom, thread_sensitive=True)(room_id)
+    meeting_room_link = await classroom.async_create_join_link(request.user)
+    return JsonResponse({"meeting_room_link": meeting_room_link})
+
+
+async def check_running_meeting(request, room_id):
+    classroom = await sync_to_async(get_classroom, thread_sensitive=True)(room_id)
+    return JsonResponse({"status": await classroom.async_is_meeting_running()})
+
+
+async def end_meeting(request, room_id):
+    classroom = await sync_to_async(get_classroom, thread_sensitive=True)(room_id)
+    await classroom.async_end_meeting()
+    data = await sync_to_async(serialize_classroom, thread_sensitive=True)(classroom)
+    return JsonResponse(data)
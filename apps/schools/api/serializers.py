@@ -157,6 +157,7 @@ class CourseSerializer(serializers.ModelSerializer):
             "teacher",
             "assistant_teachers",
             "levels",
+            "weekly_hours",
             "students",
             "lessons",
             "posts",
@@ -16,9 +16,12 @@ from .views import (
     create_post_view,
     PostView,
     create_classroom_view,
+    import_classrooms_view,
+    import_classrooms_status_view,
     ClassroomView,
     create_join_meeting_room_link,
     end_meeting,
+    meeting_ended_callback,
     check_running_meeting,
     create_request_view,
     RequestView,
@@ -56,7 +59,10 @@ urlpatterns = [
     re_path(r"^posts/$", create_post_view),
     re_path(r"^posts/(?P<post_id>.+)/$", PostView.as_view()),
     re_path(r"^classrooms/$", create_classroom_view),
+    re_path(r"^classrooms/import/$", import_classrooms_view),
+    re_path(r"^classrooms/import/(?P<task_id>[^/]+)/$", import_classrooms_status_view),
     re_path(r"^classrooms/(?P<classroom_id>.+)/$", ClassroomView.as_view()),
+    re_path(r"^rooms/ended/(?P<token>[^/]+)/$", meeting_ended_callback),
     re_path(r"^rooms/(?P<room_id>.+)/join/$", create_join_meeting_room_link),
     re_path(r"^rooms/(?P<room_id>.+)/end/$", end_meeting),
     re_path(r"^rooms/(?P<room_id>.+)/running/$", check_running_meeting),
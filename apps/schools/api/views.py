@@ -1,6 +1,10 @@
 import datetime
+import uuid
 import dateutil.parser
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models import Q
+from django.http import Http404
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import (
@@ -12,14 +16,37 @@ from rest_framework import (
     mixins,
     filters,
 )
-from rest_framework.decorators import api_view
+from rest_framework.decorators import (
+    api_view,
+    authentication_classes,
+    permission_classes,
+)
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from apps.core.meetings import parse_end_token
 from apps.core.permissions import IsOwnerOrReadOnly
 from apps.core.validators import is_valid_uuid
+from apps.core.versions import (
+    get_validators,
+    get_versions,
+    not_modified_response,
+    set_validators,
+)
 from apps.accounts.models import User
+from apps.timetable.conflicts import (
+    SchedulingConflict,
+    check_conflicts,
+    get_course_calendar_ids,
+)
 from apps.timetable.models import Event, Rule
+from ..imports import (
+    TimetableImport,
+    TimetableImportError,
+    get_file_format,
+    read_timetable,
+    store_timetable,
+)
 from ..models import (
     School,
     Level,
@@ -40,6 +67,11 @@ from .serializers import (
     LessonSerializer,
     PostSerializer,
 )
+from ..tasks import import_timetable
+
+USER_COURSES_TIMEOUT = 60 * 60 * 24
+# Larger timetables are imported in the background
+MAX_INLINE_IMPORT_SIZE = 256 * 1024
 
 
 class SchoolListAPIView(generics.ListAPIView):
@@ -102,7 +134,18 @@ class CoursesView(generics.ListAPIView):
         return queryset
 
     def get(self, request, *args, **kwargs):
-        return super().get(self, request, *args, **kwargs)
+        # Recommendations depend on the courses the user is in
+        etag, last_modified = get_validators(
+            [("courses", "all"), ("user-courses", request.user.pk)],
+            request.user.pk,
+            request.get_full_path(),
+        )
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        response = super().get(self, request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
 
 
 @swagger_auto_schema(
@@ -377,48 +420,147 @@ def create_classroom_view(request, *args, **kwargs):
 
     try:
         course = get_object_or_404(Course.objects.all(), id=course_id)
-        classroom, classroom_created = Classroom.objects.get_or_create(
-            name=name, course=course
-        )
+        # Nothing is kept if the class conflicts with the schedule
+        with transaction.atomic():
+            classroom, classroom_created = Classroom.objects.get_or_create(
+                name=name, course=course
+            )
 
-        if classroom_created:
-            classroom.created_by = request.user
-        else:
-            classroom.modified_by = request.user
+            if classroom_created:
+                classroom.created_by = request.user
+            else:
+                classroom.modified_by = request.user
 
-        classroom.description = description
-        classroom.welcome_message = welcome_message
-        classroom.save()
+            classroom.description = description
+            classroom.welcome_message = welcome_message
+            classroom.save()
 
-        rule, _ = Rule.objects.get_or_create(name=repeat.lower(), frequency=repeat)
+            rule, _ = Rule.objects.get_or_create(name=repeat.lower(), frequency=repeat)
 
-        # Parse dates
-        start = dateutil.parser.parse(start_datetime)
-        end = start + datetime.timedelta(minutes=int(duration))
-        end_recurring_period = dateutil.parser.parse(repeat_until)
+            # Parse dates
+            start = dateutil.parser.parse(start_datetime)
+            end = start + datetime.timedelta(minutes=int(duration))
+            end_recurring_period = dateutil.parser.parse(repeat_until)
 
-        event, event_created = Event.objects.get_or_create(
-            start=start, end=end, classroom=classroom
-        )
+            event, event_created = Event.objects.get_or_create(
+                start=start, end=end, classroom=classroom
+            )
 
-        if event_created:
-            event.created_by = request.user
-        else:
-            event.modified_by = request.user
+            if event_created:
+                event.created_by = request.user
+            else:
+                event.modified_by = request.user
 
-        event.rule = rule
-        event.end_recurring_period = end_recurring_period
-        event.color = color
-        event.save()
-        # Add scheduled class to teachers calendar
-        event.calendars.add(course.teacher.user.calendar)
+            event.rule = rule
+            event.end_recurring_period = end_recurring_period
+            event.color = color
+            event.save()
+            check_conflicts(event, get_course_calendar_ids(course))
+            # Add scheduled class to teachers calendar
+            event.calendars.add(course.teacher.user.calendar)
 
         return Response(ClassroomSerializer(instance=classroom).data)
 
+    except SchedulingConflict as error:
+        return Response(
+            {
+                "message": str(error),
+                "class": error.__class__.__name__,
+                "conflicts": error.as_data(),
+            },
+            status=status.HTTP_409_CONFLICT,
+        )
     except Exception as error:
         raise exceptions.APIException(error)
 
 
+@swagger_auto_schema(
+    method="POST",
+    manual_parameters=[
+        openapi.Parameter("file", openapi.IN_FORM, type=openapi.TYPE_FILE),
+        openapi.Parameter("file_format", openapi.IN_FORM, type=openapi.TYPE_STRING),
+        openapi.Parameter("course_id", openapi.IN_FORM, type=openapi.TYPE_STRING),
+        openapi.Parameter("timezone", openapi.IN_FORM, type=openapi.TYPE_STRING),
+        openapi.Parameter(
+            "check_conflicts", openapi.IN_FORM, type=openapi.TYPE_BOOLEAN
+        ),
+        openapi.Parameter("dry_run", openapi.IN_FORM, type=openapi.TYPE_BOOLEAN),
+    ],
+)
+@api_view(["POST"])
+def import_classrooms_view(request, *args, **kwargs):
+    """
+    Imports the classrooms of a CSV or iCalendar timetable. Small files are
+    imported right away and the report returned, larger ones are imported by
+    a task whose progress is read from the returned status URL.
+    """
+    upload = request.FILES.get("file", None)
+    course_id = request.data.get("course_id", None)
+    tz = request.data.get("timezone", None)
+    check_conflicts = str(request.data.get("check_conflicts", True)).lower() != "false"
+    dry_run = str(request.data.get("dry_run", False)).lower() == "true"
+
+    if upload is None:
+        return Response(
+            {"message": "No timetable file given"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    course = None
+    if course_id:
+        course = get_object_or_404(Course.objects.all(), id=course_id)
+
+    try:
+        file_format = get_file_format(upload.name, request.data.get("file_format"))
+        if upload.size > MAX_INLINE_IMPORT_SIZE:
+            task = import_timetable.delay(
+                store_timetable(upload, file_format),
+                file_format,
+                str(request.user.id),
+                course_id,
+                tz,
+                check_conflicts,
+                dry_run,
+            )
+            return Response(
+                {
+                    "task_id": task.id,
+                    "status_url": request.build_absolute_uri("{}/".format(task.id)),
+                },
+                status=status.HTTP_202_ACCEPTED,
+            )
+
+        timetable_import = TimetableImport(
+            user=request.user,
+            course=course,
+            tz=tz,
+            check_conflicts=check_conflicts,
+            dry_run=dry_run,
+        )
+        report = timetable_import.run(read_timetable(upload.read(), file_format))
+        return Response(report)
+
+    except TimetableImportError as error:
+        return Response({"message": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@swagger_auto_schema(
+    method="GET",
+    manual_parameters=[
+        openapi.Parameter("task_id", openapi.IN_PATH, type=openapi.TYPE_STRING)
+    ],
+)
+@api_view(["GET"])
+def import_classrooms_status_view(request, task_id, *args, **kwargs):
+    result = import_timetable.AsyncResult(task_id)
+    data = {"task_id": task_id, "state": result.state}
+    if result.state == "PROGRESS":
+        data.update(result.info)
+    elif result.successful():
+        data["report"] = result.result
+    elif result.failed():
+        data["message"] = str(result.result)
+    return Response(data)
+
+
 class ClassroomView(
     mixins.RetrieveModelMixin,
     mixins.UpdateModelMixin,
@@ -453,6 +595,29 @@ def end_meeting(request, room_id, *args, **kwargs):
     return Response(ClassroomSerializer(instance=classroom).data)
 
 
+@swagger_auto_schema(
+    method="GET",
+    manual_parameters=[
+        openapi.Parameter("token", openapi.IN_PATH, type=openapi.TYPE_STRING)
+    ],
+)
+@api_view(["GET"])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+def meeting_ended_callback(request, token, *args, **kwargs):
+    """
+    Called by the BigBlueButton server once a meeting ended, on the URL given
+    when it was created. The server sends no credentials, the token of the
+    URL is signed instead.
+    """
+    room_id = parse_end_token(token)
+    if room_id is None:
+        raise Http404
+    classroom = get_object_or_404(Classroom.objects.all(), room_id=room_id)
+    classroom.meeting_states.ended(classroom.room_id)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 @swagger_auto_schema(
     method="POST",
     manual_parameters=[
@@ -520,6 +685,31 @@ class RequestView(
         return self.update(request, *args, **kwargs)
 
 
+def _user_courses_version_keys(user_id):
+    """
+    Returns the version keys of the courses of a user, whose ids are cached
+    until the user joins or leaves a course.
+    """
+    user_id = uuid.UUID(str(user_id))
+    membership = ("user-courses", user_id)
+    token, _ = get_versions([membership])[membership]
+    cache_key = "user-courses:{}:{}".format(user_id, token)
+    course_ids = cache.get(cache_key)
+    if course_ids is None:
+        course_ids = [
+            str(course_id)
+            for course_id in Course.objects.filter(
+                Q(teacher__user=user_id)
+                | Q(assistant_teachers__user=user_id)
+                | Q(students__user=user_id)
+            )
+            .values_list("id", flat=True)
+            .distinct()
+        ]
+        cache.set(cache_key, course_ids, USER_COURSES_TIMEOUT)
+    return [membership] + [("course", course_id) for course_id in course_ids]
+
+
 class UserClassroomsView(generics.ListAPIView):
     serializer_class = ClassroomSerializer
     queryset = Classroom.objects.all()
@@ -530,6 +720,13 @@ class UserClassroomsView(generics.ListAPIView):
         if not is_valid_uuid(user_id):
             raise exceptions.ValidationError("Invalid user_id")
 
+        etag, last_modified = get_validators(
+            _user_courses_version_keys(user_id), request.get_full_path()
+        )
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+
         if user_id:
             try:
                 user = User.objects.filter(id=user_id).first()
@@ -544,7 +741,8 @@ class UserClassroomsView(generics.ListAPIView):
             except Exception as error:
                 raise exceptions.APIException(error)
 
-        return super().get(self, request, *args, **kwargs)
+        response = super().get(self, request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
 
 
 class UserCoursesView(generics.ListAPIView):
@@ -557,6 +755,13 @@ class UserCoursesView(generics.ListAPIView):
         if not is_valid_uuid(user_id):
             raise exceptions.ValidationError("Invalid user_id")
 
+        etag, last_modified = get_validators(
+            _user_courses_version_keys(user_id), request.get_full_path()
+        )
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+
         if user_id:
             try:
                 user = User.objects.filter(id=user_id).first()
@@ -571,7 +776,8 @@ class UserCoursesView(generics.ListAPIView):
             except Exception as error:
                 raise exceptions.APIException(error)
 
-        return super().get(self, request, *args, **kwargs)
+        response = super().get(self, request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
 
 
 class UserRequestsView(generics.ListAPIView):
@@ -0,0 +1,597 @@
+import csv
+import datetime
+import io
+import os
+import random
+import uuid
+from collections import defaultdict
+import dateutil.parser
+import pytz
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from icalendar import Calendar as ICalendar
+from apps.accounts.models import User
+from apps.core.validators import is_valid_uuid
+from apps.timetable.conflicts import (
+    find_overlaps,
+    get_calendar_occurrences,
+    get_candidate_occurrences,
+    get_courses_calendar_ids,
+)
+from apps.timetable.feeds import RRULE_PARTS, WEEKDAY_CODES
+from apps.timetable.models import Event, OccurrenceIndex, Rule
+from apps.timetable.models.rules import freqs
+from apps.timetable.utils import isoformat
+from .models import Classroom, Course, bump_course_versions
+
+IMPORT_FORMATS = ("csv", "ics")
+IMPORT_CHUNK_SIZE = 200
+# Columns of a CSV timetable, course may be a course id or name and teacher the
+# email of one of its teachers
+CSV_COLUMNS = (
+    "course",
+    "teacher",
+    "name",
+    "description",
+    "welcome_message",
+    "logout_url",
+    "start",
+    "end",
+    "duration",
+    "repeat",
+    "params",
+    "repeat_until",
+    "color",
+)
+RULE_PARAMS = set(RRULE_PARTS) | {"byeaster"}
+# iCalendar RRULE parts and their Rule params
+RRULE_PARAMS = {part: param for param, part in RRULE_PARTS.items()}
+RULE_FREQUENCIES = {frequency for frequency, _ in freqs}
+# Reported per conflicting row, the rest are counted
+MAX_REPORTED_CONFLICTS = 3
+
+
+class TimetableImportError(ValueError):
+    """
+    Raised when a timetable can't be imported at all, e.g. when the file can't
+    be read. Problems with single rows are reported instead.
+    """
+
+
+def get_file_format(name, file_format=None):
+    """
+    Returns the format of a timetable file, given explicitly or guessed from
+    its extension.
+    """
+    file_format = (file_format or os.path.splitext(name)[1][1:]).lower()
+    if file_format not in IMPORT_FORMATS:
+        raise TimetableImportError(
+            "Unsupported format {!r}, expected one of {}".format(
+                file_format, ", ".join(IMPORT_FORMATS)
+            )
+        )
+    return file_format
+
+
+def store_timetable(content, file_format):
+    """
+    Saves an uploaded timetable where the import task can read it, returns its
+    path in the default storage.
+    """
+    name = "imports/{}.{}".format(uuid.uuid4().hex, file_format)
+    return default_storage.save(name, content)
+
+
+def read_csv(data):
+    """
+    Yields the rows of a CSV timetable as ``(line number, fields)``. The first
+    line names the columns, see CSV_COLUMNS.
+    """
+    reader = csv.DictReader(io.StringIO(data))
+    columns = {(column or "").strip().lower() for column in reader.fieldnames or ()}
+    missing = {"name", "start"} - columns
+    if not columns & {"end", "duration"}:
+        missing.add("duration")
+    if missing:
+        raise TimetableImportError(
+            "Missing column(s): {}".format(", ".join(sorted(missing)))
+        )
+    for row in reader:
+        yield reader.line_num, {
+            column.strip().lower(): (value or "").strip()
+            for column, value in row.items()
+            if column
+        }
+
+
+def _rrule_fields(rrule):
+    fields = {"repeat": rrule.get("FREQ", [""])[0], "repeat_until": None}
+    params = []
+    unsupported = []
+    for part, values in rrule.items():
+        if part in ("FREQ", "WKST"):
+            if part == "WKST" and values != ["MO"]:
+                unsupported.append("WKST")
+        elif part == "UNTIL":
+            until = values[0]
+            if not isinstance(until, datetime.datetime):
+                # An UNTIL date includes the whole day
+                until = datetime.datetime.combine(until, datetime.time.max)
+            fields["repeat_until"] = until
+        elif part in RRULE_PARAMS:
+            params.append(
+                "{}:{}".format(RRULE_PARAMS[part], ",".join(str(v) for v in values))
+            )
+        else:
+            unsupported.append(part)
+    fields["params"] = ";".join(params)
+    return fields, unsupported
+
+
+def read_ics(data):
+    """
+    Yields the VEVENTs of an iCalendar timetable as ``(number, fields)``, with
+    the course read from their first CATEGORIES and the teacher from their
+    ORGANIZER.
+    """
+    try:
+        calendar = ICalendar.from_ical(data)
+    except ValueError as error:
+        raise TimetableImportError("Invalid iCalendar file: {}".format(error))
+
+    for number, vevent in enumerate(calendar.walk("VEVENT"), 1):
+        fields = {
+            "name": str(vevent.get("summary", "")),
+            "description": str(vevent.get("description", "")),
+            "teacher": str(vevent.get("organizer", "")).replace("mailto:", ""),
+            "start": vevent["dtstart"].dt if "dtstart" in vevent else "",
+            "end": vevent["dtend"].dt if "dtend" in vevent else "",
+            "duration": vevent["duration"].dt if "duration" in vevent else "",
+        }
+        categories = vevent.get("categories")
+        if isinstance(categories, list):
+            categories = categories[0]
+        if categories is not None and categories.cats:
+            fields["course"] = str(categories.cats[0])
+        unsupported = [
+            name for name in ("RECURRENCE-ID", "EXDATE", "RDATE") if name in vevent
+        ]
+        if "rrule" in vevent:
+            rrule_fields, rrule_unsupported = _rrule_fields(vevent["rrule"])
+            fields.update(rrule_fields)
+            unsupported += ["RRULE " + part for part in rrule_unsupported]
+        fields["unsupported"] = unsupported
+        yield number, fields
+
+
+def read_timetable(data, file_format):
+    """
+    Yields the rows of a timetable file, given as bytes, in either of the
+    IMPORT_FORMATS.
+    """
+    if file_format == "ics":
+        return read_ics(data)
+    try:
+        return read_csv(data.decode("utf-8-sig"))
+    except UnicodeDecodeError:
+        raise TimetableImportError("CSV timetables must be UTF-8 encoded")
+
+
+def clean_rule_params(params):
+    """
+    Returns rule params in a canonical form, so equal params are equal strings.
+    Raises ValueError if they aren't valid params.
+    """
+    parts = []
+    for part in params.split(";"):
+        if not part.strip():
+            continue
+        param, _, values = part.partition(":")
+        param = param.strip().lower()
+        values = [value.strip().upper() for value in values.split(",")]
+        if param not in RULE_PARAMS:
+            raise ValueError("Unknown rule param {!r}".format(param))
+        for value in values:
+            if not value.lstrip("+-").isdigit() and value not in WEEKDAY_CODES:
+                raise ValueError("Invalid value {!r} of {}".format(value, param))
+        parts.append("{}:{}".format(param, ",".join(values)))
+    return ";".join(sorted(parts))
+
+
+class ImportRow:
+    def __init__(self, number, fields):
+        self.number = number
+        self.fields = fields
+        self.errors = []
+        self.course = None
+        self.classroom = None
+        self.event = None
+        self.rule_key = None
+        self.candidates = []
+
+
+class TimetableImport:
+    """
+    Imports the classrooms of a timetable, read with ``read_timetable``.
+
+    Every row is validated before anything is written. Courses, teachers,
+    rules and existing classrooms are looked up with a few queries for the
+    whole file, and unless ``check_conflicts`` is False rows are checked
+    against the schedules of their courses, and the rows before them, in one
+    expansion. Valid rows are then written with bulk inserts, IMPORT_CHUNK_SIZE
+    rows per transaction, calling ``progress(done, total)`` after each chunk.
+
+    ``course`` is used for the rows which don't name theirs, and naive times
+    are in ``tz``, the default time zone unless given.
+    """
+
+    def __init__(
+        self,
+        user=None,
+        course=None,
+        tz=None,
+        check_conflicts=True,
+        dry_run=False,
+        chunk_size=IMPORT_CHUNK_SIZE,
+        progress=None,
+    ):
+        try:
+            self.timezone = pytz.timezone(tz or settings.TIME_ZONE or "UTC")
+        except pytz.UnknownTimeZoneError:
+            raise TimetableImportError("Unknown time zone {!r}".format(tz))
+        self.user = user
+        self.course = course
+        self.check_conflicts = check_conflicts
+        self.dry_run = dry_run
+        self.chunk_size = chunk_size
+        self.progress = progress
+
+    def run(self, rows):
+        """
+        Imports ``rows`` and returns a report of the import.
+        """
+        rows = [ImportRow(number, fields) for number, fields in rows]
+        for row in rows:
+            self._clean(row)
+        self._resolve_courses([row for row in rows if not row.errors])
+        self._resolve_rules([row for row in rows if not row.errors])
+        if self.check_conflicts:
+            self._check_conflicts([row for row in rows if not row.errors])
+
+        valid = [row for row in rows if not row.errors]
+        created = 0
+        if not self.dry_run:
+            created = self._write(valid, len(rows))
+        return {
+            "total": len(rows),
+            "valid": len(valid),
+            "created": created,
+            "dry_run": self.dry_run,
+            "errors": [
+                {"row": row.number, "errors": row.errors} for row in rows if row.errors
+            ],
+        }
+
+    def _parse_datetime(self, value):
+        if not isinstance(value, datetime.datetime):
+            if isinstance(value, datetime.date):
+                raise ValueError("All day events aren't supported")
+            value = dateutil.parser.parse(value)
+        if timezone.is_naive(value):
+            value = self.timezone.localize(value)
+        return value
+
+    def _clean(self, row):
+        """
+        Parses the fields of a row into an unsaved classroom and event.
+        """
+        fields = row.fields
+        for name in fields.get("unsupported", ()):
+            row.errors.append("{} isn't supported".format(name))
+
+        try:
+            start = self._parse_datetime(fields.get("start", ""))
+            if fields.get("end"):
+                end = self._parse_datetime(fields["end"])
+            else:
+                duration = fields.get("duration", "")
+                if not isinstance(duration, datetime.timedelta):
+                    duration = datetime.timedelta(minutes=int(duration))
+                end = start + duration
+            if end <= start:
+                raise ValueError("The class must end after it starts")
+        except (ValueError, OverflowError) as error:
+            row.errors.append("Invalid start, end or duration: {}".format(error))
+            return
+
+        frequency = (fields.get("repeat") or "").upper()
+        until = None
+        if frequency:
+            try:
+                if frequency not in RULE_FREQUENCIES:
+                    raise ValueError("Unknown frequency {!r}".format(frequency))
+                params = clean_rule_params(fields.get("params") or "")
+                if fields.get("repeat_until"):
+                    until = self._parse_datetime(fields["repeat_until"])
+            except (ValueError, OverflowError) as error:
+                row.errors.append("Invalid repeat: {}".format(error))
+                return
+            row.rule_key = (frequency, params)
+
+        row.classroom = Classroom(
+            name=fields.get("name", ""),
+            description=fields.get("description", ""),
+            welcome_message=fields.get("welcome_message", ""),
+            logout_url=fields.get("logout_url") or settings.BBB_LOGOUT_URL,
+            # Assigned when the chunk is written
+            room_id=None,
+            created_by=self.user,
+        )
+        row.event = Event(
+            start=start,
+            end=end,
+            classroom=row.classroom,
+            end_recurring_period=until,
+            color=fields.get("color", ""),
+            created_by=self.user,
+        )
+        for instance, exclude in (
+            (row.classroom, ["course", "room_id", "created_by", "modified_by"]),
+            (row.event, ["classroom", "rule", "created_by", "modified_by"]),
+        ):
+            try:
+                instance.clean_fields(exclude=exclude)
+            except ValidationError as error:
+                for field, messages in error.message_dict.items():
+                    row.errors += ["{}: {}".format(field, m) for m in messages]
+
+    def _resolve_courses(self, rows):
+        """
+        Finds the course of every row, among the courses of its teacher if
+        the row names one.
+        """
+        references = {row.fields.get("course") for row in rows} - {"", None}
+        ids = {reference for reference in references if is_valid_uuid(reference)}
+        courses_by_reference = defaultdict(list)
+        for course in Course.objects.filter(
+            Q(pk__in=ids) | Q(name__in=references - ids)
+        ).select_related("teacher__user"):
+            courses_by_reference[str(course.pk)].append(course)
+            courses_by_reference[course.name].append(course)
+
+        emails = {row.fields.get("teacher") for row in rows} - {"", None}
+        teachers = dict(
+            User.objects.filter(email__in=emails).values_list("email", "pk")
+        )
+        course_teachers = defaultdict(set)
+        for course_id, teacher_id in Course.assistant_teachers.through.objects.filter(
+            course__in={c.pk for cs in courses_by_reference.values() for c in cs}
+        ).values_list("course_id", "teacher_id"):
+            course_teachers[course_id].add(teacher_id)
+
+        for row in rows:
+            reference = row.fields.get("course")
+            if reference:
+                courses = courses_by_reference[reference]
+            elif self.course is not None:
+                courses = [self.course]
+            else:
+                row.errors.append("No course given")
+                continue
+            if not courses:
+                row.errors.append("Unknown course {!r}".format(reference))
+                continue
+
+            email = row.fields.get("teacher")
+            if email:
+                if email not in teachers:
+                    row.errors.append("Unknown teacher {!r}".format(email))
+                    continue
+                courses = [
+                    course
+                    for course in courses
+                    if teachers[email] == course.teacher_id
+                    or teachers[email] in course_teachers[course.pk]
+                ]
+                if not courses:
+                    row.errors.append("{} doesn't teach the course".format(email))
+                    continue
+            if len(courses) > 1:
+                row.errors.append(
+                    "{} courses are named {!r}, give the course id or the "
+                    "teacher".format(len(courses), reference)
+                )
+                continue
+
+            row.course = courses[0]
+            if row.course.teacher.user.calendar_id is None:
+                row.errors.append("The teacher of the course has no calendar")
+                continue
+            row.classroom.course = row.course
+
+        # Classrooms are created, not updated, by imports
+        existing = set(
+            Classroom.objects.filter(
+                course__in={row.course.pk for row in rows if row.course},
+                name__in={row.classroom.name for row in rows if row.course},
+            ).values_list("course_id", "name")
+        )
+        for row in rows:
+            if row.errors:
+                continue
+            key = (row.course.pk, row.classroom.name)
+            if key in existing:
+                row.errors.append(
+                    "The course already has a class named {!r}".format(key[1])
+                )
+            existing.add(key)
+
+    def _resolve_rules(self, rows):
+        """
+        Gives every recurring row the rule with its frequency and params, an
+        unsaved one if there's none yet.
+        """
+        keys = {row.rule_key for row in rows if row.rule_key}
+        self.rules = {}
+        for rule in Rule.objects.filter(
+            frequency__in={frequency for frequency, _ in keys}
+        ).order_by("-pk"):
+            try:
+                key = (rule.frequency, clean_rule_params(rule.params))
+            except ValueError:
+                continue
+            self.rules[key] = rule
+        for frequency, params in keys - set(self.rules):
+            name = frequency.lower()
+            if params:
+                name = "{} {}".format(name, params)
+            self.rules[(frequency, params)] = Rule(
+                name=name[: Rule._meta.get_field("name").max_length],
+                frequency=frequency,
+                params=params,
+            )
+
+        for row in rows:
+            if row.rule_key:
+                row.event.rule = self.rules[row.rule_key]
+            bounds = row.event.get_effective_bounds()
+            if bounds[0] is None:
+                row.errors.append("The class never occurs")
+            row.event.effective_start_date, row.event.effective_end_date = bounds
+
+    def _check_conflicts(self, rows):
+        """
+        Reports the rows which overlap classes on the calendars of their
+        course, or the rows before them sharing one of those calendars.
+        """
+        if not rows:
+            return
+        calendar_ids = get_courses_calendar_ids({row.course for row in rows})
+        for row in rows:
+            row.candidates = get_candidate_occurrences(row.event)
+        candidates = [c for row in rows for c in row.candidates]
+        if not candidates:
+            return
+        occurrences = get_calendar_occurrences(
+            set().union(*calendar_ids.values()),
+            min(start for start, _, _ in candidates),
+            max(end for _, end, _ in candidates),
+        )
+
+        imported = defaultdict(list)
+        for row in rows:
+            scheduled = {}
+            for calendar_id in calendar_ids[row.course.pk]:
+                for occ in occurrences[calendar_id]:
+                    scheduled[id(occ)] = (occ.start, occ.end, occ.event.classroom.name)
+                for item in imported[calendar_id]:
+                    scheduled[id(item)] = item
+            overlaps = find_overlaps(row.candidates, list(scheduled.values()))
+            if overlaps:
+                for occ, name in overlaps[:MAX_REPORTED_CONFLICTS]:
+                    row.errors.append(
+                        "Overlaps {} on {}".format(name, isoformat(occ.start))
+                    )
+                if len(overlaps) > MAX_REPORTED_CONFLICTS:
+                    row.errors.append(
+                        "And {} more conflicts".format(
+                            len(overlaps) - MAX_REPORTED_CONFLICTS
+                        )
+                    )
+                continue
+
+            name = "{} (row {})".format(row.classroom.name, row.number)
+            items = [(start, end, name) for start, end, _ in row.candidates]
+            for calendar_id in calendar_ids[row.course.pk]:
+                imported[calendar_id] += items
+
+    def _save_rules(self, rows):
+        """
+        Creates the new rules of ``rows``, bulk inserts don't set primary keys
+        on MySQL so they are read back.
+        """
+        new_rules = {
+            row.rule_key: row.event.rule
+            for row in rows
+            if row.rule_key and row.event.rule.pk is None
+        }
+        if not new_rules:
+            return
+        with transaction.atomic():
+            Rule.objects.bulk_create(new_rules.values())
+            saved = Rule.objects.filter(
+                frequency__in={frequency for frequency, _ in new_rules},
+                params__in={params for _, params in new_rules},
+            ).order_by("-pk")
+            for rule in saved:
+                if (rule.frequency, rule.params) in new_rules:
+                    self.rules[(rule.frequency, rule.params)] = rule
+        for row in rows:
+            if row.rule_key:
+                row.event.rule = self.rules[row.rule_key]
+
+    def _write(self, rows, total):
+        """
+        Writes ``rows`` a chunk per transaction, returns the number of classes
+        created. The rows of a failed chunk are reported.
+        """
+        self._save_rules(rows)
+        created = 0
+        done = total - len(rows)
+        for index in range(0, len(rows), self.chunk_size):
+            chunk = rows[index : index + self.chunk_size]
+            try:
+                self._write_chunk(chunk)
+            except DatabaseError as error:
+                for row in chunk:
+                    row.errors.append("Not imported: {}".format(error))
+            else:
+                created += len(chunk)
+                self._refresh(chunk)
+            done += len(chunk)
+            if self.progress is not None:
+                self.progress(done, total)
+        return created
+
+    def _write_chunk(self, rows):
+        with transaction.atomic():
+            # Room ids increase with the creation date, so the default of the
+            # next classroom created one by one follows them
+            room_id = Classroom.objects.aggregate(Max("room_id"))["room_id__max"]
+            if room_id is None:
+                room_id = random.randrange(100000, 1000000000)
+            for offset, row in enumerate(rows, 1):
+                row.classroom.room_id = room_id + offset
+            Classroom.objects.bulk_create([row.classroom for row in rows])
+            Event.objects.bulk_create([row.event for row in rows])
+
+            event_ids = dict(
+                Event.objects.filter(
+                    classroom__in=[row.classroom.pk for row in rows]
+                ).values_list("classroom_id", "pk")
+            )
+            for row in rows:
+                row.event.pk = event_ids[row.classroom.pk]
+            # Scheduled on the teacher's calendar like create_classroom_view does
+            Event.calendars.through.objects.bulk_create(
+                [
+                    Event.calendars.through(
+                        event_id=row.event.pk,
+                        calendar_id=row.course.teacher.user.calendar_id,
+                    )
+                    for row in rows
+                ]
+            )
+
+    def _refresh(self, rows):
+        """
+        Does what the signals skipped by the bulk inserts would have done.
+        """
+        bump_course_versions({row.course.pk for row in rows})
+        if settings.OCCURRENCE_INDEX_ENABLED:
+            for row in rows:
+                OccurrenceIndex.objects.rebuild_for_event(row.event)
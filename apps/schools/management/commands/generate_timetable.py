@@ -0,0 +1,117 @@
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from apps.accounts.models import User
+from ...imports import TimetableImportError
+from ...models import Course
+from ...timetabling import (
+    TIMETABLE_DAYS,
+    TIMETABLE_PERIOD_MINUTES,
+    TIMETABLE_PERIODS,
+    TimetableGenerator,
+)
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def parse_time(value):
+    return datetime.datetime.strptime(value, "%H:%M").time()
+
+
+class Command(BaseCommand):
+    help = "Generates weekly classes for the courses from their weekly hours"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--start", type=parse_date, required=True, help="First day, YYYY-MM-DD"
+        )
+        parser.add_argument(
+            "--until", type=parse_date, help="Last day, YYYY-MM-DD, none by default"
+        )
+        parser.add_argument(
+            "--course",
+            action="append",
+            dest="courses",
+            help="Id of a course to schedule, all with weekly hours by default",
+        )
+        parser.add_argument(
+            "--level",
+            action="append",
+            dest="levels",
+            type=int,
+            help="Id of a level whose courses to schedule",
+        )
+        parser.add_argument("--user", help="Email of the user creating the classes")
+        parser.add_argument("--timezone", help="Time zone of the timetable")
+        parser.add_argument(
+            "--days", type=int, default=TIMETABLE_DAYS, help="School days a week"
+        )
+        parser.add_argument(
+            "--periods", type=int, default=TIMETABLE_PERIODS, help="Periods a day"
+        )
+        parser.add_argument(
+            "--day-start",
+            type=parse_time,
+            default="08:00",
+            help="Start of the first period, HH:MM",
+        )
+        parser.add_argument(
+            "--period-minutes",
+            type=int,
+            default=TIMETABLE_PERIOD_MINUTES,
+            help="Length of a period",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the timetable without creating the classes",
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            user = User.objects.filter(email=options["user"]).first()
+            if user is None:
+                raise CommandError("Unknown user {}".format(options["user"]))
+        courses = Course.objects.filter(weekly_hours__gt=0)
+        if options["courses"]:
+            courses = courses.filter(pk__in=options["courses"])
+        if options["levels"]:
+            courses = courses.filter(levels__in=options["levels"]).distinct()
+
+        try:
+            generator = TimetableGenerator(
+                courses,
+                options["start"],
+                until=options["until"],
+                tz=options["timezone"],
+                days=options["days"],
+                periods=options["periods"],
+                day_start=options["day_start"],
+                period_minutes=options["period_minutes"],
+                user=user,
+                dry_run=options["dry_run"],
+            )
+            report = generator.run()
+        except TimetableImportError as error:
+            raise CommandError(error)
+
+        if options["dry_run"]:
+            for row in report["timetable"]:
+                self.stdout.write("{} {}".format(row["start"], row["name"]))
+        for session in report["unplaced"]:
+            self.stderr.write("No period left for {}".format(session["name"]))
+        for row in report["errors"]:
+            for error in row["errors"]:
+                self.stderr.write("Row {}: {}".format(row["row"], error))
+        self.stdout.write(
+            self.style.SUCCESS(
+                "{} of {} classes valid, {} created{}".format(
+                    report["valid"],
+                    report["total"] + len(report["unplaced"]),
+                    report["created"],
+                    " (dry run)" if report["dry_run"] else "",
+                )
+            )
+        )
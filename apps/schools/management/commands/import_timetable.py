@@ -0,0 +1,97 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from apps.accounts.models import User
+from ...imports import (
+    TimetableImport,
+    TimetableImportError,
+    get_file_format,
+    read_timetable,
+    store_timetable,
+)
+from ...models import Course
+from ...tasks import import_timetable
+
+
+class Command(BaseCommand):
+    help = "Imports the classrooms of a CSV or iCalendar timetable"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path of the timetable file")
+        parser.add_argument(
+            "--format", dest="file_format", help="csv or ics, read off the extension"
+        )
+        parser.add_argument("--course", help="Id of the course of rows naming none")
+        parser.add_argument("--user", help="Email of the user creating the classes")
+        parser.add_argument("--timezone", help="Time zone of times without offsets")
+        parser.add_argument(
+            "--no-conflict-check",
+            action="store_false",
+            dest="check_conflicts",
+            help="Import classes overlapping scheduled ones",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Validate without importing"
+        )
+        parser.add_argument(
+            "--async",
+            action="store_true",
+            dest="run_async",
+            help="Queue the import as a task instead of running it",
+        )
+
+    def handle(self, *args, **options):
+        user = course = None
+        if options["user"]:
+            user = User.objects.filter(email=options["user"]).first()
+            if user is None:
+                raise CommandError("Unknown user {}".format(options["user"]))
+        if options["course"]:
+            course = Course.objects.filter(pk=options["course"]).first()
+            if course is None:
+                raise CommandError("Unknown course {}".format(options["course"]))
+
+        try:
+            file_format = get_file_format(options["path"], options["file_format"])
+            with open(options["path"], "rb") as timetable:
+                if options["run_async"]:
+                    task = import_timetable.delay(
+                        store_timetable(File(timetable), file_format),
+                        file_format,
+                        str(user.id) if user else None,
+                        options["course"],
+                        options["timezone"],
+                        options["check_conflicts"],
+                        options["dry_run"],
+                    )
+                    self.stdout.write("Queued import task {}".format(task.id))
+                    return
+                data = timetable.read()
+
+            timetable_import = TimetableImport(
+                user=user,
+                course=course,
+                tz=options["timezone"],
+                check_conflicts=options["check_conflicts"],
+                dry_run=options["dry_run"],
+                progress=self.progress,
+            )
+            report = timetable_import.run(read_timetable(data, file_format))
+        except (OSError, TimetableImportError) as error:
+            raise CommandError(error)
+
+        for row in report["errors"]:
+            for error in row["errors"]:
+                self.stderr.write("Row {}: {}".format(row["row"], error))
+        self.stdout.write(
+            self.style.SUCCESS(
+                "{} of {} rows valid, {} classes created{}".format(
+                    report["valid"],
+                    report["total"],
+                    report["created"],
+                    " (dry run)" if report["dry_run"] else "",
+                )
+            )
+        )
+
+    def progress(self, done, total):
+        self.stdout.write("Imported {} of {} rows".format(done, total))
@@ -0,0 +1,28 @@
+# Generated by Django 3.0.8 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schools', '0006_teacher_position'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blackout',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=256, verbose_name='name')),
+                ('start', models.DateTimeField(verbose_name='start')),
+                ('end', models.DateTimeField(verbose_name='end')),
+                ('level', models.ForeignKey(blank=True, help_text='Leave empty for a blackout of the whole school.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='blackouts', to='schools.Level')),
+                ('school', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='blackouts', to='schools.School')),
+            ],
+            options={
+                'ordering': ['start'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.8 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schools', '0007_blackout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='weekly_hours',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Hours of classes a week, used to generate timetables.', verbose_name='weekly hours'),
+        ),
+    ]
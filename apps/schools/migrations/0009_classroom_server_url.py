@@ -0,0 +1,18 @@
+# Generated by Django 3.0.8 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schools', '0008_course_weekly_hours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classroom',
+            name='server_url',
+            field=models.URLField(blank=True, editable=False, help_text='The BigBlueButton server the meeting was placed on.', verbose_name='server URL'),
+        ),
+    ]
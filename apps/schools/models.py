@@ -3,12 +3,20 @@ import uuid
 import string
 import random
 import logging
-from django.db import models
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.db import models, transaction
 from django.conf import settings
-from django.db.models import Avg
+from django.db.models import Avg, Q
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 from django.utils.translation import ugettext_lazy as _
 from django.template.loader import get_template
 from sorl.thumbnail import ImageField
@@ -16,14 +24,20 @@ from ckeditor.fields import RichTextField
 from phonenumber_field.modelfields import PhoneNumberField
 from apps.core.models import BaseModel
 from apps.core.tasks import send_email
-from apps.core.bbb import (
-    create_meeting,
-    join_meeting_url,
-    is_meeting_running,
-    get_meeting_info,
-    end_meeting,
+from apps.core.versions import bump_versions
+from apps.core.bbb import get_async_client, get_client
+from apps.core.meetings import (
+    MeetingStates,
+    async_place_meeting,
+    get_server,
+    make_end_token,
+    place_meeting,
 )
 from apps.accounts.models import User
+from apps.timetable.conflicts import get_calendar_events, get_scheduled_occurrences
+from apps.timetable.models import Event
+from apps.timetable.models.events import bump_event_versions, touch_events
+from apps.timetable.tasks import rebuild_events_index
 from .utils import get_random_password
 
 logger = logging.getLogger(__name__)
@@ -90,6 +104,49 @@ class Level(models.Model):
         return "{}".format(self.name)
 
 
+class Blackout(models.Model):
+    """
+    A holiday or term break of the school, or of one of its levels. No class
+    of the courses it applies to is held from its start to its end: the
+    occurrences starting within it are left out when events are expanded.
+    """
+
+    school = models.ForeignKey(
+        School,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name="blackouts",
+    )
+    level = models.ForeignKey(
+        Level,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name="blackouts",
+        help_text=_("Leave empty for a blackout of the whole school."),
+    )
+    name = models.CharField(_("name"), max_length=256)
+    start = models.DateTimeField(_("start"))
+    end = models.DateTimeField(_("end"))
+
+    class Meta:
+        ordering = ["start"]
+
+    def __str__(self):
+        return "{}: {} - {}".format(self.name, self.start, self.end)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._saved_level_id = self.level_id
+        self._saved_start = self.start
+        self._saved_end = self.end
+
+    def clean(self):
+        if self.start and self.end and self.end <= self.start:
+            raise ValidationError(_("A blackout must end after it starts"))
+
+
 class Student(models.Model):
     user = models.OneToOneField(
         User, on_delete=models.CASCADE, primary_key=True, related_name="student"
@@ -173,9 +230,17 @@ class Teacher(models.Model):
         raise NotImplementedError
 
     def availability(self, datetime):
-        return not self.classrooms.filter(
-            start_class_at__gte=datetime, finish_class_at__lte=datetime
-        ).exists()
+        """
+        Returns True if no class on the teacher's calendar runs at ``datetime``
+        """
+        if self.user.calendar_id is None:
+            return True
+        occurrences = get_scheduled_occurrences(
+            get_calendar_events([self.user.calendar_id]),
+            datetime,
+            datetime + timedelta(seconds=1),
+        )
+        return not any(occ.start <= datetime < occ.end for occ in occurrences)
 
     def send_verified_email(self):
         subject = "Verification for {}".format(settings.SITE_NAME)
@@ -230,6 +295,11 @@ class Course(BaseModel):
     )
     students = models.ManyToManyField(Student, verbose_name=_("students"), blank=True)
     levels = models.ManyToManyField(Level, verbose_name=_("levels"), blank=True)
+    weekly_hours = models.PositiveSmallIntegerField(
+        _("weekly hours"),
+        default=0,
+        help_text=_("Hours of classes a week, used to generate timetables."),
+    )
     classroom_join_mode = models.CharField(
         _("classroom join mode"),
         max_length=32,
@@ -342,6 +412,12 @@ class Classroom(BaseModel):
     attendee_password = models.CharField(
         _("attendee password"), max_length=120, default=get_random_password
     )
+    server_url = models.URLField(
+        _("server URL"),
+        help_text=_("The BigBlueButton server the meeting was placed on."),
+        blank=True,
+        editable=False,
+    )
 
     def __str__(self):
         return "{}".format(self.name)
@@ -369,11 +445,34 @@ class Classroom(BaseModel):
             "end_recurring_period": self.event.end_recurring_period,
         }
 
-    def create_meeting_room(self, duration=0):
-        callback_url = "{}/{}/rooms/{}/end/".format(
-            settings.SITE_URL, settings.API_VERSION, self.room_id
+    @property
+    def server(self):
+        return get_server(self.server_url)
+
+    @property
+    def bbb(self):
+        return get_client(self.server.url, self.server.secret)
+
+    @property
+    def async_bbb(self):
+        return get_async_client(self.server.url, self.server.secret)
+
+    @property
+    def meeting_states(self):
+        return MeetingStates(self.server.url, self.server.secret)
+
+    def set_server(self, server):
+        if server.url != self.server_url:
+            self.server_url = server.url
+            Classroom.objects.filter(pk=self.pk).update(server_url=server.url)
+
+    def get_meeting_params(self, duration=0):
+        # Called back by the server once the meeting ended, see
+        # meeting_ended_callback
+        callback_url = "{}/{}/rooms/ended/{}/".format(
+            settings.SITE_URL, settings.API_VERSION, make_end_token(self.room_id)
         )
-        response = create_meeting(
+        return (
             self.name,
             self.room_id,
             self.moderator_password,
@@ -381,23 +480,61 @@ class Classroom(BaseModel):
             self.welcome_message,
             self.logout_url,
             callback_url,
-            settings.BBB_URL,
-            settings.BBB_SECRET,
             # Duration of the meeting in minutes.
             # Default is 0 (meeting doesn't end).
             duration,
         )
 
+    def create_meeting_room(self, duration=0):
+        # A meeting is placed when created, and stays on its server until it
+        # ended
+        if not self.meeting_states.is_created(self.room_id):
+            self.set_server(place_meeting(self.room_id))
+        response = self.bbb.create_meeting(*self.get_meeting_params(duration))
+
+        if response.get("returncode") == "SUCCESS":
+            self.meeting_states.created(self.room_id)
+            return True
+
+        return False
+
+    async def async_create_meeting_room(self, duration=0, save=True):
+        """
+        Like create_meeting_room. With ``save`` False, the server the meeting
+        is placed on is only set on the instance, for the caller to save.
+        """
+        if not await self.meeting_states.async_is_created(self.room_id):
+            server = await async_place_meeting(self.room_id)
+            if save:
+                await sync_to_async(self.set_server, thread_sensitive=True)(server)
+            else:
+                self.server_url = server.url
+        response = await self.async_bbb.create_meeting(
+            *self.get_meeting_params(duration)
+        )
+
         if response.get("returncode") == "SUCCESS":
+            await self.meeting_states.async_created(self.room_id)
             return True
 
         return False
 
     def create_join_link(self, user, moderator=False):
-        # create meeting room is idempotent.
-        # Always a good idea to call each time to ensure meeting exists.
-        self.create_meeting_room()
+        # create meeting room is idempotent, but a round trip to the server.
+        # Only call it when the meeting wasn't created lately, not for every
+        # student joining the class at once.
+        if not self.meeting_states.is_created(self.room_id):
+            self.create_meeting_room()
+        return self.get_join_url(user, moderator)
+
+    async def async_create_join_link(self, user, moderator=False):
+        if not await self.meeting_states.async_is_created(self.room_id):
+            await self.async_create_meeting_room()
+        return await sync_to_async(self.get_join_url, thread_sensitive=True)(
+            user, moderator
+        )
 
+    def get_join_url(self, user, moderator=False):
         is_teacher = user == self.course.teacher.user
         if is_teacher:
             moderator = True
@@ -405,41 +542,39 @@ class Classroom(BaseModel):
         is_student = Course.objects.filter(id=self.course.id, students__user__in=[user])
 
         if is_teacher or is_student:
-            url = join_meeting_url(
-                self.room_id,
-                str(user),
-                str(user.id),
-                self.moderator_password if moderator else self.attendee_password,
-                settings.BBB_URL,
-                settings.BBB_SECRET,
-            )
-            return url
+            return self.make_join_url(user, moderator)
 
         return None
 
-    def is_meeting_running(self):
-        response = is_meeting_running(
-            self.room_id, settings.BBB_URL, settings.BBB_SECRET
+    def make_join_url(self, user, moderator=False):
+        return self.bbb.join_meeting_url(
+            self.room_id,
+            str(user),
+            str(user.id),
+            self.moderator_password if moderator else self.attendee_password,
         )
-        if response.get("returncode") == "SUCCESS":
-            return response.get("running") == "true"
 
-        return False
+    def is_meeting_running(self):
+        return self.meeting_states.is_running(self.room_id)
+
+    async def async_is_meeting_running(self):
+        return await self.meeting_states.async_is_running(self.room_id)
 
     def get_meeting_info(self):
-        response = get_meeting_info(
-            self.room_id, self.moderator_password, settings.BBB_URL, settings.BBB_SECRET
-        )
+        response = self.bbb.get_meeting_info(self.room_id, self.moderator_password)
         return response
 
     def end_meeting(self, close_session=True):
-        response = end_meeting(
-            self.room_id, self.moderator_password, settings.BBB_URL, settings.BBB_SECRET
-        )
-        if response.get("returncode") == "SUCCESS":
-            return True
+        response = self.bbb.end_meeting(self.room_id, self.moderator_password)
+        self.meeting_states.ended(self.room_id)
+        return response.get("returncode") == "SUCCESS"
 
-        return False
+    async def async_end_meeting(self, close_session=True):
+        response = await self.async_bbb.end_meeting(
+            self.room_id, self.moderator_password
+        )
+        await self.meeting_states.async_ended(self.room_id)
+        return response.get("returncode") == "SUCCESS"
 
 
 class StudentAttendance(models.Model):
@@ -574,3 +709,137 @@ def post_save_request(sender, instance, created, **kwargs):
     if created:
         instance.teacher = instance.course.teacher
         instance.save()
+
+
+def bump_course_versions(course_ids, user_ids=(), calendars=True):
+    """
+    Invalidates the cached responses showing the courses: the course listings,
+    and unless ``calendars`` is False the occurrences of the calendars their
+    classrooms are scheduled in. ``user_ids`` are the users who joined or left
+    the courses.
+    """
+    bump_versions("course", course_ids)
+    bump_versions("courses", ["all"])
+    bump_versions("user-courses", user_ids)
+    if calendars:
+        bump_versions(
+            "calendar",
+            set(
+                Event.calendars.through.objects.filter(
+                    event__classroom__course_id__in=course_ids
+                ).values_list("calendar_id", flat=True)
+            ),
+        )
+
+
+@receiver(post_save, sender=Course)
+def post_save_course(sender, instance, raw=False, **kwargs):
+    bump_course_versions([instance.pk], [instance.teacher_id])
+    # The occurrences of the course's classes show its details
+    touch_events(
+        list(
+            Event.objects.filter(classroom__course=instance).values_list(
+                "pk", flat=True
+            )
+        )
+    )
+
+
+@receiver(pre_delete, sender=Course)
+def pre_delete_course(sender, instance, **kwargs):
+    user_ids = [instance.teacher_id]
+    user_ids += instance.assistant_teachers.values_list("pk", flat=True)
+    user_ids += instance.students.values_list("pk", flat=True)
+    bump_course_versions([instance.pk], user_ids)
+
+
+# The field of the other side of the course many to many relations
+COURSE_RELATION_FIELDS = {
+    Course.students.through: "student",
+    Course.assistant_teachers.through: "teacher",
+    Course.levels.through: "level",
+}
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+@receiver(m2m_changed, sender=Course.assistant_teachers.through)
+@receiver(m2m_changed, sender=Course.levels.through)
+def course_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    field = COURSE_RELATION_FIELDS[sender]
+    if pk_set is None:
+        lookup, other = (field, "course") if reverse else ("course", field)
+        pk_set = set(
+            sender.objects.filter(**{lookup + "_id": instance.pk}).values_list(
+                other + "_id", flat=True
+            )
+        )
+    if reverse:
+        course_ids, related_ids = pk_set, [instance.pk]
+    else:
+        course_ids, related_ids = [instance.pk], pk_set
+    # Students and teachers have their user's primary key
+    user_ids = related_ids if field != "level" else ()
+    bump_course_versions(course_ids, user_ids, calendars=field == "student")
+    if field == "level" and Blackout.objects.filter(level__isnull=False).exists():
+        # The course's classes now follow the blackouts of other levels
+        refresh_blackout_events(Event.objects.filter(classroom__course__in=course_ids))
+
+
+def refresh_blackout_events(events):
+    """
+    Invalidates what was expanded from ``events`` with their former
+    blackouts: cached responses, sync tokens and the occurrence index.
+    """
+    event_ids = list(events.values_list("pk", flat=True).distinct())
+    bump_event_versions(event_ids)
+    touch_events(event_ids)
+    if settings.OCCURRENCE_INDEX_ENABLED and event_ids:
+        transaction.on_commit(lambda: rebuild_events_index.delay(event_ids))
+
+
+@receiver(post_save, sender=Blackout)
+@receiver(post_delete, sender=Blackout)
+def blackout_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump_versions("blackouts", ["all"])
+    # A blackout moved to another level or timespan no longer applies to the
+    # former one
+    level_ids = {instance.level_id, instance._saved_level_id}
+    spans = {
+        (instance.start, instance.end),
+        (instance._saved_start, instance._saved_end),
+    }
+    instance._saved_level_id = instance.level_id
+    instance._saved_start, instance._saved_end = instance.start, instance.end
+    overlapping = Q()
+    for start, end in spans:
+        overlapping |= Q(effective_start_date__lt=end) & (
+            Q(effective_end_date__gt=start) | Q(effective_end_date__isnull=True)
+        )
+    events = Event.objects.filter(overlapping)
+    if None not in level_ids:
+        events = events.filter(classroom__course__levels__in=level_ids)
+    refresh_blackout_events(events)
+
+
+@receiver(post_save, sender=Classroom)
+@receiver(post_delete, sender=Classroom)
+def classroom_changed(sender, instance, raw=False, **kwargs):
+    bump_course_versions([instance.course_id])
+    # Deleting a classroom deletes its event, which leaves a tombstone instead
+    if kwargs["signal"] is post_save:
+        touch_events(
+            list(Event.objects.filter(classroom=instance).values_list("pk", flat=True))
+        )
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def course_content_changed(sender, instance, raw=False, **kwargs):
+    bump_course_versions([instance.course_id], calendars=False)
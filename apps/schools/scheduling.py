@@ -0,0 +1,165 @@
+import asyncio
+import datetime
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils import timezone
+from apps.core.bbb import close_async_clients
+from apps.timetable.conflicts import get_scheduled_occurrences
+from apps.timetable.models import Event
+from .models import Classroom, Course
+
+PREWARM_KEY = "bbb:prewarm:{}:{}"
+
+MEETING_STARTING_TXT = get_template("emails/meeting_starting.txt")
+MEETING_STARTING_HTML = get_template("emails/meeting_starting.html")
+
+
+class MeetingScheduler:
+    """
+    Creates the meetings of the classes starting within the next
+    ``BBB_PREWARM_MINUTES``, so the first to join doesn't wait for it, and
+    emails their join links to the teacher and students of the course.
+
+    Each classroom is given its turn within the first
+    ``BBB_PREWARM_SPREAD_MINUTES`` of that window, so the meetings of classes
+    starting at the same time aren't all created at once. Meetings are created
+    ``BBB_PREWARM_CONCURRENCY`` at a time and the emails sent in batches of
+    ``BBB_NOTIFICATION_BATCH_SIZE`` by ``send_batch``.
+
+    Meant to be run every minute, an occurrence is only handled by one run.
+    """
+
+    def __init__(self, send_batch, now=None):
+        self.send_batch = send_batch
+        self.now = now or timezone.now()
+        self.lead = datetime.timedelta(minutes=settings.BBB_PREWARM_MINUTES)
+        self.spread = settings.BBB_PREWARM_SPREAD_MINUTES * 60
+
+    def get_due_occurrences(self):
+        """
+        Returns the occurrences whose meeting is to be created now, their
+        classrooms loaded.
+        """
+        events = Event.objects.select_related(
+            "rule", "classroom__course__teacher__user"
+        )
+        due = []
+        for occ in get_scheduled_occurrences(events, self.now, self.now + self.lead):
+            if occ.start < self.now:
+                continue
+            offset = occ.event.classroom.room_id % self.spread if self.spread else 0
+            if occ.start - self.lead + datetime.timedelta(seconds=offset) <= self.now:
+                due.append(occ)
+        return due
+
+    def claim(self, occurrence):
+        """
+        Returns whether ``occurrence`` wasn't claimed by an earlier run yet.
+        """
+        key = self.get_key(occurrence)
+        return cache.add(key, True, int(self.lead.total_seconds()) * 2)
+
+    def get_key(self, occurrence):
+        return PREWARM_KEY.format(
+            occurrence.event_id, int(occurrence.original_start.timestamp())
+        )
+
+    async def create_meetings(self, classrooms):
+        semaphore = asyncio.Semaphore(settings.BBB_PREWARM_CONCURRENCY)
+
+        async def create(classroom):
+            async with semaphore:
+                return await classroom.async_create_meeting_room(save=False)
+
+        try:
+            return await asyncio.gather(*(create(c) for c in classrooms))
+        finally:
+            await close_async_clients()
+
+    def get_recipients(self, classrooms):
+        """
+        Returns the ``(user, moderator)`` pairs of each classroom's course,
+        keyed by course id, with one query for all of them.
+        """
+        recipients = defaultdict(list)
+        for classroom in classrooms:
+            teacher = classroom.course.teacher
+            recipients[classroom.course_id] = [(teacher.user, True)]
+        for row in Course.students.through.objects.filter(
+            course_id__in=list(recipients)
+        ).select_related("student__user"):
+            recipients[row.course_id].append((row.student.user, False))
+        return recipients
+
+    def get_messages(self, occurrence, recipients):
+        classroom = occurrence.event.classroom
+        messages = []
+        for user, moderator in recipients:
+            if not user.email:
+                continue
+            data = {
+                "first_name": user.first_name,
+                "classroom": classroom.name,
+                "course": classroom.course.name,
+                "start": timezone.localtime(occurrence.start),
+                "join_url": classroom.make_join_url(user, moderator),
+                "site_name": settings.SITE_NAME,
+            }
+            messages.append(
+                {
+                    "subject": "{} starts at {:%H:%M}".format(
+                        classroom.name, data["start"]
+                    ),
+                    "text_content": MEETING_STARTING_TXT.render(data),
+                    "html_content": MEETING_STARTING_HTML.render(data),
+                    "to_email": user.email,
+                }
+            )
+        return messages
+
+    def run(self):
+        """
+        Creates the meetings due and sends their emails, returns the numbers
+        of meetings created and failed, and of emails sent.
+        """
+        occurrences = {}
+        for occ in sorted(self.get_due_occurrences(), key=lambda occ: occ.start):
+            # A classroom has a single event, and so a single meeting
+            occurrences.setdefault(occ.event.classroom_id, occ)
+        occurrences = [occ for occ in occurrences.values() if self.claim(occ)]
+        if not occurrences:
+            return {"created": 0, "failed": 0, "notified": 0}
+
+        classrooms = [occ.event.classroom for occ in occurrences]
+        servers = [classroom.server_url for classroom in classrooms]
+        results = asyncio.run(self.create_meetings(classrooms))
+        # Only the calls to the servers are made from the event loop, the
+        # servers the meetings were placed on are saved from here
+        Classroom.objects.bulk_update(
+            [
+                classroom
+                for classroom, server_url in zip(classrooms, servers)
+                if classroom.server_url != server_url
+            ],
+            ["server_url"],
+        )
+        created = [occ for occ, success in zip(occurrences, results) if success]
+        failed = [occ for occ, success in zip(occurrences, results) if not success]
+        # The meetings which couldn't be created are tried again next run
+        cache.delete_many([self.get_key(occ) for occ in failed])
+
+        recipients = self.get_recipients([occ.event.classroom for occ in created])
+        messages = []
+        for occ in created:
+            course_id = occ.event.classroom.course_id
+            messages += self.get_messages(occ, recipients[course_id])
+        size = settings.BBB_NOTIFICATION_BATCH_SIZE
+        for index in range(0, len(messages), size):
+            self.send_batch(messages[index : index + size])
+        return {
+            "created": len(created),
+            "failed": len(failed),
+            "notified": len(messages),
+        }
@@ -1,12 +1,89 @@
 from celery import shared_task
+from celery.utils.log import get_task_logger
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMultiAlternatives, get_connection
+from apps.accounts.models import User
+from .imports import TimetableImport, read_timetable
+from .models import Course
+from .scheduling import MeetingScheduler
+
+logger = get_task_logger(__name__)
 
 
 @shared_task
 def schedule_meetings():
-    print("Schedule meetings")
-    # Cancel requests past classroom schedule datetime
-    # 10min before class. Go through all approved requests and create meeting
-    # Thereafter, create join link and email to all users (teacher and students)
-    # Send email to rejected requests and create meeting
+    """
+    Creates the meetings of the classes about to start and emails their join
+    links, see MeetingScheduler. Run every minute by celery beat.
+    """
+    report = MeetingScheduler(send_meeting_emails.delay).run()
+    logger.info(
+        "Created %s meetings, %s failed, sent %s emails",
+        report["created"],
+        report["failed"],
+        report["notified"],
+    )
+    return report
+
+
+@shared_task
+def send_meeting_emails(messages):
+    """
+    Sends a batch of emails over a single connection, ``messages`` holding
+    the ``subject``, ``text_content``, ``html_content`` and ``to_email`` of
+    each.
+    """
+    with get_connection() as connection:
+        emails = []
+        for message in messages:
+            email = EmailMultiAlternatives(
+                message["subject"],
+                message["text_content"],
+                settings.DEFAULT_FROM_EMAIL,
+                [message["to_email"]],
+                connection=connection,
+            )
+            email.attach_alternative(message["html_content"], "text/html")
+            emails.append(email)
+        connection.send_messages(emails)
+
+
+@shared_task(bind=True)
+def import_timetable(
+    self,
+    path,
+    file_format,
+    user_id=None,
+    course_id=None,
+    tz=None,
+    check_conflicts=True,
+    dry_run=False,
+):
+    """
+    Imports the timetable stored at ``path`` in the default storage, see
+    TimetableImport, and deletes the file. The progress is kept in the task
+    state, the result is the import report.
+    """
+
+    def progress(done, total):
+        self.update_state(state="PROGRESS", meta={"done": done, "total": total})
+
+    try:
+        with default_storage.open(path, "rb") as timetable:
+            data = timetable.read()
+        timetable_import = TimetableImport(
+            user=User.objects.filter(pk=user_id).first() if user_id else None,
+            course=Course.objects.filter(pk=course_id).first() if course_id else None,
+            tz=tz,
+            check_conflicts=check_conflicts,
+            dry_run=dry_run,
+            progress=progress,
+        )
+        report = timetable_import.run(read_timetable(data, file_format))
+    finally:
+        default_storage.delete(path)
+    logger.info(
+        "Imported %s of %s classes from %s", report["created"], report["total"], path
+    )
+    return report
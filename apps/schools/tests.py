@@ -1,3 +1,626 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import time
+from urllib.parse import urlparse
+from unittest import mock, skipUnless
+import pytz
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.accounts.models import User
+from apps.core.bbb import close_async_clients
+from apps.core.testing import FakeBBBServer
+from apps.timetable.models import Event, Rule
+from .api.asgi import AsyncRoomsApplication
+from .imports import TimetableImport, TimetableImportError, read_timetable
+from .models import Classroom, Course, Level
+from .scheduling import MeetingScheduler
+from .timetabling import Session, TimetableGenerator, TimetableSolver
 
-# Create your tests here.
+BENCHMARKS = os.getenv("TIMETABLE_BENCHMARKS") == "True"
+
+CSV_TIMETABLE = """course,teacher,name,logout_url,start,duration,repeat,params,repeat_until
+Mathematics,teacher@darasa.test,Algebra,http://darasa.test/,2021-01-04 08:00,60,weekly,,2021-06-30
+Mathematics,,Geometry,,2021-01-05 08:00,60,WEEKLY,byweekday:tu;interval:2,
+Mathematics,,Calculus,,2021-01-04 08:30,60,,,
+Mathematics,,Statistics,,not a date,60,,,
+Physics,,Optics,,2021-01-04 10:00,60,,,
+"""
+
+ICS_TIMETABLE = """BEGIN:VCALENDAR
+VERSION:2.0
+BEGIN:VEVENT
+SUMMARY:Algebra
+CATEGORIES:Mathematics
+DTSTART;TZID=Africa/Nairobi:20210104T080000
+DURATION:PT1H
+RRULE:FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20210630T000000Z
+END:VEVENT
+BEGIN:VEVENT
+SUMMARY:Geometry
+CATEGORIES:Mathematics
+DTSTART:20210104T120000Z
+DTEND:20210104T130000Z
+RRULE:FREQ=MONTHLY;BYDAY=1MO
+END:VEVENT
+END:VCALENDAR
+"""
+
+
+# Classrooms without a logout URL of their own take this one
+@override_settings(BBB_LOGOUT_URL="http://localhost/")
+class TimetableImportTest(TestCase):
+    def setUp(self):
+        # Creating users queues verification emails, no need for a broker here
+        patcher = mock.patch("apps.accounts.models.send_email")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.teacher_user = User.objects.create_user(
+            "teacher@darasa.test", "password", first_name="Jane", role=User.TEACHER
+        )
+        self.course = Course.objects.create(
+            name="Mathematics", teacher=self.teacher_user.teacher
+        )
+
+    def run_import(self, data, file_format="csv", **kwargs):
+        timetable_import = TimetableImport(
+            user=self.teacher_user, tz="Africa/Nairobi", **kwargs
+        )
+        return timetable_import.run(read_timetable(data.encode(), file_format))
+
+    def test_csv_rows_are_imported(self):
+        progress = mock.Mock()
+        report = self.run_import(CSV_TIMETABLE, progress=progress)
+
+        self.assertEqual(report["total"], 5)
+        self.assertEqual(report["created"], 2)
+        errors = {row["row"]: row["errors"] for row in report["errors"]}
+        self.assertEqual(sorted(errors), [4, 5, 6])
+        # Calculus overlaps Algebra, imported by the first row
+        self.assertIn("Overlaps Algebra (row 2)", errors[4][0])
+        self.assertIn("Invalid start", errors[5][0])
+        self.assertIn("Unknown course", errors[6][0])
+        progress.assert_called_with(5, 5)
+
+        algebra = Event.objects.get(classroom__name="Algebra")
+        self.assertEqual(algebra.classroom.course, self.course)
+        self.assertEqual(algebra.created_by, self.teacher_user)
+        self.assertEqual(
+            algebra.start, datetime.datetime(2021, 1, 4, 5, 0, tzinfo=pytz.utc)
+        )
+        self.assertEqual(algebra.rule.frequency, "WEEKLY")
+        self.assertIsNotNone(algebra.effective_end_date)
+        self.assertEqual(list(algebra.calendars.all()), [self.teacher_user.calendar])
+        self.assertEqual(algebra.classroom.logout_url, "http://darasa.test/")
+
+        geometry = Event.objects.get(classroom__name="Geometry")
+        self.assertEqual(geometry.rule.params, "byweekday:TU;interval:2")
+        self.assertEqual(geometry.classroom.logout_url, "http://localhost/")
+        self.assertIsNone(geometry.effective_end_date)
+        room_ids = Classroom.objects.values_list("room_id", flat=True)
+        self.assertEqual(len(set(room_ids)), 2)
+
+    def test_rules_are_reused(self):
+        rule = Rule.objects.create(
+            name="fortnightly",
+            description="Every other tuesday",
+            frequency="WEEKLY",
+            params="interval:2;byweekday:TU",
+        )
+        self.run_import(CSV_TIMETABLE)
+        self.assertEqual(Event.objects.get(classroom__name="Geometry").rule, rule)
+
+    def test_existing_classrooms_are_rejected(self):
+        self.run_import(CSV_TIMETABLE)
+        report = self.run_import(CSV_TIMETABLE, check_conflicts=False)
+
+        self.assertEqual(report["created"], 1)
+        errors = {row["row"]: row["errors"] for row in report["errors"]}
+        self.assertIn("already has a class named 'Algebra'", errors[2][0])
+        self.assertIn("already has a class named 'Geometry'", errors[3][0])
+        self.assertTrue(Classroom.objects.filter(name="Calculus").exists())
+
+    def test_dry_run_writes_nothing(self):
+        report = self.run_import(CSV_TIMETABLE, dry_run=True)
+
+        self.assertEqual(report["valid"], 2)
+        self.assertEqual(report["created"], 0)
+        self.assertFalse(Classroom.objects.exists())
+        self.assertFalse(Rule.objects.exists())
+
+    def test_ics_events_are_imported(self):
+        report = self.run_import(ICS_TIMETABLE, "ics")
+
+        self.assertEqual(report["created"], 1)
+        self.assertIn("1MO", report["errors"][0]["errors"][0])
+        algebra = Event.objects.get(classroom__name="Algebra")
+        self.assertEqual(algebra.rule.params, "byweekday:MO,WE")
+        self.assertEqual(algebra.end - algebra.start, datetime.timedelta(hours=1))
+
+    def test_missing_columns_are_rejected(self):
+        with self.assertRaises(TimetableImportError):
+            self.run_import("name,start\nAlgebra,2021-01-04 08:00\n")
+
+
+def mid_size_school():
+    """
+    Returns the sessions of a mid-size secondary school, and the periods its
+    teachers are unavailable: 4 forms of 6 streams take 38 hours of 12
+    subjects, 288 courses taught by 72 teachers, a sixth with an assistant.
+    """
+    hours = [5, 5, 4, 4, 3, 3, 3, 3, 2, 2, 2, 2]
+    streams = 24
+    sessions = []
+    for stream in range(streams):
+        for subject, count in enumerate(hours):
+            # Every teacher teaches a subject to 4 streams
+            resources = [
+                ("level", stream),
+                ("teacher", (subject * streams + stream) // 4),
+            ]
+            if (stream + subject) % 6 == 0:
+                other = (subject + 1) % len(hours)
+                resources.append(("teacher", (other * streams + stream) // 4))
+            course_id = "{:02d}-{:02d}".format(stream, subject)
+            sessions += [
+                Session(course_id, number, tuple(resources))
+                for number in range(1, count + 1)
+            ]
+    unavailable = {
+        ("teacher", teacher): {teacher % 40, teacher * 7 % 40}
+        for teacher in range(0, 72, 3)
+    }
+    return sessions, unavailable
+
+
+class TimetableSolverTest(SimpleTestCase):
+    def assertNoClashes(self, placement):
+        taken = set()
+        for session, slot in placement.items():
+            for resource in session.resources:
+                self.assertNotIn((resource, slot), taken)
+                taken.add((resource, slot))
+
+    def test_mid_size_school_is_scheduled(self):
+        sessions, unavailable = mid_size_school()
+        placement, unplaced = TimetableSolver(unavailable=unavailable).solve(sessions)
+
+        self.assertEqual(unplaced, [])
+        self.assertEqual(len(placement), 912)
+        self.assertNoClashes(placement)
+        for session, slot in placement.items():
+            for resource in session.resources:
+                self.assertNotIn(slot, unavailable.get(resource, ()))
+
+    def test_timetables_are_deterministic(self):
+        sessions, unavailable = mid_size_school()
+        first = TimetableSolver(unavailable=unavailable).solve(sessions)
+        second = TimetableSolver(unavailable=unavailable).solve(sessions[::-1])
+        self.assertEqual(first, second)
+
+    def test_sessions_of_a_course_are_spread_over_the_week(self):
+        sessions = [Session("maths", number, (("teacher", 1),)) for number in (1, 2)]
+        placement, _ = TimetableSolver(days=2, periods=4).solve(sessions)
+        self.assertEqual(sorted(placement.values()), [0, 4])
+
+    def test_blocking_sessions_are_moved(self):
+        teacher, other_teacher, level = ("teacher", 1), ("teacher", 2), ("level", 1)
+        art = Session("art", 1, (teacher,))
+        biology = Session("biology", 1, (teacher, level))
+        chemistry = Session("chemistry", 1, (other_teacher, level))
+        unavailable = {teacher: {0}, level: {0}, other_teacher: {1}}
+
+        # Placed first, art takes the only period biology could have had
+        solver = TimetableSolver(1, 3, unavailable, max_repair_steps=0)
+        _, unplaced = solver.solve([art, biology, chemistry])
+        self.assertEqual(unplaced, [biology])
+
+        placement, unplaced = TimetableSolver(1, 3, unavailable).solve(
+            [art, biology, chemistry]
+        )
+        self.assertEqual(unplaced, [])
+        self.assertEqual(placement, {art: 2, biology: 1, chemistry: 2})
+
+    def test_sessions_without_a_period_are_reported(self):
+        sessions = [Session("maths", number, (("teacher", 1),)) for number in (1, 2)]
+        unavailable = {("teacher", 1): {1}}
+        placement, unplaced = TimetableSolver(1, 2, unavailable).solve(sessions)
+        self.assertEqual(placement, {sessions[0]: 0})
+        self.assertEqual(unplaced, [sessions[1]])
+
+
+@override_settings(BBB_LOGOUT_URL="http://localhost/")
+class TimetableGeneratorTest(TestCase):
+    def setUp(self):
+        # Creating users queues verification emails, no need for a broker here
+        patcher = mock.patch("apps.accounts.models.send_email")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.teacher_user = User.objects.create_user(
+            "teacher@darasa.test", "password", first_name="Jane", role=User.TEACHER
+        )
+        other_user = User.objects.create_user(
+            "other@darasa.test", "password", first_name="John", role=User.TEACHER
+        )
+        level = Level.objects.create(name="Form 1")
+        self.maths = Course.objects.create(
+            name="Mathematics", teacher=self.teacher_user.teacher, weekly_hours=3
+        )
+        self.maths.levels.add(level)
+        physics = Course.objects.create(
+            name="Physics", teacher=other_user.teacher, weekly_hours=2
+        )
+        physics.levels.add(level)
+        Course.objects.create(
+            name="Art", teacher=self.teacher_user.teacher, weekly_hours=2
+        )
+        # A Wednesday
+        self.start = datetime.date(2021, 1, 6)
+        self.until = datetime.date(2021, 3, 31)
+
+    def generate(self, courses=None, **kwargs):
+        generator = TimetableGenerator(
+            Course.objects.all() if courses is None else courses,
+            self.start,
+            self.until,
+            tz="Africa/Nairobi",
+            **kwargs
+        )
+        return generator.run()
+
+    def test_dry_run_previews_the_timetable(self):
+        report = self.generate(dry_run=True)
+
+        self.assertEqual(report["valid"], 7)
+        self.assertEqual(report["created"], 0)
+        self.assertEqual(report["unplaced"], [])
+        self.assertEqual(len(report["timetable"]), 7)
+        self.assertEqual(report["timetable"][0]["start"], "2021-01-06T05:00:00Z")
+        self.assertFalse(Classroom.objects.exists())
+
+    def test_classes_are_created_without_clashes(self):
+        report = self.generate()
+
+        self.assertEqual(report["created"], 7)
+        events = Event.objects.select_related("rule", "classroom__course")
+        self.assertEqual(len(events), 7)
+        for event in events:
+            self.assertEqual(event.rule.frequency, "WEEKLY")
+            self.assertGreaterEqual(event.start.date(), self.start)
+            self.assertEqual(event.end - event.start, datetime.timedelta(hours=1))
+        teacher_starts = [
+            event.start.weekday() * 24 + event.start.hour
+            for event in events
+            if event.classroom.course.teacher == self.teacher_user.teacher
+        ]
+        level_starts = [
+            event.start.weekday() * 24 + event.start.hour
+            for event in events
+            if event.classroom.course.name != "Art"
+        ]
+        self.assertEqual(len(set(teacher_starts)), 5)
+        self.assertEqual(len(set(level_starts)), 5)
+
+    def test_busy_periods_of_teachers_are_left_out(self):
+        self.start = datetime.date(2021, 1, 11)
+        TimetableImport(user=self.teacher_user, tz="Africa/Nairobi").run(
+            [
+                (
+                    1,
+                    {
+                        "course": "Art",
+                        "name": "Assembly",
+                        "start": "2021-01-11 08:00",
+                        "duration": "60",
+                        "repeat": "weekly",
+                    },
+                )
+            ]
+        )
+        report = self.generate([self.maths], days=1, periods=3)
+
+        self.assertEqual(report["created"], 2)
+        self.assertEqual(
+            report["unplaced"],
+            [{"course": str(self.maths.pk), "name": "Mathematics 3"}],
+        )
+        self.assertEqual(
+            [row["start"] for row in report["timetable"]],
+            ["2021-01-11T06:00:00Z", "2021-01-11T07:00:00Z"],
+        )
+
+
+# Transactional, since the views query the database from other threads
+class AsyncRoomsApplicationTest(TransactionTestCase):
+    def setUp(self):
+        # Creating users queues verification emails, no need for a broker here
+        patcher = mock.patch("apps.accounts.models.send_email")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.fake = FakeBBBServer()
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+        settings = override_settings(
+            BBB_SERVERS=[], BBB_URL=self.fake.url, BBB_SECRET=self.fake.secret
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        # Only verified users are authenticated by their tokens
+        self.teacher_user = User.objects.create_user(
+            "teacher@darasa.test",
+            "password",
+            first_name="Jane",
+            role=User.TEACHER,
+            is_active=True,
+        )
+        course = Course.objects.create(
+            name="Mathematics", teacher=self.teacher_user.teacher
+        )
+        self.classroom = Classroom.objects.create(
+            name="Algebra", course=course, logout_url="http://localhost/"
+        )
+        cache.clear()
+        self.application = AsyncRoomsApplication(get_asgi_application())
+
+    def request(self, method, action, token=None):
+        headers = [(b"host", b"testserver")]
+        if token is not None:
+            headers.append((b"authorization", "Bearer {}".format(token).encode()))
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": "/v1/rooms/{}/{}/".format(self.classroom.room_id, action),
+            "query_string": b"",
+            "headers": headers,
+        }
+
+        async def communicate():
+            communicator = ApplicationCommunicator(self.application, scope)
+            await communicator.send_input({"type": "http.request", "body": b""})
+            start = await communicator.receive_output(5)
+            body = await communicator.receive_output(5)
+            await communicator.wait()
+            await close_async_clients()
+            return start["status"], json.loads(body["body"])
+
+        return async_to_sync(communicate)()
+
+    def test_meetings_are_served_by_the_async_views(self):
+        token = AccessToken.for_user(self.teacher_user)
+
+        status, data = self.request("POST", "join", token)
+        self.assertEqual(status, 200)
+        self.assertTrue(
+            data["meeting_room_link"].startswith(self.fake.url + "api/join?")
+        )
+        self.assertEqual(self.request("POST", "join", token)[0], 200)
+        self.assertEqual(self.request("GET", "running", token), (200, {"status": True}))
+        status, data = self.request("PATCH", "end", token)
+        self.assertEqual(status, 200)
+        self.assertEqual(data["room_id"], self.classroom.room_id)
+        self.assertEqual(
+            self.request("GET", "running", token), (200, {"status": False})
+        )
+
+        # The meeting was only created for the first join, and its state
+        # swept again once created and ended
+        self.assertEqual(
+            [call for call, _ in self.fake.calls],
+            ["getMeetings", "create", "getMeetings", "end", "getMeetings"],
+        )
+
+    def test_credentials_are_checked(self):
+        status, data = self.request("GET", "running", "not-a-token")
+        self.assertEqual(status, 401)
+        self.assertEqual(data["code"], "token_not_valid")
+        self.assertEqual(self.fake.calls, [])
+
+    def test_unknown_rooms_are_not_found(self):
+        token = AccessToken.for_user(self.teacher_user)
+        self.classroom.room_id += 1
+        self.assertEqual(self.request("GET", "running", token)[0], 404)
+
+    def test_other_requests_are_left_to_django(self):
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/v1/rooms/1/running/",
+            "headers": [(b"host", b"testserver")],
+        }
+        self.assertIsNone(self.application.match(scope))
+        scope["headers"].append((b"authorization", b"Bearer token"))
+        self.assertIsNotNone(self.application.match(scope))
+        scope["method"] = "POST"
+        self.assertIsNone(self.application.match(scope))
+
+
+class ClassroomServerTest(TestCase):
+    def setUp(self):
+        # Creating users queues verification emails, no need for a broker here
+        patcher = mock.patch("apps.accounts.models.send_email")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.fakes = [FakeBBBServer(), FakeBBBServer()]
+        for fake in self.fakes:
+            fake.start()
+            self.addCleanup(fake.stop)
+        settings = override_settings(
+            BBB_SERVERS=[
+                {"url": fake.url, "secret": fake.secret} for fake in self.fakes
+            ]
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+
+        self.teacher_user = User.objects.create_user(
+            "teacher@darasa.test", "password", first_name="Jane", role=User.TEACHER
+        )
+        course = Course.objects.create(
+            name="Mathematics", teacher=self.teacher_user.teacher
+        )
+        self.classroom = Classroom.objects.create(
+            name="Algebra", course=course, logout_url="http://localhost/"
+        )
+
+    def get_calls(self, fake):
+        return [call for call, _ in fake.calls]
+
+    def test_meetings_are_routed_to_their_server(self):
+        busy, idle = self.fakes
+        busy.meetings["1"] = {"createTime": 0, "participantCount": 30}
+
+        url = self.classroom.create_join_link(self.teacher_user)
+        self.assertTrue(url.startswith(idle.url + "api/join?"))
+        classroom = Classroom.objects.get(pk=self.classroom.pk)
+        self.assertEqual(classroom.server_url, idle.url)
+
+        self.assertTrue(classroom.is_meeting_running())
+        self.assertTrue(classroom.end_meeting())
+        self.assertEqual(self.get_calls(busy), ["getMeetings"])
+        self.assertEqual(
+            self.get_calls(idle), ["getMeetings", "create", "getMeetings", "end"],
+        )
+
+    def test_the_server_calls_back_once_meetings_ended(self):
+        self.classroom.create_join_link(self.teacher_user)
+        fake = next(fake for fake in self.fakes if fake.meetings)
+        params = next(params for call, params in fake.calls if call == "create")
+        callback = urlparse(params["meta_endCallbackUrl"])
+        self.assertTrue(callback.path.startswith("/v1/rooms/ended/"))
+
+        # The meeting ends on its own, BigBlueButton calls back without
+        # credentials
+        fake.meetings.clear()
+        self.assertEqual(self.client.get(callback.path).status_code, 204)
+        self.assertFalse(
+            self.classroom.meeting_states.is_created(self.classroom.room_id)
+        )
+
+        forged = "/v1/rooms/ended/{}:forged/".format(self.classroom.room_id)
+        self.assertEqual(self.client.get(forged).status_code, 404)
+
+
+@override_settings(
+    BBB_PREWARM_MINUTES=10,
+    BBB_PREWARM_SPREAD_MINUTES=0,
+    BBB_NOTIFICATION_BATCH_SIZE=100,
+)
+class MeetingSchedulerTest(TestCase):
+    def setUp(self):
+        # Creating users queues verification emails, no need for a broker here
+        patcher = mock.patch("apps.accounts.models.send_email")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.fake = FakeBBBServer()
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+        settings = override_settings(
+            BBB_SERVERS=[], BBB_URL=self.fake.url, BBB_SECRET=self.fake.secret
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+
+        teacher_user = User.objects.create_user(
+            "teacher@darasa.test", "password", first_name="Jane", role=User.TEACHER
+        )
+        student_user = User.objects.create_user(
+            "student@darasa.test", "password", first_name="John", role=User.STUDENT
+        )
+        course = Course.objects.create(name="Mathematics", teacher=teacher_user.teacher)
+        course.students.add(student_user.student)
+
+        self.now = timezone.now()
+        self.classroom = self.create_class(course, "Algebra", minutes=5)
+        # Not due before 20 minutes
+        self.create_class(course, "Geometry", minutes=30)
+
+    def create_class(self, course, name, minutes):
+        classroom = Classroom.objects.create(
+            name=name, course=course, logout_url="http://localhost/"
+        )
+        start = self.now + datetime.timedelta(minutes=minutes)
+        Event.objects.create(
+            start=start, end=start + datetime.timedelta(hours=1), classroom=classroom
+        )
+        return classroom
+
+    def schedule(self, send_batch=None):
+        return MeetingScheduler(send_batch or mock.Mock(), now=self.now).run()
+
+    def test_meetings_of_classes_about_to_start_are_created(self):
+        send_batch = mock.Mock()
+        report = self.schedule(send_batch)
+
+        self.assertEqual(report, {"created": 1, "failed": 0, "notified": 2})
+        # A single sweep tells which meetings were created already
+        self.assertEqual(
+            self.fake.calls, [("getMeetings", mock.ANY), ("create", mock.ANY)]
+        )
+        room_id = str(self.classroom.room_id)
+        self.assertEqual(self.fake.calls[1][1]["meetingID"], room_id)
+        classroom = Classroom.objects.get(pk=self.classroom.pk)
+        self.assertEqual(classroom.server_url, self.fake.url)
+        # Joining doesn't create it again
+        states = self.classroom.meeting_states
+        self.assertTrue(states.is_created(self.classroom.room_id))
+
+        (messages,), _ = send_batch.call_args
+        self.assertEqual(
+            [message["to_email"] for message in messages],
+            ["teacher@darasa.test", "student@darasa.test"],
+        )
+        passwords = [
+            self.classroom.moderator_password,
+            self.classroom.attendee_password,
+        ]
+        for message, password in zip(messages, passwords):
+            self.assertIn("password={}".format(password), message["text_content"])
+
+        # Later runs leave it be
+        self.assertEqual(self.schedule(), {"created": 0, "failed": 0, "notified": 0})
+        self.assertEqual(len(self.fake.calls), 2)
+
+    @override_settings(BBB_NOTIFICATION_BATCH_SIZE=1)
+    def test_emails_are_sent_in_batches(self):
+        send_batch = mock.Mock()
+        self.schedule(send_batch)
+        self.assertEqual(
+            [len(messages) for (messages,), _ in send_batch.call_args_list], [1, 1]
+        )
+
+    def test_failed_meetings_are_tried_again(self):
+        with override_settings(BBB_SECRET="wrong"):
+            report = self.schedule()
+        self.assertEqual(report, {"created": 0, "failed": 1, "notified": 0})
+
+        self.assertEqual(self.schedule()["created"], 1)
+
+
+@skipUnless(BENCHMARKS, "Set TIMETABLE_BENCHMARKS=True to run benchmarks")
+class TimetableSolverBenchmark(SimpleTestCase):
+    def test_mid_size_school(self):
+        sessions, unavailable = mid_size_school()
+        started = time.perf_counter()
+        placement, unplaced = TimetableSolver(unavailable=unavailable).solve(sessions)
+        elapsed = time.perf_counter() - started
+        print(
+            "\n{} sessions of {} courses: ".format(
+                len(sessions), len({session.course_id for session in sessions})
+            ),
+            "{} placed in {:.2f}s".format(len(placement), elapsed),
+        )
+        self.assertEqual(unplaced, [])
+        self.assertLess(elapsed, 5)
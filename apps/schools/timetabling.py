@@ -0,0 +1,346 @@
+import datetime
+import math
+from collections import Counter, defaultdict, namedtuple
+import pytz
+from django.conf import settings
+from apps.timetable.conflicts import get_busy_intervals
+from apps.timetable.utils import isoformat
+from .imports import TimetableImport, TimetableImportError
+from .models import Course, Teacher
+
+# The default week, 8 periods of an hour from 8:00, Monday to Friday
+TIMETABLE_DAYS = 5
+TIMETABLE_PERIODS = 8
+TIMETABLE_DAY_START = datetime.time(8)
+TIMETABLE_PERIOD_MINUTES = 60
+# Moves tried to fit the sessions left over by the first pass
+MAX_REPAIR_STEPS = 10000
+
+# A class of a course held every week for one period, taking all of its
+# resources, ("teacher", id) and ("level", id) pairs, at once
+Session = namedtuple("Session", ["course_id", "number", "resources"])
+
+
+class TimetableSolver:
+    """
+    Gives weekly sessions a slot of the week, ``days`` times ``periods`` slots
+    numbered day by day, so no teacher or level has two sessions at a time.
+
+    Sessions are placed one by one, the most constrained first, in the free
+    slot spreading the sessions of their course and resources most evenly over
+    the days. The sessions left without a free slot are then fitted by moving
+    the one session blocking a slot elsewhere. Nothing is random, the same
+    sessions always get the same slots.
+
+    ``unavailable`` holds the slots each resource can't be given.
+    """
+
+    def __init__(
+        self,
+        days=TIMETABLE_DAYS,
+        periods=TIMETABLE_PERIODS,
+        unavailable=None,
+        max_repair_steps=MAX_REPAIR_STEPS,
+    ):
+        self.days = days
+        self.periods = periods
+        self.unavailable = unavailable or {}
+        self.max_repair_steps = max_repair_steps
+
+    def solve(self, sessions):
+        """
+        Returns the slots of the sessions placed, keyed by session, and the
+        list of those which couldn't be.
+        """
+        self.placement = {}
+        self.taken = defaultdict(dict)
+        self.course_load = defaultdict(Counter)
+        self.resource_load = defaultdict(Counter)
+        self.allowed = {session: self._allowed_slots(session) for session in sessions}
+
+        demand = Counter(resource for s in sessions for resource in s.resources)
+        order = sorted(
+            sessions,
+            key=lambda s: (
+                len(self.allowed[s]),
+                -max((demand[resource] for resource in s.resources), default=0),
+                s.course_id,
+                s.number,
+            ),
+        )
+        unplaced = []
+        for session in order:
+            slot = self._best_slot(session)
+            if slot is None:
+                unplaced.append(session)
+            else:
+                self._place(session, slot)
+        return self.placement, self._repair(unplaced)
+
+    def _allowed_slots(self, session):
+        return [
+            slot
+            for slot in range(self.days * self.periods)
+            if not any(
+                slot in self.unavailable.get(resource, ())
+                for resource in session.resources
+            )
+        ]
+
+    def _is_free(self, session, slot):
+        return not any(slot in self.taken[resource] for resource in session.resources)
+
+    def _best_slot(self, session):
+        def cost(slot):
+            day = slot // self.periods
+            return (
+                self.course_load[session.course_id][day],
+                sum(self.resource_load[r][day] for r in session.resources),
+                slot,
+            )
+
+        free = [slot for slot in self.allowed[session] if self._is_free(session, slot)]
+        return min(free, key=cost, default=None)
+
+    def _place(self, session, slot):
+        day = slot // self.periods
+        self.placement[session] = slot
+        self.course_load[session.course_id][day] += 1
+        for resource in session.resources:
+            self.taken[resource][slot] = session
+            self.resource_load[resource][day] += 1
+
+    def _remove(self, session):
+        slot = self.placement.pop(session)
+        day = slot // self.periods
+        self.course_load[session.course_id][day] -= 1
+        for resource in session.resources:
+            del self.taken[resource][slot]
+            self.resource_load[resource][day] -= 1
+        return slot
+
+    def _repair(self, unplaced):
+        """
+        Fits the sessions of ``unplaced`` by moving sessions out of their way,
+        pass after pass until one fits none or MAX_REPAIR_STEPS moves were
+        tried. Returns the sessions still unplaced.
+        """
+        self.steps = 0
+        while unplaced:
+            left = [session for session in unplaced if not self._fit(session)]
+            if len(left) == len(unplaced):
+                break
+            unplaced = left
+        return unplaced
+
+    def _fit(self, session):
+        """
+        Places ``session`` in a slot taken by a single session which can move
+        to another free slot, returns whether it could.
+        """
+        for slot in self.allowed[session]:
+            if self.steps >= self.max_repair_steps:
+                return False
+            blockers = {
+                self.taken[resource][slot]
+                for resource in session.resources
+                if slot in self.taken[resource]
+            }
+            if len(blockers) != 1:
+                continue
+            self.steps += 1
+            blocker = blockers.pop()
+            self._remove(blocker)
+            self._place(session, slot)
+            other = self._best_slot(blocker)
+            if other is not None:
+                self._place(blocker, other)
+                return True
+            self._remove(session)
+            self._place(blocker, slot)
+        return False
+
+
+class TimetableGenerator:
+    """
+    Generates the weekly classes of ``courses`` from the ``start`` date until
+    the ``until`` date, or forever.
+
+    Every course gets as many sessions of ``period_minutes`` as needed for its
+    weekly hours, with its teacher, its assistant teachers and its levels as
+    resources. Teachers aren't given the periods in which their calendar is
+    busy during the first week. The sessions are placed by TimetableSolver and
+    written as classrooms recurring weekly by TimetableImport, which checks
+    them against the scheduled classes once more. Nothing is written on a
+    ``dry_run``, the report still previews the timetable.
+
+    Times are in ``tz``, the default time zone unless given.
+    """
+
+    def __init__(
+        self,
+        courses,
+        start,
+        until=None,
+        tz=None,
+        days=TIMETABLE_DAYS,
+        periods=TIMETABLE_PERIODS,
+        day_start=TIMETABLE_DAY_START,
+        period_minutes=TIMETABLE_PERIOD_MINUTES,
+        user=None,
+        dry_run=False,
+    ):
+        try:
+            self.timezone = pytz.timezone(tz or settings.TIME_ZONE or "UTC")
+        except pytz.UnknownTimeZoneError:
+            raise TimetableImportError("Unknown time zone {!r}".format(tz))
+        if not 0 < days <= 7:
+            raise TimetableImportError("A week has 1 to 7 days of classes")
+        if periods <= 0 or period_minutes <= 0:
+            raise TimetableImportError("Periods must be given and last minutes")
+        if until is not None and until < start:
+            raise TimetableImportError("The timetable must end after it starts")
+        self.courses = sorted(courses, key=lambda course: (course.name, str(course.pk)))
+        self.start = start
+        self.until = until
+        self.days = days
+        self.periods = periods
+        self.day_start = day_start
+        self.period = datetime.timedelta(minutes=period_minutes)
+        self.user = user
+        self.dry_run = dry_run
+
+    def get_slot_start(self, slot):
+        """
+        Returns when the first class given ``slot`` starts, on or after the
+        start date.
+        """
+        day, period = divmod(slot, self.periods)
+        date = self.start + datetime.timedelta(days=day - self.start.weekday())
+        if date < self.start:
+            date += datetime.timedelta(weeks=1)
+        start = self.timezone.localize(datetime.datetime.combine(date, self.day_start))
+        return start + period * self.period
+
+    def get_sessions(self):
+        """
+        Returns the sessions of the courses, loading their teachers and levels
+        with a query each.
+        """
+        resources = defaultdict(set)
+        for course in self.courses:
+            resources[course.pk].add(("teacher", course.teacher_id))
+        for course_id, teacher_id in Course.assistant_teachers.through.objects.filter(
+            course__in=list(resources)
+        ).values_list("course_id", "teacher_id"):
+            resources[course_id].add(("teacher", teacher_id))
+        for course_id, level_id in Course.levels.through.objects.filter(
+            course__in=list(resources)
+        ).values_list("course_id", "level_id"):
+            resources[course_id].add(("level", level_id))
+
+        sessions = []
+        for course in self.courses:
+            count = math.ceil(course.weekly_hours * 3600 / self.period.total_seconds())
+            sessions += [
+                Session(course.pk, number, tuple(sorted(resources[course.pk], key=str)))
+                for number in range(1, count + 1)
+            ]
+        return sessions
+
+    def get_unavailable(self, sessions):
+        """
+        Returns the slots in which the teachers of ``sessions`` have classes on
+        their calendar, keyed by resource.
+        """
+        teacher_ids = {
+            resource[1]
+            for session in sessions
+            for resource in session.resources
+            if resource[0] == "teacher"
+        }
+        calendars = dict(
+            Teacher.objects.filter(
+                pk__in=teacher_ids, user__calendar__isnull=False
+            ).values_list("pk", "user__calendar_id")
+        )
+        slots = [
+            (slot, self.get_slot_start(slot))
+            for slot in range(self.days * self.periods)
+        ]
+        if not calendars or not slots:
+            return {}
+        busy = get_busy_intervals(
+            set(calendars.values()),
+            min(start for _, start in slots),
+            max(start for _, start in slots) + self.period,
+        )
+
+        unavailable = {}
+        for teacher_id, calendar_id in calendars.items():
+            unavailable[("teacher", teacher_id)] = {
+                slot
+                for slot, start in slots
+                if any(
+                    busy_start < start + self.period and busy_end > start
+                    for busy_start, busy_end in busy[calendar_id]
+                )
+            }
+        return unavailable
+
+    def run(self):
+        """
+        Generates the timetable and returns the TimetableImport report, with
+        the generated classes under ``timetable`` and the sessions which
+        couldn't be placed under ``unplaced``.
+        """
+        sessions = self.get_sessions()
+        solver = TimetableSolver(
+            self.days, self.periods, unavailable=self.get_unavailable(sessions)
+        )
+        placement, unplaced = solver.solve(sessions)
+
+        until = ""
+        if self.until is not None:
+            until = self.timezone.localize(
+                datetime.datetime.combine(self.until, datetime.time.max)
+            )
+        courses = {course.pk: course for course in self.courses}
+        rows = []
+        for session, slot in placement.items():
+            course = courses[session.course_id]
+            rows.append(
+                {
+                    "course": str(course.pk),
+                    "name": "{} {}".format(course.name, session.number),
+                    "start": self.get_slot_start(slot),
+                    "duration": self.period,
+                    "repeat": "WEEKLY",
+                    "repeat_until": until,
+                }
+            )
+
+        rows.sort(key=lambda row: (row["start"], row["name"]))
+        timetable_import = TimetableImport(
+            user=self.user, tz=self.timezone.zone, dry_run=self.dry_run
+        )
+        report = timetable_import.run(enumerate(rows, 1))
+        # In UTC, like the dates of the rest of the API
+        report["timetable"] = [
+            {
+                "row": number,
+                "course": row["course"],
+                "name": row["name"],
+                "start": isoformat(row["start"].astimezone(pytz.utc)),
+                "end": isoformat((row["start"] + row["duration"]).astimezone(pytz.utc)),
+            }
+            for number, row in enumerate(rows, 1)
+        ]
+        report["unplaced"] = [
+            {
+                "course": str(session.course_id),
+                "name": "{} {}".format(courses[session.course_id].name, session.number),
+            }
+            for session in unplaced
+        ]
+        return report
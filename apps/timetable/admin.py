@@ -30,8 +30,14 @@ class CalendarRelationAdmin(admin.ModelAdmin):
 
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
-    list_display = ("classroom", "start", "end")
-    list_filter = ("start",)
+    list_display = (
+        "classroom",
+        "start",
+        "end",
+        "effective_start_date",
+        "effective_end_date",
+    )
+    list_filter = ("start", "effective_start_date", "effective_end_date")
     ordering = ("-start",)
     date_hierarchy = "start"
     search_fields = ("classroom__name", "classroom__description")
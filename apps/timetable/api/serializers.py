@@ -29,5 +29,8 @@ class EventSerializer(serializers.ModelSerializer):
             "classroom",
             "rule",
             "end_recurring_period",
+            "effective_start_date",
+            "effective_end_date",
             "color",
         ]
+        read_only_fields = ["effective_start_date", "effective_end_date"]
@@ -7,8 +7,16 @@ from .views import (
     EventDetailView,
     RuleViewset,
     api_occurrences,
+    api_upcoming_occurrences,
+    api_sync_occurrences,
+    api_free_slots,
+    api_free_busy,
+    api_calendar_feed_url,
+    calendar_feed,
     api_create_event,
     api_move_or_resize_by_code,
+    api_bulk_change,
+    api_cache_stats,
 )
 
 router = routers.DefaultRouter()
@@ -25,6 +33,32 @@ urlpatterns = [
         api_occurrences,
         name="api_calendar_occurrences",
     ),
+    re_path(
+        r"^calendars/(?P<calendar_id>.+)/upcoming/$",
+        api_upcoming_occurrences,
+        name="api_calendar_upcoming_occurrences",
+    ),
+    re_path(
+        r"^calendars/(?P<calendar_id>.+)/sync/$",
+        api_sync_occurrences,
+        name="api_calendar_sync_occurrences",
+    ),
+    re_path(
+        r"^calendars/(?P<calendar_id>.+)/free-slots/$",
+        api_free_slots,
+        name="api_calendar_free_slots",
+    ),
+    re_path(
+        r"^calendars/(?P<calendar_id>.+)/feed/$",
+        api_calendar_feed_url,
+        name="api_calendar_feed_url",
+    ),
+    re_path(r"^freebusy/$", api_free_busy, name="api_free_busy"),
+    re_path(r"^cache-stats/$", api_cache_stats, name="api_cache_stats"),
+    re_path(r"^feeds/(?P<token>[^/]+)\.ics$", calendar_feed, name="api_calendar_feed"),
+    re_path(
+        r"^occurrences/bulk/$", api_bulk_change, name="api_bulk_change_occurrences"
+    ),
     re_path(
         r"^occurrences/(?P<occurrence_id>.+)/change/$",
         api_move_or_resize_by_code,
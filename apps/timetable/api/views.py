@@ -1,20 +1,65 @@
 import datetime
+import os
 import pytz
 import dateutil.parser
 from django.conf import settings
-from django.db.models import F, Q
+from django.core.cache import cache
+from django.db.models import F, Prefetch, Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.response import Response
 from django.utils import timezone
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework import exceptions, permissions, status, viewsets, generics, mixins
+from rest_framework.utils.urls import replace_query_param
+from apps.accounts.models import User
 from apps.core.permissions import IsOwnerOrReadOnly
+from apps.core.validators import is_valid_uuid
+from apps.core.versions import get_validators, not_modified_response, set_validators
 from apps.schools.api.serializers import StudentPictureSerializer
-from apps.schools.models import Classroom
-from ..models import Calendar, Event, Occurrence, Rule
+from apps.schools.models import Classroom, Course, Student
+from ..bulk import BULK_ACTIONS, bulk_change
+from ..conflicts import (
+    SchedulingConflict,
+    check_conflicts,
+    free_slots,
+    get_busy_intervals,
+    get_calendar_events,
+    get_course_calendar_ids,
+    get_scheduled_occurrences,
+)
+from ..feeds import iter_calendar_feed, make_feed_token, parse_feed_token
+from ..models import (
+    Calendar,
+    Event,
+    EventTombstone,
+    Occurrence,
+    OccurrenceIndex,
+    Rule,
+)
+from ..models.events import rrule_cache
+from ..models.rules import params_cache
+from ..utils import (
+    EventListManager,
+    decode_occurrence_key,
+    encode_occurrence_key,
+    get_offset_table,
+    isoformat,
+)
 from .serializers import EventSerializer, RuleSerializer
 
+MAX_UPCOMING_OCCURRENCES = 100
+SYNC_TOKEN_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+SYNC_TOKEN_OVERLAP = datetime.timedelta(seconds=5)
+MAX_FREE_SLOTS_DAYS = 92
+MAX_FREE_BUSY_USERS = 1000
+FEED_CACHE_KEY = "feed:{}:{}"
+FEED_CACHE_TIMEOUT = 86400
+FEED_CONTENT_TYPE = "text/calendar; charset=utf-8"
+MAX_BULK_CHANGE_DAYS = 366
+
 
 class EventDetailView(
     mixins.RetrieveModelMixin,
@@ -60,6 +105,14 @@ def api_occurrences(request, calendar_id, **kwargs):
     tz = request.query_params.get("timezone")
     include_students = request.query_params.get("include_students") == "true"
 
+    # Students mostly reopen the same weeks, answer them from the cache alone
+    etag, last_modified = get_validators(
+        [("calendar", calendar_id)], request.get_full_path()
+    )
+    response = not_modified_response(request, etag, last_modified)
+    if response is not None:
+        return response
+
     try:
         response_data = _api_occurrences(
             request, start, end, calendar_id, tz, include_students
@@ -73,7 +126,7 @@ def api_occurrences(request, calendar_id, **kwargs):
             {"message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-    return Response(response_data)
+    return set_validators(Response(response_data), etag, last_modified)
 
 
 # flake8: noqa: C901
@@ -81,6 +134,28 @@ def _api_occurrences(request, start, end, calendar_id, tz, include_students=Fals
     if not start or not end:
         raise ValueError("Start and end datetime parameters are required")
 
+    start, end, current_tz = _parse_range(start, end, tz)
+    events = _filter_events_between(
+        _get_calendar_events(calendar_id, include_students), start, end
+    )
+
+    offsets = get_offset_table(current_tz, start, end) if current_tz else None
+    response_data = []
+    for event, occurrence in _get_occurrences_between(events, start, end):
+        response_data.append(
+            _occurrence_data(request, event, occurrence, offsets, include_students)
+        )
+
+    return response_data
+
+
+def _get_occurrences_between(events, start, end):
+    if OccurrenceIndex.objects.covers(start, end):
+        return OccurrenceIndex.objects.occurrences_between(events, start, end)
+    return EventListManager(events).occurrences_between(start, end)
+
+
+def _parse_range(start, end, tz):
     start = dateutil.parser.parse(start)
     end = dateutil.parser.parse(end)
 
@@ -96,95 +171,579 @@ def _api_occurrences(request, start, end, calendar_id, tz, include_students=Fals
         start = utc.localize(start)
         end = utc.localize(end)
 
+    return start, end, current_tz
+
+
+def _filter_events_between(events, start, end):
+    return events.filter(effective_start_date__lt=end).filter(
+        Q(effective_end_date__gt=start) | Q(effective_end_date__isnull=True)
+    )
+
+
+def _get_calendar_events(calendar_id, include_students=False):
     if calendar_id:
         # will raise DoesNotExist exception if no match
-        calendars = [Calendar.objects.get(id=calendar_id)]
-    # if no calendar slug is given, get all the calendars
+        calendar = Calendar.objects.get(id=calendar_id)
+        events = calendar.events.all()
+    # if no calendar slug is given, get the events of all the calendars
     else:
-        calendars = Calendar.objects.all()
+        events = Event.objects.filter(calendars__isnull=False).distinct()
+
+    events = events.select_related(
+        "rule", "created_by", "classroom__course__teacher__user"
+    )
+    if include_students:
+        events = events.prefetch_related(
+            Prefetch(
+                "classroom__course__students",
+                queryset=Student.objects.select_related("user"),
+            )
+        )
+    return events
 
-    response_data = []
-    # Algorithm to get an id for the occurrences in fullcalendar (NOT THE SAME
-    # AS IN THE DB) which are always unique.
+
+def _occurrence_data(request, event, occurrence, offsets, include_students=False):
+    """
+    Returns the data of an occurrence, with its dates as ISO strings in the
+    timezone of ``offsets``, an OffsetTable, or as they are if it's None.
+    """
     # Fullcalendar thinks that all their "events" with the same "event.id" in
     # their system are the same object, because it's not really built around
-    # the idea of events (generators)
-    # and occurrences (their events).
-    # Check the "persisted" boolean value that tells it whether to change the
-    # event, using the "event_id" or the occurrence with the specified "id".
-    i = 1
-    if Occurrence.objects.all().count() > 0:
-        i = Occurrence.objects.latest("id").id + 1
-    event_list = []
-    for calendar in calendars:
-        # create flat list of events from each calendar
-        event_list += calendar.events.filter(start__lte=end).filter(
-            Q(end_recurring_period__gte=start) | Q(end_recurring_period__isnull=True)
+    # the idea of events (generators) and occurrences (their events), so each
+    # occurrence gets its own key (NOT THE SAME AS THE ID IN THE DB).
+    # Check the "existed" boolean value that tells it whether to change the
+    # event, using the "event_id", or the occurrence with the given "id".
+    occurrence_id = encode_occurrence_key(event.id, occurrence.original_start)
+    existed = bool(occurrence.id)
+
+    recur_rule = event.rule.name if event.rule else None
+
+    if event.end_recurring_period:
+        recur_period_end = event.end_recurring_period
+        if offsets:
+            # make recur_period_end aware in given timezone
+            recur_period_end = offsets.to_local(recur_period_end)
+        recur_period_end = isoformat(recur_period_end)
+    else:
+        recur_period_end = None
+
+    event_start = occurrence.start
+    event_end = occurrence.end
+    if offsets:
+        # make event start and end dates aware in given timezone
+        event_start = offsets.to_local(event_start)
+        event_end = offsets.to_local(event_end)
+
+    classroom = event.classroom
+    course = classroom.course
+    return {
+        "id": occurrence_id,
+        "title": occurrence.name,
+        "description": occurrence.description,
+        "start": isoformat(event_start),
+        "end": isoformat(event_end),
+        "existed": existed,
+        "event_id": event.id,
+        "classroom": {
+            "name": classroom.name,
+            "duration": classroom.duration,
+            "room_id": classroom.room_id,
+        },
+        "course": {
+            "name": course.name,
+            "teacher": str(course.teacher),
+            "students": StudentPictureSerializer(
+                course.students.all(), many=True, context={"request": request}
+            ).data
+            if include_students
+            else [],
+        },
+        "color": event.color,
+        "rule": recur_rule,
+        "end_recurring_period": recur_period_end,
+        "created_by": str(event.created_by),
+        "cancelled": occurrence.cancelled,
+    }
+
+
+@swagger_auto_schema(
+    method="GET",
+    manual_parameters=[
+        openapi.Parameter("calendar_id", openapi.IN_PATH, type=openapi.TYPE_STRING),
+        openapi.Parameter("after", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter("before", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter("limit", openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        openapi.Parameter("cursor", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter("timezone", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+    ],
+)
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def api_upcoming_occurrences(request, calendar_id, **kwargs):
+    after = request.query_params.get("after")
+    before = request.query_params.get("before")
+    limit = request.query_params.get("limit", settings.REST_FRAMEWORK["PAGE_SIZE"])
+    cursor = request.query_params.get("cursor")
+    tz = request.query_params.get("timezone")
+    include_students = request.query_params.get("include_students") == "true"
+
+    try:
+        response_data = _api_upcoming_occurrences(
+            request, calendar_id, after, before, limit, cursor, tz, include_students
+        )
+    except ValueError as e:
+        return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Calendar.DoesNotExist as e:
+        return Response({"message": str(e)}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return Response(
+            {"message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    return Response(response_data)
+
+
+def _api_upcoming_occurrences(
+    request, calendar_id, after, before, limit, cursor, tz, include_students=False
+):
+    """
+    Returns a page of the occurrences of a calendar from ``after`` (now by
+    default) on, in order of start. The ``next`` link resumes after the last
+    occurrence of the page, using a ``start_eventid`` cursor.
+    """
+    limit = min(int(limit), MAX_UPCOMING_OCCURRENCES)
+    if limit < 1:
+        raise ValueError("limit must be a positive number")
+
+    current_tz = False
+    if tz and tz in pytz.common_timezones:
+        current_tz = pytz.timezone(tz)
+
+    def parse(value):
+        value = dateutil.parser.parse(value)
+        if timezone.is_naive(value):
+            return (current_tz or pytz.UTC).localize(value)
+        # Occurrences are expanded in the zone of ``after``, which must be a
+        # pytz one
+        return value.astimezone(pytz.UTC)
+
+    after = parse(after) if after else timezone.now()
+    before = parse(before) if before else None
+    if cursor:
+        cursor_start, cursor_event_id = cursor.rsplit("_", 1)
+        cursor = (parse(cursor_start), int(cursor_event_id))
+        after = max(after, cursor[0])
+
+    events = _get_calendar_events(calendar_id, include_students).filter(
+        Q(effective_end_date__gt=after) | Q(effective_end_date__isnull=True)
+    )
+    if before is not None:
+        events = events.filter(effective_start_date__lt=before)
+
+    offsets = None
+    if current_tz:
+        offsets = get_offset_table(
+            current_tz, after, before or after + datetime.timedelta(days=366)
+        )
+    results = []
+    next_url = None
+    for occurrence in EventListManager(events).occurrences_after(after, before):
+        if cursor and (occurrence.start, occurrence.event_id) <= cursor:
+            continue
+        if len(results) == limit:
+            last = results[-1]
+            next_url = replace_query_param(
+                request.build_absolute_uri(),
+                "cursor",
+                "{}_{}".format(last["start"], last["event_id"]),
+            )
+            break
+        results.append(
+            _occurrence_data(
+                request, occurrence.event, occurrence, offsets, include_students,
+            )
+        )
+
+    return {"next": next_url, "results": results}
+
+
+@swagger_auto_schema(
+    method="GET",
+    manual_parameters=[
+        openapi.Parameter("calendar_id", openapi.IN_PATH, type=openapi.TYPE_STRING),
+        openapi.Parameter("start", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter("end", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter("sync_token", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter("timezone", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+    ],
+)
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def api_sync_occurrences(request, calendar_id, **kwargs):
+    start = request.query_params.get("start")
+    end = request.query_params.get("end")
+    sync_token = request.query_params.get("sync_token")
+    tz = request.query_params.get("timezone")
+    include_students = request.query_params.get("include_students") == "true"
+
+    try:
+        response_data = _api_sync_occurrences(
+            request, start, end, calendar_id, sync_token, tz, include_students
+        )
+    except ValueError as e:
+        return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Calendar.DoesNotExist as e:
+        return Response({"message": str(e)}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return Response(
+            {"message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
-    for event in event_list:
-        occurrences = event.get_occurrences(start, end)
-        for occurrence in occurrences:
-            occurrence_id = i + occurrence.event.id
-            existed = False
-
-            if occurrence.id:
-                occurrence_id = occurrence.id
-                existed = True
-
-            recur_rule = occurrence.event.rule.name if occurrence.event.rule else None
-
-            if occurrence.event.end_recurring_period:
-                recur_period_end = occurrence.event.end_recurring_period
-                if current_tz:
-                    # make recur_period_end aware in given timezone
-                    recur_period_end = recur_period_end.astimezone(current_tz)
-                recur_period_end = recur_period_end
-            else:
-                recur_period_end = None
-
-            event_start = occurrence.start
-            event_end = occurrence.end
-            if current_tz:
-                # make event start and end dates aware in given timezone
-                event_start = event_start.astimezone(current_tz)
-                event_end = event_end.astimezone(current_tz)
-
-            response_data.append(
-                {
-                    "id": occurrence_id,
-                    "title": occurrence.name,
-                    "description": occurrence.description,
-                    "start": event_start,
-                    "end": event_end,
-                    "existed": existed,
-                    "event_id": occurrence.event.id,
-                    "classroom": {
-                        "name": occurrence.event.classroom.name,
-                        "duration": occurrence.event.classroom.duration,
-                        "room_id": occurrence.event.classroom.room_id,
-                    },
-                    "course": {
-                        "name": occurrence.event.classroom.course.name,
-                        "teacher": str(occurrence.event.classroom.course.teacher),
-                        "students": StudentPictureSerializer(
-                            occurrence.event.classroom.course.students.all(),
-                            many=True,
-                            context={"request": request},
-                        ).data
-                        if include_students
-                        else [],
-                    },
-                    "color": occurrence.event.color,
-                    "rule": recur_rule,
-                    "end_recurring_period": recur_period_end,
-                    "created_by": str(occurrence.event.created_by),
-                    "cancelled": occurrence.cancelled,
-                }
+
+    return Response(response_data)
+
+
+def _api_sync_occurrences(
+    request, start, end, calendar_id, sync_token, tz, include_students=False
+):
+    """
+    Returns what changed in a calendar since ``sync_token`` was handed out.
+
+    Clients drop the occurrences of the ``changed`` and ``deleted`` events and
+    add the returned ``occurrences``, which are those of the changed events
+    between ``start`` and ``end``. Without a token, or with one older than
+    the tombstones are kept, every occurrence is returned with ``full`` set
+    and clients replace all of theirs.
+    """
+    if not start or not end:
+        raise ValueError("Start and end datetime parameters are required")
+
+    # Taken before anything is read, so that nothing written meanwhile is missed
+    now = timezone.now()
+    start, end, current_tz = _parse_range(start, end, tz)
+    calendar = Calendar.objects.get(id=calendar_id)
+    events = _get_calendar_events(calendar_id, include_students)
+
+    since = _parse_sync_token(sync_token) if sync_token else None
+    full = since is None or since < now - datetime.timedelta(
+        days=settings.SYNC_TOMBSTONE_DAYS
+    )
+    changed = []
+    deleted = []
+    if not full:
+        # Rows saved right before the previous sync may have committed after it
+        since -= SYNC_TOKEN_OVERLAP
+        events = events.filter(
+            Q(date_modified__gt=since) | Q(occurrence__updated_on__gt=since)
+        ).distinct()
+        changed = list(events.values_list("id", flat=True))
+        deleted = list(
+            EventTombstone.objects.filter(calendar=calendar, deleted_on__gt=since)
+            .exclude(event_id__in=calendar.events.values("id"))
+            .values_list("event_id", flat=True)
+            .distinct()
+        )
+
+    occurrences = []
+    if full or changed:
+        offsets = get_offset_table(current_tz, start, end) if current_tz else None
+        events = _filter_events_between(events, start, end)
+        for event, occurrence in _get_occurrences_between(events, start, end):
+            occurrences.append(
+                _occurrence_data(request, event, occurrence, offsets, include_students)
             )
 
+    return {
+        "sync_token": _make_sync_token(now),
+        "full": full,
+        "changed": changed,
+        "deleted": deleted,
+        "occurrences": occurrences,
+    }
+
+
+def _make_sync_token(moment):
+    return str((moment - SYNC_TOKEN_EPOCH) // datetime.timedelta(microseconds=1))
+
+
+def _parse_sync_token(sync_token):
+    try:
+        return SYNC_TOKEN_EPOCH + datetime.timedelta(microseconds=int(sync_token))
+    except (OverflowError, ValueError):
+        raise ValueError("Invalid sync token")
+
+
+@swagger_auto_schema(
+    method="GET",
+    manual_parameters=[
+        openapi.Parameter("calendar_id", openapi.IN_PATH, type=openapi.TYPE_STRING),
+        openapi.Parameter("start", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter("end", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter("duration", openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        openapi.Parameter("course_id", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter("timezone", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+    ],
+)
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def api_free_slots(request, calendar_id, **kwargs):
+    start = request.query_params.get("start")
+    end = request.query_params.get("end")
+    duration = request.query_params.get("duration", 60)
+    course_id = request.query_params.get("course_id")
+    tz = request.query_params.get("timezone")
+
+    try:
+        response_data = _api_free_slots(
+            start, end, duration, calendar_id, course_id, tz
+        )
+    except ValueError as e:
+        return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except (Calendar.DoesNotExist, Course.DoesNotExist) as e:
+        return Response({"message": str(e)}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return Response(
+            {"message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    return Response(response_data)
+
+
+def _api_free_slots(start, end, duration, calendar_id, course_id, tz):
+    """
+    Returns the gaps of at least ``duration`` minutes between ``start`` and
+    ``end`` in a calendar, and in the calendars of ``course_id`` if given, where
+    a class of that course can be scheduled.
+    """
+    if not start or not end:
+        raise ValueError("Start and end datetime parameters are required")
+
+    start, end, current_tz = _parse_range(start, end, tz)
+    duration = datetime.timedelta(minutes=int(duration))
+    if duration <= datetime.timedelta(0):
+        raise ValueError("Duration must be a positive number of minutes")
+    if end - start > datetime.timedelta(days=MAX_FREE_SLOTS_DAYS):
+        raise ValueError(
+            "Free slots can be looked up {} days at a time".format(MAX_FREE_SLOTS_DAYS)
+        )
+
+    calendar = Calendar.objects.get(id=calendar_id)
+    calendar_ids = {calendar.id}
+    if course_id:
+        calendar_ids |= get_course_calendar_ids(Course.objects.get(id=course_id))
+
+    occurrences = get_scheduled_occurrences(
+        get_calendar_events(calendar_ids), start, end
+    )
+    offsets = get_offset_table(current_tz, start, end) if current_tz else None
+    response_data = []
+    for slot_start, slot_end in free_slots(
+        [(occ.start, occ.end) for occ in occurrences], start, end, duration
+    ):
+        if offsets:
+            slot_start = offsets.to_local(slot_start)
+            slot_end = offsets.to_local(slot_end)
+        response_data.append(
+            {"start": isoformat(slot_start), "end": isoformat(slot_end)}
+        )
     return response_data
 
 
+@swagger_auto_schema(
+    method="POST",
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            "user_ids": openapi.Schema(
+                type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)
+            ),
+            "start": openapi.Schema(type=openapi.TYPE_STRING),
+            "end": openapi.Schema(type=openapi.TYPE_STRING),
+            "duration": openapi.Schema(
+                type=openapi.TYPE_NUMBER, description="duration in minutes"
+            ),
+            "timezone": openapi.Schema(type=openapi.TYPE_STRING),
+        },
+        required=["user_ids", "start", "end"],
+    ),
+)
+@api_view(["POST"])
+@permission_classes([permissions.IsAuthenticated])
+def api_free_busy(request, **kwargs):
+    user_ids = request.data.get("user_ids")
+    start = request.data.get("start")
+    end = request.data.get("end")
+    duration = request.data.get("duration", 60)
+    tz = request.data.get("timezone")
+
+    try:
+        response_data = _api_free_busy(user_ids, start, end, duration, tz)
+    except ValueError as e:
+        return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response(
+            {"message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    return Response(response_data)
+
+
+def _api_free_busy(user_ids, start, end, duration, tz):
+    """
+    Returns the busy intervals of every user between ``start`` and ``end``,
+    and the slots of at least ``duration`` minutes where all of them are free.
+    """
+    if not start or not end:
+        raise ValueError("Start and end datetime parameters are required")
+    if not isinstance(user_ids, list) or not user_ids:
+        raise ValueError("A list of user ids is required")
+    if len(user_ids) > MAX_FREE_BUSY_USERS:
+        raise ValueError(
+            "At most {} users can be looked up at a time".format(MAX_FREE_BUSY_USERS)
+        )
+    invalid = [user_id for user_id in user_ids if not is_valid_uuid(user_id)]
+    if invalid:
+        raise ValueError("Invalid user ids: {}".format(", ".join(map(str, invalid))))
+
+    start, end, current_tz = _parse_range(start, end, tz)
+    duration = datetime.timedelta(minutes=int(duration))
+    if duration <= datetime.timedelta(0):
+        raise ValueError("Duration must be a positive number of minutes")
+    if end - start > datetime.timedelta(days=MAX_FREE_SLOTS_DAYS):
+        raise ValueError(
+            "Free slots can be looked up {} days at a time".format(MAX_FREE_SLOTS_DAYS)
+        )
+
+    calendars = dict(
+        User.objects.filter(id__in=user_ids).values_list("id", "calendar_id")
+    )
+    missing = {str(user_id) for user_id in user_ids} - set(map(str, calendars))
+    if missing:
+        raise ValueError("Unknown users: {}".format(", ".join(sorted(missing))))
+
+    busy = get_busy_intervals(
+        [calendar_id for calendar_id in calendars.values() if calendar_id], start, end,
+    )
+    offsets = get_offset_table(current_tz, start, end) if current_tz else None
+
+    def interval_data(interval_start, interval_end):
+        if offsets:
+            interval_start = offsets.to_local(interval_start)
+            interval_end = offsets.to_local(interval_end)
+        return {"start": isoformat(interval_start), "end": isoformat(interval_end)}
+
+    users_busy = {}
+    for user_id, calendar_id in calendars.items():
+        users_busy[str(user_id)] = [
+            interval_data(*interval) for interval in busy.get(calendar_id, [])
+        ]
+    # Each calendar's intervals are already merged and sorted, the union of
+    # all of them is where somebody is busy
+    free = free_slots(
+        [interval for intervals in busy.values() for interval in intervals],
+        start,
+        end,
+        duration,
+    )
+    return {
+        "busy": users_busy,
+        "free": [interval_data(*interval) for interval in free],
+    }
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def api_cache_stats(request, **kwargs):
+    """
+    Returns the hits and misses of the rrule and rule params caches of the
+    process which answered, for staff to watch their efficiency. The caches
+    are per process, so each worker answers with its own.
+    """
+    return Response(
+        {
+            "pid": os.getpid(),
+            "rrules": rrule_cache.info(),
+            "rule_params": params_cache.info(),
+        }
+    )
+
+
+@swagger_auto_schema(
+    method="GET",
+    manual_parameters=[
+        openapi.Parameter("calendar_id", openapi.IN_PATH, type=openapi.TYPE_STRING)
+    ],
+)
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def api_calendar_feed_url(request, calendar_id, **kwargs):
+    """
+    Returns the URL calendar apps can subscribe to for a user's own calendar.
+    """
+    if str(request.user.calendar_id) != str(calendar_id) and not request.user.is_staff:
+        return Response(
+            {"message": "Feeds are only given out for your own calendar"},
+            status=status.HTTP_403_FORBIDDEN,
+        )
+    if not Calendar.objects.filter(id=calendar_id).exists():
+        return Response(
+            {"message": "Calendar matching query does not exist."},
+            status=status.HTTP_404_NOT_FOUND,
+        )
+
+    url = reverse(
+        "timetable-api:api_calendar_feed",
+        kwargs={
+            "version": kwargs.get("version", "v1"),
+            "token": make_feed_token(calendar_id),
+        },
+    )
+    return Response({"url": request.build_absolute_uri(url)})
+
+
+def calendar_feed(request, token, **kwargs):
+    """
+    Serves the iCalendar feed of the calendar a token was made for.
+
+    Calendar apps poll feeds often, so while the calendar's version is
+    unchanged they are answered with a 304 or the cached feed, without
+    touching the database.
+    """
+    calendar_id = parse_feed_token(token)
+    if calendar_id is None:
+        raise Http404("Invalid feed token")
+
+    etag, last_modified = get_validators([("calendar", calendar_id)], "ics")
+    response = not_modified_response(request, etag, last_modified)
+    if response is not None:
+        return response
+
+    cache_key = FEED_CACHE_KEY.format(calendar_id, etag.strip('"'))
+    content = cache.get(cache_key)
+    if content is not None:
+        response = HttpResponse(content, content_type=FEED_CONTENT_TYPE)
+    else:
+        calendar = Calendar.objects.filter(id=calendar_id).first()
+        if calendar is None:
+            raise Http404("Calendar matching query does not exist.")
+        response = StreamingHttpResponse(
+            _cache_chunks(cache_key, iter_calendar_feed(calendar)),
+            content_type=FEED_CONTENT_TYPE,
+        )
+    return set_validators(response, etag, last_modified)
+
+
+def _cache_chunks(cache_key, chunks):
+    """
+    Yields ``chunks``, and caches them once all were sent.
+    """
+    content = []
+    for chunk in chunks:
+        content.append(chunk)
+        yield chunk
+    # The key holds the version, an outdated feed is never served from it
+    cache.set(cache_key, b"".join(content), FEED_CACHE_TIMEOUT)
+
+
 @swagger_auto_schema(
     method="POST",
     request_body=openapi.Schema(
@@ -227,7 +786,10 @@ def _api_move_or_resize_by_code(user, occurrence_id, existed, delta, resize, eve
     response_data = {}
 
     if existed:
-        occurrence = Occurrence.objects.get(id=occurrence_id)
+        event_id, original_start = decode_occurrence_key(occurrence_id)
+        occurrence = Occurrence.objects.get(
+            event_id=event_id, original_start=original_start
+        )
         occurrence.end += delta
         if not resize:
             occurrence.start += delta
@@ -245,12 +807,106 @@ def _api_move_or_resize_by_code(user, occurrence_id, existed, delta, resize, eve
         event.occurrence_set.all().update(
             original_start=F("original_start") + dts,
             original_end=F("original_end") + dte,
+            updated_on=timezone.now(),
         )
+        if settings.OCCURRENCE_INDEX_ENABLED:
+            # update() skips the signals which keep the index up to date
+            OccurrenceIndex.objects.rebuild_for_event(event)
         response_data["status"] = "OK"
 
     return response_data
 
 
+@swagger_auto_schema(
+    method="POST",
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            "action": openapi.Schema(type=openapi.TYPE_STRING, enum=BULK_ACTIONS),
+            "delta": openapi.Schema(
+                type=openapi.TYPE_NUMBER, description="delta in minutes"
+            ),
+            "calendar_id": openapi.Schema(type=openapi.TYPE_STRING),
+            "course_id": openapi.Schema(type=openapi.TYPE_STRING),
+            "event_ids": openapi.Schema(
+                type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_NUMBER)
+            ),
+            "start": openapi.Schema(type=openapi.TYPE_STRING),
+            "end": openapi.Schema(type=openapi.TYPE_STRING),
+            "timezone": openapi.Schema(type=openapi.TYPE_STRING),
+        },
+        required=["action"],
+    ),
+)
+@api_view(["POST"])
+@permission_classes([permissions.IsAuthenticated, IsOwnerOrReadOnly])
+def api_bulk_change(request, **kwargs):
+    """
+    Moves, resizes or cancels the occurrences between start and end of the
+    events of a calendar, a course or a list of events. Without start and end
+    whole events are moved or resized.
+    """
+    action = request.data.get("action")
+    delta = request.data.get("delta", 0)
+    calendar_id = request.data.get("calendar_id")
+    course_id = request.data.get("course_id")
+    event_ids = request.data.get("event_ids")
+    start = request.data.get("start")
+    end = request.data.get("end")
+    tz = request.data.get("timezone")
+
+    try:
+        response_data = _api_bulk_change(
+            action, delta, calendar_id, course_id, event_ids, start, end, tz
+        )
+    except ValueError as e:
+        return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response(
+            {"message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    return Response(response_data)
+
+
+def _api_bulk_change(action, delta, calendar_id, course_id, event_ids, start, end, tz):
+    if not (calendar_id or course_id or event_ids):
+        raise ValueError("A calendar_id, course_id or event_ids parameter is required")
+    if bool(start) != bool(end):
+        raise ValueError("Start and end parameters go together")
+
+    events = Event.objects.all()
+    if calendar_id:
+        events = events.filter(calendars__id=calendar_id)
+    if course_id:
+        if not is_valid_uuid(course_id):
+            raise ValueError("Invalid course_id")
+        events = events.filter(classroom__course_id=course_id)
+    if event_ids:
+        events = events.filter(pk__in=event_ids)
+
+    if start:
+        start, end, _ = _parse_range(start, end, tz)
+        if not start < end <= start + datetime.timedelta(days=MAX_BULK_CHANGE_DAYS):
+            raise ValueError(
+                "The range must be at most {} days long".format(MAX_BULK_CHANGE_DAYS)
+            )
+
+    event_ids, updated, created = bulk_change(
+        events.distinct(),
+        action,
+        datetime.timedelta(minutes=int(delta)),
+        start or None,
+        end or None,
+    )
+    return {
+        "status": "OK",
+        "events": len(event_ids),
+        "updated": updated,
+        "created": created,
+    }
+
+
 @swagger_auto_schema(
     method="POST",
     request_body=openapi.Schema(
@@ -276,7 +932,7 @@ def api_create_event(request, **kwargs):
     calendar_id = request.data.get("calendar_id")
     rule_id = request.data.get("rule_id", None)
     end_recurring_period = request.data.get("end_recurring_period", None)
-    color = request.data.get("color", None)
+    color = request.data.get("color") or ""
 
     try:
         if not start or not end:
@@ -291,8 +947,10 @@ def api_create_event(request, **kwargs):
         rule = None
         if rule_id:
             rule = Rule.objects.filter(id=rule_id).first()
+        if end_recurring_period:
+            end_recurring_period = dateutil.parser.parse(end_recurring_period)
 
-        event = Event.objects.create(
+        event = Event(
             start=start,
             end=end,
             classroom=classroom,
@@ -300,10 +958,23 @@ def api_create_event(request, **kwargs):
             end_recurring_period=end_recurring_period,
             color=color,
         )
+        check_conflicts(
+            event, get_course_calendar_ids(classroom.course) | {calendar.id}
+        )
+        event.save()
         event.calendars.add(calendar)
 
         return Response(EventSerializer(instance=event).data)
 
+    except SchedulingConflict as e:
+        return Response(
+            {
+                "message": str(e),
+                "class": e.__class__.__name__,
+                "conflicts": e.as_data(),
+            },
+            status=status.HTTP_409_CONFLICT,
+        )
     except (ValueError, Classroom.DoesNotExist, Calendar.DoesNotExist) as e:
         return Response(
             {"message": str(e), "class": e.__class__.__name__},
@@ -0,0 +1,101 @@
+import bisect
+from collections import defaultdict
+import pytz
+from django.apps import apps
+from django.utils import timezone
+from apps.core.versions import get_versions
+
+BLACKOUTS_VERSION = ("blackouts", "all")
+
+# This process' copy of the blackouts, see get_blackout_table
+_table = (None, ([], {}))
+
+
+class BlackoutSet:
+    """
+    The timespans during which no class of an event is held. Occurrences
+    starting within one are left out when the event is expanded, instead of
+    being persisted as cancelled.
+
+    The timespans are kept merged and sorted, so checking a start is a
+    bisection.
+    """
+
+    def __init__(self, intervals=()):
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    def __bool__(self):
+        return bool(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def __contains__(self, moment):
+        if not self.starts:
+            return False
+        if timezone.is_naive(moment):
+            moment = pytz.utc.localize(moment)
+        index = bisect.bisect_right(self.starts, moment) - 1
+        return index >= 0 and moment < self.ends[index]
+
+
+NO_BLACKOUTS = BlackoutSet()
+
+
+def get_blackout_table():
+    """
+    Returns the ``(start, end)`` of the school's blackouts, and those of each
+    level keyed by level id.
+
+    Blackouts are few and rarely change, so every process keeps them all and
+    only reads them again when their version was bumped.
+    """
+    global _table
+    version = get_versions([BLACKOUTS_VERSION])[BLACKOUTS_VERSION][0]
+    if _table[0] != version:
+        Blackout = apps.get_model("schools", "Blackout")
+        school, levels = [], defaultdict(list)
+        for level_id, start, end in Blackout.objects.values_list(
+            "level_id", "start", "end"
+        ):
+            if level_id is None:
+                school.append((start, end))
+            else:
+                levels[level_id].append((start, end))
+        _table = (version, (school, dict(levels)))
+    return _table[1]
+
+
+def load_blackouts(events):
+    """
+    Sets the BlackoutSet of every event in ``events``, the school's blackouts
+    and those of the levels of its course, with at most one query for all of
+    them.
+    """
+    school, levels = get_blackout_table()
+    levels_by_classroom = defaultdict(list)
+    if levels:
+        Course = apps.get_model("schools", "Course")
+        for classroom_id, level_id in Course.levels.through.objects.filter(
+            level_id__in=list(levels),
+            course__classrooms__in={event.classroom_id for event in events},
+        ).values_list("course__classrooms", "level_id"):
+            levels_by_classroom[classroom_id].append(level_id)
+
+    # Events of courses with the same levels share their set
+    sets = {(): BlackoutSet(school) if school else NO_BLACKOUTS}
+    for event in events:
+        level_ids = tuple(sorted(levels_by_classroom[event.classroom_id]))
+        if level_ids not in sets:
+            intervals = list(school)
+            for level_id in level_ids:
+                intervals += levels[level_id]
+            sets[level_ids] = BlackoutSet(intervals)
+        event._blackouts = sets[level_ids]
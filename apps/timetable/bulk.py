@@ -0,0 +1,120 @@
+import datetime
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .conflicts import get_scheduled_occurrences
+from .models import Event, Occurrence, OccurrenceIndex
+from .models.events import bump_event_versions, rrule_cache
+
+BULK_ACTIONS = ("move", "resize", "cancel")
+
+
+def get_deltas(action, delta):
+    """
+    Returns how much an action shifts the start and the end of occurrences.
+    """
+    if action == "move":
+        return delta, delta
+    if action == "resize":
+        return datetime.timedelta(0), delta
+    return datetime.timedelta(0), datetime.timedelta(0)
+
+
+def change_occurrences(events, start, end, action, delta):
+    """
+    Moves, resizes or cancels the occurrences of ``events`` between ``start``
+    and ``end``, except the cancelled ones. Persisted occurrences are changed
+    with a single UPDATE and the generated ones persisted with a single
+    INSERT.
+    """
+    occurrences = get_scheduled_occurrences(
+        events.select_related("rule", "classroom"), start, end
+    )
+    start_delta, end_delta = get_deltas(action, delta)
+    if action == "cancel":
+        changes = {"cancelled": True}
+    else:
+        changes = {"start": F("start") + start_delta, "end": F("end") + end_delta}
+
+    updated = Occurrence.objects.filter(
+        pk__in=[occ.pk for occ in occurrences if occ.pk is not None]
+    ).update(updated_on=timezone.now(), **changes)
+    # bulk_create skips Occurrence.save, which fills in the classroom defaults
+    created = Occurrence.objects.bulk_create(
+        Occurrence(
+            event=occ.event,
+            name=occ.name,
+            description=occ.description,
+            start=occ.start + start_delta,
+            end=occ.end + end_delta,
+            original_start=occ.original_start,
+            original_end=occ.original_end,
+            cancelled=action == "cancel",
+        )
+        for occ in occurrences
+        if occ.pk is None
+    )
+    return {occ.event_id for occ in occurrences}, updated, len(created)
+
+
+def change_series(events, action, delta):
+    """
+    Moves or resizes ``events``, whole series, shifting the original times
+    of their persisted occurrences along like moving a single event does.
+    Their effective dates are recomputed and written with a single UPDATE.
+    """
+    if action == "cancel":
+        raise ValueError("Only occurrences between two dates can be cancelled")
+    start_delta, end_delta = get_deltas(action, delta)
+    now = timezone.now()
+    events = list(events.select_related("rule"))
+    for event in events:
+        event.start += start_delta
+        event.end += end_delta
+        bounds = event.get_effective_bounds()
+        event.effective_start_date, event.effective_end_date = bounds
+        event.date_modified = now
+
+    Event.objects.bulk_update(
+        events,
+        ["start", "end", "effective_start_date", "effective_end_date", "date_modified"],
+    )
+    updated = Occurrence.objects.filter(event__in=events).update(
+        original_start=F("original_start") + start_delta,
+        original_end=F("original_end") + end_delta,
+        updated_on=now,
+    )
+    return {event.pk for event in events}, updated, 0
+
+
+def bulk_change(events, action, delta=datetime.timedelta(0), start=None, end=None):
+    """
+    Applies ``action``, one of BULK_ACTIONS, to the occurrences of ``events``
+    between ``start`` and ``end``, or to the whole events when no range is
+    given, in a single transaction. ``delta`` is how much the occurrences are
+    moved or resized by.
+
+    Returns the ids of the changed events and the numbers of updated and
+    created occurrences.
+    """
+    if action not in BULK_ACTIONS:
+        raise ValueError("Unknown action {!r}".format(action))
+    if action != "cancel" and not delta:
+        raise ValueError("Moving or resizing needs a delta")
+
+    with transaction.atomic():
+        if start is not None and end is not None:
+            result = change_occurrences(events, start, end, action, delta)
+        else:
+            result = change_series(events, action, delta)
+
+        # Updates and bulk inserts skip the signals keeping caches and the
+        # occurrence index up to date
+        event_ids = result[0]
+        rrule_cache.invalidate(lambda key: key[0] in event_ids)
+        bump_event_versions(event_ids)
+        if settings.OCCURRENCE_INDEX_ENABLED:
+            for event in Event.objects.filter(pk__in=event_ids).select_related("rule"):
+                OccurrenceIndex.objects.rebuild_for_event(event)
+    return result
@@ -0,0 +1,256 @@
+import datetime
+import heapq
+from collections import defaultdict
+from operator import itemgetter
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Q
+from .models import Event, OccurrenceIndex
+from .utils import EventListManager, isoformat
+
+
+class SchedulingConflict(ValueError):
+    """
+    Raised when an event would overlap occurrences already scheduled on the
+    calendars it was checked against. ``conflicts`` holds
+    ``(occurrence, conflicting occurrence)`` pairs.
+    """
+
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__(
+            "The event overlaps {} scheduled occurrence(s)".format(len(conflicts))
+        )
+
+    def as_data(self):
+        return [
+            {
+                "start": isoformat(occurrence.start),
+                "end": isoformat(occurrence.end),
+                "event_id": other.event.id,
+                "classroom": other.event.classroom.name,
+                "conflicting_start": isoformat(other.start),
+                "conflicting_end": isoformat(other.end),
+            }
+            for occurrence, other in self.conflicts
+        ]
+
+
+def merge_intervals(intervals):
+    """
+    Returns the union of ``(start, end)`` intervals as a sorted list of
+    disjoint intervals. Touching intervals are merged.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def free_slots(busy, start, end, duration):
+    """
+    Returns the gaps of at least ``duration`` between ``start`` and ``end``
+    left by the ``(start, end)`` intervals of ``busy``.
+    """
+    slots = []
+    cursor = start
+    for busy_start, busy_end in merge_intervals(busy):
+        if busy_end <= cursor:
+            continue
+        if busy_start >= end:
+            break
+        if busy_start - cursor >= duration:
+            slots.append((cursor, busy_start))
+        cursor = max(cursor, busy_end)
+    if end - cursor >= duration:
+        slots.append((cursor, end))
+    return slots
+
+
+def find_overlaps(candidates, scheduled):
+    """
+    Returns the ``(candidate, scheduled)`` pairs of items whose intervals
+    overlap, given two lists of ``(start, end, item)``.
+
+    Both lists are swept once in start order, keeping the scheduled intervals
+    which are still running in a heap keyed by their end, so the cost is
+    O((n + m) log m + k) instead of comparing every pair.
+    """
+    candidates = sorted(candidates, key=itemgetter(0, 1))
+    scheduled = sorted(scheduled, key=itemgetter(0, 1))
+    overlaps = []
+    running = []
+    position = 0
+    for start, end, item in candidates:
+        while position < len(scheduled) and scheduled[position][0] < end:
+            heapq.heappush(running, (scheduled[position][1], position))
+            position += 1
+        # Candidates come in start order, what ended before this one started
+        # can't overlap the next ones either
+        while running and running[0][0] <= start:
+            heapq.heappop(running)
+        for _, index in sorted(running, key=itemgetter(1)):
+            # A shorter candidate may end before intervals pushed by an
+            # earlier, longer one start
+            if scheduled[index][0] < end:
+                overlaps.append((item, scheduled[index][2]))
+    return overlaps
+
+
+def get_conflict_window(event):
+    """
+    Returns the timespan an event occupies, limited to CONFLICT_HORIZON_DAYS
+    for events recurring forever, or None if it never occurs.
+    """
+    start, end = event.get_effective_bounds()
+    if start is None:
+        return None
+    if end is None:
+        end = start + datetime.timedelta(days=settings.CONFLICT_HORIZON_DAYS)
+    return start, end
+
+
+def get_scheduled_occurrences(events, start, end):
+    """
+    Returns the occurrences of ``events`` between ``start`` and ``end``,
+    except the cancelled ones.
+    """
+    events = events.filter(effective_start_date__lt=end).filter(
+        Q(effective_end_date__gt=start) | Q(effective_end_date__isnull=True)
+    )
+    if OccurrenceIndex.objects.covers(start, end):
+        occurrences = OccurrenceIndex.objects.occurrences_between(events, start, end)
+    else:
+        occurrences = EventListManager(events).occurrences_between(start, end)
+    return [occ for _, occ in occurrences if not occ.cancelled]
+
+
+def get_calendar_events(calendar_ids):
+    return (
+        Event.objects.filter(calendars__in=calendar_ids)
+        .distinct()
+        .select_related("rule", "classroom")
+    )
+
+
+def get_calendar_occurrences(calendar_ids, start, end):
+    """
+    Returns the occurrences of the calendars in ``calendar_ids`` between
+    ``start`` and ``end``, except the cancelled ones, keyed by calendar id.
+
+    The events of all the calendars are expanded in one pass, so an event on
+    many of them, like a class on every student's calendar, is expanded once.
+    """
+    calendar_ids = set(calendar_ids)
+    calendars_by_event = defaultdict(list)
+    for event_id, calendar_id in Event.calendars.through.objects.filter(
+        calendar_id__in=calendar_ids
+    ).values_list("event_id", "calendar_id"):
+        calendars_by_event[event_id].append(calendar_id)
+
+    occurrences = {calendar_id: [] for calendar_id in calendar_ids}
+    events = get_calendar_events(calendar_ids)
+    for occ in get_scheduled_occurrences(events, start, end):
+        for calendar_id in calendars_by_event[occ.event_id]:
+            occurrences[calendar_id].append(occ)
+    return occurrences
+
+
+def get_busy_intervals(calendar_ids, start, end):
+    """
+    Returns the merged busy intervals of the calendars in ``calendar_ids``
+    between ``start`` and ``end``, keyed by calendar id.
+    """
+    busy = {}
+    for calendar_id, occurrences in get_calendar_occurrences(
+        calendar_ids, start, end
+    ).items():
+        busy[calendar_id] = merge_intervals(
+            (max(occ.start, start), min(occ.end, end))
+            for occ in occurrences
+            if occ.end > start and occ.start < end
+        )
+    return busy
+
+
+def get_courses_calendar_ids(courses):
+    """
+    Returns the ids of the calendars a class of each course has to fit in,
+    keyed by course id: its teachers', and those the course's classes are
+    already on, i.e. its students'.
+    """
+    Course = apps.get_model("schools", "Course")
+    course_ids = [course.pk for course in courses]
+    calendar_ids = {course_id: set() for course_id in course_ids}
+    rows = list(
+        Event.calendars.through.objects.filter(
+            event__classroom__course_id__in=course_ids
+        ).values_list("event__classroom__course_id", "calendar_id")
+    )
+    rows += Course.objects.filter(pk__in=course_ids).values_list(
+        "pk", "teacher__user__calendar_id"
+    )
+    rows += Course.assistant_teachers.through.objects.filter(
+        course_id__in=course_ids
+    ).values_list("course_id", "teacher__user__calendar_id")
+    for course_id, calendar_id in rows:
+        if calendar_id is not None:
+            calendar_ids[course_id].add(calendar_id)
+    return calendar_ids
+
+
+def get_course_calendar_ids(course):
+    return get_courses_calendar_ids([course])[course.pk]
+
+
+def get_candidate_occurrences(event):
+    """
+    Expands ``event``, saved or not, over the timespan it occupies, and
+    returns its occurrences as ``(start, end, occurrence)``.
+    """
+    window = get_conflict_window(event)
+    if window is None:
+        return []
+    # Expanded in UTC, like the occurrence index
+    start, end = window
+    if event.pk is None:
+        occurrences = event.get_occurrences(start, end, persisted_occurrences=[])
+    else:
+        occurrences = event.get_occurrences(start, end)
+    return [(occ.start, occ.end, occ) for occ in occurrences if not occ.cancelled]
+
+
+def find_conflicts(event, calendar_ids):
+    """
+    Expands ``event``, saved or not, and returns the ``(occurrence,
+    conflicting occurrence)`` pairs it overlaps among the events of the
+    calendars in ``calendar_ids``.
+    """
+    candidates = get_candidate_occurrences(event)
+    if not candidates:
+        return []
+
+    events = get_calendar_events(calendar_ids)
+    if event.pk is not None:
+        events = events.exclude(pk=event.pk)
+    start = min(candidate_start for candidate_start, _, _ in candidates)
+    end = max(candidate_end for _, candidate_end, _ in candidates)
+    scheduled = [
+        (occ.start, occ.end, occ)
+        for occ in get_scheduled_occurrences(events, start, end)
+    ]
+    return find_overlaps(candidates, scheduled)
+
+
+def check_conflicts(event, calendar_ids):
+    """
+    Raises SchedulingConflict if ``event`` overlaps any event of the calendars
+    in ``calendar_ids``.
+    """
+    conflicts = find_conflicts(event, calendar_ids)
+    if conflicts:
+        raise SchedulingConflict(conflicts)
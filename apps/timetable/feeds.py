@@ -0,0 +1,207 @@
+from itertools import groupby
+from operator import attrgetter
+from urllib.parse import urlparse
+import pytz
+from django.conf import settings
+from django.core import signing
+from icalendar import Calendar as ICalendar, Event as IEvent, vRecur
+from .blackouts import load_blackouts
+from .models import Occurrence, OccurrenceIndex
+
+FEED_TOKEN_SALT = "timetable.feed"
+FEED_PRODID = "-//{}//Timetable//EN".format(settings.SITE_NAME)
+FEED_END = b"END:VCALENDAR\r\n"
+# Events read at once, to load their blackouts together
+FEED_CHUNK_SIZE = 100
+WEEKDAY_CODES = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+# dateutil rrule params and their iCalendar RRULE parts, byeaster has none
+RRULE_PARTS = {
+    "count": "COUNT",
+    "interval": "INTERVAL",
+    "bysetpos": "BYSETPOS",
+    "bymonth": "BYMONTH",
+    "bymonthday": "BYMONTHDAY",
+    "byyearday": "BYYEARDAY",
+    "byweekno": "BYWEEKNO",
+    "byweekday": "BYDAY",
+    "byhour": "BYHOUR",
+    "byminute": "BYMINUTE",
+    "bysecond": "BYSECOND",
+}
+
+
+def make_feed_token(calendar_id):
+    """
+    Returns the token of a calendar's feed. Tokens are signed, so serving a
+    feed doesn't need a database lookup to tell whether the token is valid.
+    """
+    return signing.Signer(salt=FEED_TOKEN_SALT).sign(str(calendar_id))
+
+
+def parse_feed_token(token):
+    """
+    Returns the calendar id of a feed token, None if it isn't valid.
+    """
+    try:
+        return int(signing.Signer(salt=FEED_TOKEN_SALT).unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def _weekday_code(weekday):
+    if isinstance(weekday, int):
+        return WEEKDAY_CODES[weekday]
+    code = WEEKDAY_CODES[weekday.weekday]
+    if weekday.n:
+        return "{:+d}{}".format(weekday.n, code)
+    return code
+
+
+def _uid(event):
+    domain = urlparse(settings.HOST or "").hostname or "darasa"
+    return "event-{}@{}".format(event.id, domain)
+
+
+def get_recurrence(event):
+    """
+    Returns the RRULE of a recurring event, or None if its rule has params
+    iCalendar can't express.
+    """
+    recurrence = {"FREQ": event.rule.frequency}
+    for param, value in event._event_params().items():
+        if param not in RRULE_PARTS:
+            return None
+        values = value if isinstance(value, (list, tuple)) else [value]
+        if param == "byweekday":
+            values = [_weekday_code(weekday) for weekday in values]
+        recurrence[RRULE_PARTS[param]] = values
+
+    if event.end_recurring_period:
+        # UNTIL and COUNT can't be combined, the last start satisfies both
+        recurrence.pop("COUNT", None)
+        until = event.end_recurring_period
+        if event.effective_end_date:
+            until = event.effective_end_date - (event.end - event.start)
+        recurrence["UNTIL"] = until.astimezone(pytz.utc)
+    return vRecur(recurrence)
+
+
+def get_event_components(event, persisted_occurrences):
+    """
+    Returns the VEVENTs of an event: the event itself, with its rule as an
+    RRULE and its cancelled and blacked out occurrences as EXDATEs, followed
+    by an override for each moved occurrence, matched to the series by its
+    RECURRENCE-ID.
+    """
+    if event.effective_start_date is None:
+        # The rule never occurs
+        return []
+
+    def component(start, end, name, description):
+        vevent = IEvent()
+        vevent.add("uid", _uid(event))
+        vevent.add("dtstamp", event.date_modified.astimezone(pytz.utc))
+        vevent.add("dtstart", start.astimezone(pytz.utc))
+        vevent.add("dtend", end.astimezone(pytz.utc))
+        vevent.add("summary", name)
+        if description:
+            vevent.add("description", description)
+        return vevent
+
+    classroom = event.classroom
+    if event.rule is None:
+        if not persisted_occurrences:
+            if event.start in event.blackouts:
+                return []
+            return [
+                component(event.start, event.end, classroom.name, classroom.description)
+            ]
+        occ = persisted_occurrences[0]
+        if occ.cancelled:
+            return []
+        return [
+            component(
+                occ.start,
+                occ.end,
+                occ.name or classroom.name,
+                occ.description or classroom.description,
+            )
+        ]
+
+    series = component(event.start, event.end, classroom.name, classroom.description)
+    recurrence = get_recurrence(event)
+    if recurrence is not None:
+        series.add("rrule", recurrence)
+        # The occurrences removed by blackouts are listed, unless persisted
+        persisted_starts = {occ.original_start for occ in persisted_occurrences}
+        for blackout_start, blackout_end in event.blackouts:
+            for occ in event._get_occurrence_list(
+                blackout_start, blackout_end, skip_blackouts=False
+            ):
+                if (
+                    occ.start in event.blackouts
+                    and occ.original_start not in persisted_starts
+                ):
+                    series.add("exdate", occ.start.astimezone(pytz.utc))
+    else:
+        # Listed one by one within the horizon the occurrences are indexed for
+        start, end = OccurrenceIndex.objects.get_horizon()
+        for occ in event._get_occurrence_list(start, end):
+            series.add("rdate", occ.start.astimezone(pytz.utc))
+
+    overrides = []
+    for occ in persisted_occurrences:
+        original_start = occ.original_start.astimezone(pytz.utc)
+        if occ.cancelled:
+            series.add("exdate", original_start)
+        elif occ.moved:
+            override = component(
+                occ.start,
+                occ.end,
+                occ.name or classroom.name,
+                occ.description or classroom.description,
+            )
+            override.add("recurrence-id", original_start)
+            overrides.append(override)
+    return [series] + overrides
+
+
+def iter_calendar_feed(calendar):
+    """
+    Yields the iCalendar feed of a calendar an event at a time, reading the
+    events and their persisted occurrences as two streams ordered by event.
+    """
+    feed = ICalendar()
+    feed.add("prodid", FEED_PRODID)
+    feed.add("version", "2.0")
+    feed.add("calscale", "GREGORIAN")
+    feed.add("x-wr-calname", calendar.name)
+    yield feed.to_ical()[: -len(FEED_END)]
+
+    events = calendar.events.select_related("rule", "classroom").order_by("id")
+    occurrences = Occurrence.objects.filter(event__calendars=calendar).order_by(
+        "event_id", "original_start"
+    )
+    occurrences_by_event = groupby(occurrences.iterator(), key=attrgetter("event_id"))
+    group = next(occurrences_by_event, None)
+    for event in _iter_with_blackouts(events):
+        persisted = []
+        while group is not None and group[0] <= event.id:
+            if group[0] == event.id:
+                persisted = list(group[1])
+            group = next(occurrences_by_event, None)
+        for component in get_event_components(event, persisted):
+            yield component.to_ical()
+    yield FEED_END
+
+
+def _iter_with_blackouts(events):
+    chunk = []
+    for event in events.iterator(chunk_size=FEED_CHUNK_SIZE):
+        chunk.append(event)
+        if len(chunk) == FEED_CHUNK_SIZE:
+            load_blackouts(chunk)
+            yield from chunk
+            chunk = []
+    load_blackouts(chunk)
+    yield from chunk
@@ -0,0 +1,31 @@
+# Generated by Django 3.0.8 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccurrenceIndex',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField(verbose_name='start')),
+                ('end', models.DateTimeField(verbose_name='end')),
+                ('original_start', models.DateTimeField(verbose_name='original start')),
+                ('cancelled', models.BooleanField(default=False, verbose_name='cancelled')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='timetable.Event', verbose_name='event')),
+                ('occurrence', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='timetable.Occurrence', verbose_name='occurrence')),
+            ],
+            options={
+                'verbose_name': 'occurrence index',
+                'verbose_name_plural': 'occurrence index',
+                'index_together': {('start', 'end')},
+            },
+        ),
+    ]
@@ -0,0 +1,126 @@
+# Generated by Django 3.0.8 on 2026-10-18 10:30
+
+import datetime
+from dateutil import rrule
+from django.db import migrations, models
+from django.utils import timezone
+
+# The recurrence logic of Event and Rule as of this migration, which historical
+# models don't have
+FREQUENCIES = ["YEARLY", "MONTHLY", "WEEKLY", "DAILY", "HOURLY", "MINUTELY", "SECONDLY"]
+PARAM_ORDER = {
+    "byyearday": 1,
+    "bymonth": 1,
+    "bymonthday": 2,
+    "byweekno": 2,
+    "byweekday": 3,
+    "byhour": 4,
+    "byminute": 5,
+    "bysecond": 6,
+}
+WEEK_DAYS = {
+    "MO": rrule.MO,
+    "TU": rrule.TU,
+    "WE": rrule.WE,
+    "TH": rrule.TH,
+    "FR": rrule.FR,
+    "SA": rrule.SA,
+    "SU": rrule.SU,
+}
+
+
+def parse_value(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return WEEK_DAYS.get(str(value).upper())
+
+
+def parse_params(params):
+    parsed = {}
+    for param in params.split(";"):
+        param = param.split(":")
+        if len(param) != 2:
+            continue
+        values = [parse_value(v) for v in param[1].split(",")]
+        values = [v for v in values if v is not None]
+        parsed[param[0].lower()] = values[0] if len(values) == 1 else values
+    return parsed
+
+
+def get_event_params(event, start):
+    freq_order = FREQUENCIES.index(event.rule.frequency)
+    start_params = {
+        "byyearday": start.timetuple().tm_yday,
+        "bymonth": start.month,
+        "bymonthday": start.day,
+        "byweekno": start.isocalendar()[1],
+        "byweekday": start.weekday(),
+        "byhour": start.hour,
+        "byminute": start.minute,
+        "bysecond": start.second,
+    }
+    params = {}
+    for param, value in parse_params(event.rule.params).items():
+        # start date influences rule params
+        if PARAM_ORDER.get(param, -1) > freq_order and param in start_params:
+            sp = start_params[param]
+            if sp == value or (hasattr(value, "__iter__") and sp in value):
+                value = [sp]
+        params[param] = value
+    return params
+
+
+def get_effective_bounds(event):
+    if event.rule_id is None:
+        return event.start, event.end
+    start = timezone.make_naive(event.start, timezone.utc)
+    until = event.end_recurring_period
+    if until is not None:
+        until = timezone.make_naive(until, timezone.utc)
+    rule = rrule.rrule(
+        getattr(rrule, event.rule.frequency),
+        dtstart=start,
+        until=until,
+        **get_event_params(event, start)
+    )
+    first = rule.after(datetime.datetime.min, inc=True)
+    if first is None:
+        return None, None
+    first = timezone.make_aware(first, timezone.utc)
+    if until is None:
+        return first, None
+    last = rule.before(datetime.datetime.max, inc=True)
+    last = timezone.make_aware(last, timezone.utc)
+    return first, last + (event.end - event.start)
+
+
+def refresh_effective_dates(apps, schema_editor):
+    Event = apps.get_model("timetable", "Event")
+    for event in Event.objects.select_related("rule").iterator():
+        effective_start_date, effective_end_date = get_effective_bounds(event)
+        Event.objects.filter(pk=event.pk).update(
+            effective_start_date=effective_start_date,
+            effective_end_date=effective_end_date,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0002_occurrenceindex'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='effective_end_date',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, help_text='Empty for events which recur forever.', null=True, verbose_name='effective end date'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='effective_start_date',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='effective start date'),
+        ),
+        migrations.RunPython(refresh_effective_dates, migrations.RunPython.noop),
+    ]
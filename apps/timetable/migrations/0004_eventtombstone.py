@@ -0,0 +1,28 @@
+# Generated by Django 3.0.8 on 2026-10-18 11:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0003_auto_20261018_1030'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventTombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.IntegerField(verbose_name='event id')),
+                ('deleted_on', models.DateTimeField(auto_now_add=True, verbose_name='deleted on')),
+                ('calendar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='timetable.Calendar', verbose_name='calendar')),
+            ],
+            options={
+                'verbose_name': 'event tombstone',
+                'verbose_name_plural': 'event tombstones',
+                'index_together': {('calendar', 'deleted_on')},
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.0.8 on 2026-10-18 13:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Covers the events of calendars, looked up by calendar and joined on the
+# event. The through table is created by the calendars field, so the index is
+# added to it directly.
+CALENDAR_EVENTS_INDEX = models.Index(
+    fields=["calendar", "event"], name="timetable_calendar_event_idx"
+)
+
+
+def add_calendar_events_index(apps, schema_editor):
+    through = apps.get_model("timetable", "Event").calendars.through
+    schema_editor.add_index(through, CALENDAR_EVENTS_INDEX)
+
+
+def remove_calendar_events_index(apps, schema_editor):
+    through = apps.get_model("timetable", "Event").calendars.through
+    schema_editor.remove_index(through, CALENDAR_EVENTS_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0004_eventtombstone'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='occurrence',
+            index=models.Index(fields=['event', 'original_start', 'original_end'], name='timetable_occ_original_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='occurrence',
+            index=models.Index(fields=['event', 'start'], name='timetable_occ_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='occurrenceindex',
+            index=models.Index(fields=['event', 'start', 'end'], name='timetable_occindex_event_idx'),
+        ),
+        migrations.AlterField(
+            model_name='occurrence',
+            name='event',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='timetable.Event', verbose_name='event'),
+        ),
+        migrations.AlterField(
+            model_name='occurrenceindex',
+            name='event',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='timetable.Event', verbose_name='event'),
+        ),
+        migrations.RunPython(add_calendar_events_index, remove_calendar_events_index),
+    ]
@@ -1,3 +1,10 @@
 from .calendars import Calendar, CalendarRelation
-from .events import Event, EventRelation, Occurrence
+from .events import (
+    Event,
+    EventRelation,
+    EventTombstone,
+    Occurrence,
+    OccurrenceIndex,
+    OccurrenceRecord,
+)
 from .rules import Rule
@@ -3,15 +3,20 @@ from dateutil import rrule
 from django.conf import settings as django_settings
 from django.contrib.contenttypes import fields
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
 from django.template.defaultfilters import date
 from django.utils import timezone
 from django.utils.translation import gettext, gettext_lazy as _
 from apps.core.models import BaseModel
+from apps.core.versions import bump_versions
+from ..blackouts import load_blackouts
 from ..models.calendars import Calendar
-from ..models.rules import Rule
-from ..utils import OccurrenceReplacer
+from ..models.rules import Rule, params_cache
+from ..recurrence import SimpleRecurrence
+from ..utils import LRUCache, OccurrenceReplacer, get_offset_table
 
 freq_dict_order = {
     "YEARLY": 0,
@@ -33,6 +38,15 @@ param_dict_order = {
     "bysecond": 6,
 }
 
+# Compiled rrule objects keyed by everything they are built from, see
+# Event.get_rrule_object. Entries of other processes never go stale since a
+# change to the event or its rule changes the key; invalidating on save just
+# frees the memory early.
+rrule_cache = LRUCache(django_settings.RRULE_CACHE_SIZE)
+
+# Days of UTC offsets precomputed for the occurrences after a date
+OFFSET_TABLE_DAYS = 366
+
 
 class EventManager(models.Manager):
     def get_for_object(self, content_object, distinction="", inherit=True):
@@ -77,6 +91,19 @@ class Event(BaseModel):
         help_text=_("This date is ignored for one time only events."),
     )
     color = models.CharField(_("color"), blank=True, max_length=10)
+    # Denormalized from the recurrence on save so that events can be filtered
+    # and sorted on when they really take place, see get_effective_bounds
+    effective_start_date = models.DateTimeField(
+        _("effective start date"), null=True, blank=True, db_index=True, editable=False
+    )
+    effective_end_date = models.DateTimeField(
+        _("effective end date"),
+        null=True,
+        blank=True,
+        db_index=True,
+        editable=False,
+        help_text=_("Empty for events which recur forever."),
+    )
 
     objects = EventManager()
 
@@ -104,7 +131,19 @@ class Event(BaseModel):
     def hours(self):
         return float(self.seconds) / 3600
 
-    def get_occurrences(self, start, end, clear_prefetch=True):
+    @property
+    def blackouts(self):
+        """
+        The BlackoutSet of the event, read on first use. Callers expanding many
+        events load them all at once with ``load_blackouts``.
+        """
+        if not hasattr(self, "_blackouts"):
+            load_blackouts([self])
+        return self._blackouts
+
+    def get_occurrences(
+        self, start, end, clear_prefetch=True, persisted_occurrences=None
+    ):
         """
         >>> rule = Rule(frequency = "MONTHLY", name = "Monthly")
         >>> rule.save()
@@ -146,10 +185,15 @@ class Event(BaseModel):
         # before we call an event's get_occurrences, but allow Period
         # to override this cache clear since it already fetches all
         # occurrence_sets via prefetch_related in its get_occurrences.
-        if clear_prefetch:
-            self.occurrence_set._remove_prefetched_objects()
+        #
+        # Callers expanding many events at once (see
+        # EventListManager.occurrences_between) can pass the persisted
+        # occurrences they already fetched in bulk instead.
+        if persisted_occurrences is None:
+            if clear_prefetch:
+                self.occurrence_set._remove_prefetched_objects()
+            persisted_occurrences = self.occurrence_set.all()
 
-        persisted_occurrences = self.occurrence_set.all()
         occ_replacer = OccurrenceReplacer(persisted_occurrences)
         occurrences = self._get_occurrence_list(start, end)
         final_occurrences = []
@@ -170,6 +214,20 @@ class Event(BaseModel):
     def get_rrule_object(self, tzinfo):
         if self.rule is None:
             return
+        if self.pk is None:
+            return self._build_rrule_object(tzinfo)
+        key = (
+            self.pk,
+            self.rule.pk,
+            self.rule.frequency,
+            self.rule.params,
+            self.start,
+            self.end_recurring_period,
+            getattr(tzinfo, "zone", str(tzinfo)),
+        )
+        return rrule_cache.get_or_set(key, lambda: self._build_rrule_object(tzinfo))
+
+    def _build_rrule_object(self, tzinfo):
         params = self._event_params()
         frequency = self.rule.rrule_frequency()
         if timezone.is_naive(self.start):
@@ -186,6 +244,12 @@ class Event(BaseModel):
                 self.end_recurring_period.astimezone(tzinfo)
             ).replace(tzinfo=None)
 
+        # Plain daily, weekly and monthly rules are expanded arithmetically
+        recurrence = SimpleRecurrence.from_params(
+            self.rule.frequency, dtstart, until, params
+        )
+        if recurrence is not None:
+            return recurrence
         return rrule.rrule(frequency, dtstart=dtstart, until=until, **params)
 
     def _create_occurrence(self, start, end=None):
@@ -195,6 +259,11 @@ class Event(BaseModel):
             event=self, start=start, end=end, original_start=start, original_end=end
         )
 
+    def _create_occurrence_record(self, start, end=None):
+        if end is None:
+            end = start + (self.end - self.start)
+        return OccurrenceRecord(self, start, end)
+
     def get_occurrence(self, date):
         use_naive = timezone.is_naive(date)
         tzinfo = timezone.utc
@@ -218,11 +287,13 @@ class Event(BaseModel):
                     next_occurrence = timezone.make_naive(next_occurrence, tzinfo)
                 return self._create_occurrence(next_occurrence)
 
-    def _get_occurrence_list(self, start, end):
+    def _get_occurrence_list(self, start, end, skip_blackouts=True):
         """
         Returns a list of occurrences that fall completely or partially inside
-        the timespan defined by start (inclusive) and end (exclusive)
+        the timespan defined by start (inclusive) and end (exclusive), except
+        those starting during a blackout unless ``skip_blackouts`` is False.
         """
+        blackouts = self.blackouts if skip_blackouts else None
         if self.rule is not None:
             duration = self.end - self.start
             use_naive = timezone.is_naive(start)
@@ -238,6 +309,7 @@ class Event(BaseModel):
                 end = self.end_recurring_period
 
             start_rule = self.get_rrule_object(tzinfo)
+            offsets = get_offset_table(tzinfo, start, end)
             start = start.replace(tzinfo=None)
             if timezone.is_aware(end):
                 end = tzinfo.normalize(end).replace(tzinfo=None)
@@ -259,20 +331,26 @@ class Event(BaseModel):
             # Add the occurrences found inside timespan
             o_starts.extend(occs)
 
-            # Create the Occurrence objects for the found start dates
+            # Create the occurrence records for the found start dates
+            seen = set()
             for o_start in o_starts:
-                o_start = tzinfo.localize(o_start)
+                o_start = offsets.localize(o_start)
+                if blackouts and o_start in blackouts:
+                    continue
                 if use_naive:
                     o_start = timezone.make_naive(o_start, tzinfo)
                 o_end = o_start + duration
-                occurrence = self._create_occurrence(o_start, o_end)
-                if occurrence not in occurrences:
+                occurrence = self._create_occurrence_record(o_start, o_end)
+                if occurrence not in seen:
+                    seen.add(occurrence)
                     occurrences.append(occurrence)
             return occurrences
         else:
             # check if event is in the period
             if self.start < end and self.end > start:
-                return [self._create_occurrence(self.start)]
+                if blackouts and self.start in blackouts:
+                    return []
+                return [self._create_occurrence_record(self.start)]
             else:
                 return []
 
@@ -289,20 +367,23 @@ class Event(BaseModel):
         elif not timezone.is_naive(after):
             tzinfo = after.tzinfo
         rule = self.get_rrule_object(tzinfo)
+        blackouts = self.blackouts
         if rule is None:
-            if self.end > after:
-                yield self._create_occurrence(self.start, self.end)
+            if self.end > after and self.start not in blackouts:
+                yield self._create_occurrence_record(self.start, self.end)
             return
         date_iter = iter(rule)
         difference = self.end - self.start
-        loop_counter = 0
+        # Most callers only look a few weeks ahead, later starts fall back to
+        # pytz
+        offsets = get_offset_table(
+            tzinfo, after, after + datetime.timedelta(days=OFFSET_TABLE_DAYS)
+        )
         for o_start in date_iter:
-            o_start = tzinfo.localize(o_start)
+            o_start = offsets.localize(o_start)
             o_end = o_start + difference
-            if o_end > after:
-                yield self._create_occurrence(o_start, o_end)
-
-            loop_counter += 1
+            if o_end > after and o_start not in blackouts:
+                yield self._create_occurrence_record(o_start, o_end)
 
     def occurrences_after(self, after=None, max_occurrences=None):
         """
@@ -387,11 +468,7 @@ class Event(BaseModel):
     @property
     def effective_start(self):
         if self.pk and self.end_recurring_period:
-            occ_generator = self._occurrences_after_generator(self.start)
-            try:
-                return next(occ_generator).start
-            except StopIteration:
-                pass
+            return self.get_effective_bounds()[0]
         elif self.pk:
             return self.start
         return None
@@ -399,19 +476,46 @@ class Event(BaseModel):
     @property
     def effective_end(self):
         if self.pk and self.end_recurring_period:
-            params, empty = self.event_params
-            if empty or not self.effective_start:
-                return None
-            elif self.end_recurring_period:
-                occ = None
-                occ_generator = self._occurrences_after_generator(self.start)
-                for occ in occ_generator:
-                    pass
-                return occ.end
+            return self.get_effective_bounds()[1]
         elif self.pk:
             return datetime.datetime.max
         return None
 
+    def get_effective_bounds(self):
+        """
+        Returns the start of the first and the end of the last occurrence of
+        the event, read straight off the rrule. The end is None if the event
+        recurs forever, and both are None if the event never occurs.
+        """
+        if self.rule is None:
+            return self.start, self.end
+
+        tzinfo = timezone.utc
+        # Starts parsed from API input carry fixed offsets rather than pytz
+        # zones, those are expanded in UTC
+        if timezone.is_aware(self.start) and hasattr(self.start.tzinfo, "localize"):
+            tzinfo = self.start.tzinfo
+        rule = self.get_rrule_object(tzinfo)
+        first = rule.after(datetime.datetime.min, inc=True)
+        if first is None:
+            return None, None
+        first = tzinfo.localize(first)
+        if self.end_recurring_period is None:
+            return first, None
+        # The rrule is bounded by end_recurring_period, so this is its last date
+        last = tzinfo.localize(rule.before(datetime.datetime.max, inc=True))
+        return first, last + (self.end - self.start)
+
+    def save(self, *args, **kwargs):
+        self.effective_start_date, self.effective_end_date = self.get_effective_bounds()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | {
+                "effective_start_date",
+                "effective_end_date",
+            }
+        return super().save(*args, **kwargs)
+
 
 class EventRelationManager(models.Manager):
     """
@@ -549,7 +653,10 @@ class EventRelation(models.Model):
 
 
 class Occurrence(models.Model):
-    event = models.ForeignKey(Event, on_delete=models.CASCADE, verbose_name=_("event"))
+    # Indexed by the indexes starting with it below
+    event = models.ForeignKey(
+        Event, on_delete=models.CASCADE, verbose_name=_("event"), db_index=False
+    )
     name = models.CharField(_("name"), max_length=255, blank=True)
     description = models.TextField(_("description"), blank=True)
     start = models.DateTimeField(_("start"), db_index=True)
@@ -564,13 +671,37 @@ class Occurrence(models.Model):
         verbose_name = _("occurrence")
         verbose_name_plural = _("occurrences")
         index_together = (("start", "end"),)
+        indexes = [
+            # Persisted occurrences are matched with the generated ones by the
+            # time the rrule gave them, see OccurrenceReplacer and
+            # Event.get_occurrence, without reading the table
+            models.Index(
+                fields=["event", "original_start", "original_end"],
+                name="timetable_occ_original_idx",
+            ),
+            # and the moved ones are merged in by their new start, see
+            # Event.occurrences_after and EventListManager.occurrences_after
+            models.Index(fields=["event", "start"], name="timetable_occ_start_idx"),
+        ]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        if not self.name and self.event_id:
-            self.name = self.event.classroom.name
-        if not self.description and self.event_id:
-            self.description = self.event.classroom.description
+        # Only fall back to the classroom details when the event is already
+        # loaded, otherwise every row fetched from the database costs a query.
+        if self.event_id and Occurrence.event.is_cached(self):
+            self.set_classroom_defaults()
+
+    def set_classroom_defaults(self):
+        classroom = self.event.classroom
+        if not self.name:
+            self.name = classroom.name
+        if not self.description:
+            self.description = classroom.description or ""
+
+    def save(self, *args, **kwargs):
+        if not self.name or not self.description:
+            self.set_classroom_defaults()
+        return super().save(*args, **kwargs)
 
     def moved(self):
         return self.original_start != self.start or self.original_end != self.end
@@ -622,3 +753,397 @@ class Occurrence(models.Model):
             and self.original_start == other.original_start
             and self.original_end == other.original_end
         )
+
+
+class OccurrenceRecord:
+    """
+    A light, immutable stand-in for an Occurrence that hasn't been persisted,
+    used wherever occurrences are expanded only to be read. Records hash and
+    compare on (event, original start, original end), like OccurrenceReplacer
+    matches persisted occurrences.
+
+    Use ``to_occurrence()`` to get an Occurrence that can be saved; ``move``,
+    ``cancel`` and ``uncancel`` do so and return the persisted Occurrence.
+    """
+
+    __slots__ = ("event", "start", "end", "original_start", "original_end", "_key")
+
+    id = pk = None
+    cancelled = False
+
+    def __init__(self, event, start, end, original_start=None, original_end=None):
+        original_start = start if original_start is None else original_start
+        original_end = end if original_end is None else original_end
+        set_attribute = super().__setattr__
+        set_attribute("event", event)
+        set_attribute("start", start)
+        set_attribute("end", end)
+        set_attribute("original_start", original_start)
+        set_attribute("original_end", original_end)
+        set_attribute("_key", (event.id, original_start, original_end))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Occurrence records are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Occurrence records are immutable")
+
+    @property
+    def event_id(self):
+        return self.event.id
+
+    @property
+    def name(self):
+        return self.event.classroom.name
+
+    @property
+    def description(self):
+        return self.event.classroom.description
+
+    @property
+    def moved(self):
+        return self.original_start != self.start or self.original_end != self.end
+
+    @property
+    def seconds(self):
+        return (self.end - self.start).total_seconds()
+
+    @property
+    def minutes(self):
+        return float(self.seconds) / 60
+
+    @property
+    def hours(self):
+        return float(self.seconds) / 3600
+
+    def to_occurrence(self):
+        return Occurrence(
+            event=self.event,
+            start=self.start,
+            end=self.end,
+            original_start=self.original_start,
+            original_end=self.original_end,
+        )
+
+    def move(self, new_start, new_end):
+        occurrence = self.to_occurrence()
+        occurrence.move(new_start, new_end)
+        return occurrence
+
+    def cancel(self):
+        occurrence = self.to_occurrence()
+        occurrence.cancel()
+        return occurrence
+
+    def uncancel(self):
+        occurrence = self.to_occurrence()
+        occurrence.uncancel()
+        return occurrence
+
+    def __str__(self):
+        return gettext("%(start)s to %(end)s") % {
+            "start": date(self.start, django_settings.DATE_FORMAT),
+            "end": date(self.end, django_settings.DATE_FORMAT),
+        }
+
+    def __repr__(self):
+        return "<OccurrenceRecord: {}>".format(self)
+
+    def __lt__(self, other):
+        return self.end < other.end
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __eq__(self, other):
+        if not isinstance(other, OccurrenceRecord):
+            return NotImplemented
+        return self._key == other._key
+
+
+class OccurrenceIndexManager(models.Manager):
+    def get_horizon(self):
+        """
+        Returns the (start, end) datetimes the index is kept for, relative to now
+        """
+        now = timezone.now()
+        return (
+            now - datetime.timedelta(days=django_settings.OCCURRENCE_INDEX_PAST_DAYS),
+            now + datetime.timedelta(days=django_settings.OCCURRENCE_INDEX_FUTURE_DAYS),
+        )
+
+    def covers(self, start, end):
+        """
+        Returns True if the index is enabled and can answer queries for the
+        timespan between start and end.
+
+        The horizon is only moved forward by the periodic
+        ``extend_occurrence_index`` task, so a day of slack is kept on both
+        sides.
+        """
+        if not django_settings.OCCURRENCE_INDEX_ENABLED:
+            return False
+        horizon_start, horizon_end = self.get_horizon()
+        slack = datetime.timedelta(days=1)
+        return horizon_start + slack <= start and end <= horizon_end - slack
+
+    def rebuild_for_event(self, event):
+        """
+        Replaces the index rows of an event with a fresh expansion of its
+        occurrences within the horizon.
+        """
+        start, end = self.get_horizon()
+        rows = [
+            OccurrenceIndex(
+                event=event,
+                start=occ.start,
+                end=occ.end,
+                original_start=occ.original_start,
+                cancelled=occ.cancelled,
+                occurrence_id=occ.pk,
+            )
+            for occ in event.get_occurrences(start, end)
+        ]
+        with transaction.atomic():
+            self.filter(event=event).delete()
+            self.bulk_create(rows)
+
+    def occurrences_between(self, events, start, end):
+        """
+        Same as ``EventListManager(events).occurrences_between(start, end)`` but
+        reads the already expanded occurrences from the index.
+        """
+        events_by_id = {event.id: event for event in events}
+        rows = (
+            self.filter(event_id__in=list(events_by_id), start__lt=end, end__gt=start)
+            .select_related("occurrence")
+            .order_by("start")
+        )
+        occurrences = []
+        for row in rows:
+            event = events_by_id[row.event_id]
+            if row.occurrence is not None:
+                occ = row.occurrence
+                occ.event = event
+                occ.set_classroom_defaults()
+            else:
+                occ = event._create_occurrence_record(row.start, row.end)
+            occurrences.append((event, occ))
+        return occurrences
+
+
+class OccurrenceIndex(models.Model):
+    """
+    A materialized expansion of every event's occurrences within a rolling
+    horizon (see OCCURRENCE_INDEX_PAST_DAYS and OCCURRENCE_INDEX_FUTURE_DAYS),
+    so that timetable reads are plain indexed range scans instead of rrule
+    expansions.
+
+    Rows are rebuilt for an event whenever the event, its rule or one of its
+    persisted occurrences changes. Only maintained when
+    OCCURRENCE_INDEX_ENABLED is set.
+    """
+
+    # Indexed by the index starting with it below
+    event = models.ForeignKey(
+        Event, on_delete=models.CASCADE, verbose_name=_("event"), db_index=False
+    )
+    start = models.DateTimeField(_("start"))
+    end = models.DateTimeField(_("end"))
+    original_start = models.DateTimeField(_("original start"))
+    cancelled = models.BooleanField(_("cancelled"), default=False)
+    occurrence = models.ForeignKey(
+        Occurrence,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name=_("occurrence"),
+    )
+
+    objects = OccurrenceIndexManager()
+
+    class Meta:
+        verbose_name = _("occurrence index")
+        verbose_name_plural = _("occurrence index")
+        index_together = (("start", "end"),)
+        indexes = [
+            # The rows of the events read, see occurrences_between
+            models.Index(
+                fields=["event", "start", "end"], name="timetable_occindex_event_idx"
+            )
+        ]
+
+    def __str__(self):
+        return "{}: {} - {}".format(self.event_id, self.start, self.end)
+
+
+class EventTombstone(models.Model):
+    """
+    Records that an event left a calendar, by being deleted or removed from
+    it, so that calendar clients syncing with a token learn about it. Rows
+    older than SYNC_TOMBSTONE_DAYS are pruned.
+    """
+
+    calendar = models.ForeignKey(
+        Calendar, on_delete=models.CASCADE, verbose_name=_("calendar")
+    )
+    event_id = models.IntegerField(_("event id"))
+    deleted_on = models.DateTimeField(_("deleted on"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("event tombstone")
+        verbose_name_plural = _("event tombstones")
+        index_together = (("calendar", "deleted_on"),)
+
+    def __str__(self):
+        return "{}: {}".format(self.calendar_id, self.event_id)
+
+
+def bump_event_versions(event_ids):
+    """
+    Invalidates the cached responses showing the events, that is the
+    occurrences of their calendars and the courses of their classrooms.
+    """
+    bump_versions(
+        "calendar",
+        set(
+            Event.calendars.through.objects.filter(event_id__in=event_ids).values_list(
+                "calendar_id", flat=True
+            )
+        ),
+    )
+    bump_versions(
+        "course",
+        set(
+            Event.objects.filter(pk__in=event_ids).values_list(
+                "classroom__course_id", flat=True
+            )
+        ),
+    )
+    bump_versions("courses", ["all"])
+
+
+def touch_events(event_ids):
+    """
+    Marks events as modified so that syncing calendar clients refetch their
+    occurrences, for changes which don't go through Event.save.
+    """
+    Event.objects.filter(pk__in=event_ids).update(date_modified=timezone.now())
+
+
+def rebuild_occurrence_index(event_id):
+    event = Event.objects.filter(pk=event_id).select_related("rule").first()
+    if event is not None:
+        OccurrenceIndex.objects.rebuild_for_event(event)
+
+
+@receiver(post_save, sender=Event)
+def post_save_event(sender, instance, raw=False, **kwargs):
+    rrule_cache.invalidate(lambda key: key[0] == instance.pk)
+    bump_event_versions([instance.pk])
+    if django_settings.OCCURRENCE_INDEX_ENABLED and not raw:
+        OccurrenceIndex.objects.rebuild_for_event(instance)
+
+
+@receiver(pre_delete, sender=Event)
+def pre_delete_event(sender, instance, **kwargs):
+    bump_event_versions([instance.pk])
+    EventTombstone.objects.bulk_create(
+        EventTombstone(calendar_id=calendar_id, event_id=instance.pk)
+        for calendar_id in instance.calendars.values_list("id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Event)
+def post_delete_event(sender, instance, **kwargs):
+    rrule_cache.invalidate(lambda key: key[0] == instance.pk)
+
+
+@receiver(post_save, sender=Rule)
+def post_save_rule(sender, instance, created=False, raw=False, **kwargs):
+    recurrence = (instance.frequency, instance.params)
+    changed = recurrence != instance._saved_recurrence
+    instance._saved_recurrence = recurrence
+    if created or raw or not changed:
+        return
+
+    params_cache.invalidate(lambda key: key[0] == instance.pk)
+    rrule_cache.invalidate(lambda key: key[1] == instance.pk)
+    # Refreshes the effective dates of the events in one query rather than
+    # saving each of them
+    events = list(instance.event_set.all())
+    now = timezone.now()
+    for event in events:
+        event.rule = instance
+        (
+            event.effective_start_date,
+            event.effective_end_date,
+        ) = event.get_effective_bounds()
+        event.date_modified = now
+    Event.objects.bulk_update(
+        events, ["effective_start_date", "effective_end_date", "date_modified"]
+    )
+    event_ids = [event.pk for event in events]
+    bump_event_versions(event_ids)
+    if django_settings.OCCURRENCE_INDEX_ENABLED and event_ids:
+        from ..tasks import rebuild_events_index
+
+        transaction.on_commit(lambda: rebuild_events_index.delay(event_ids))
+
+
+@receiver(post_delete, sender=Rule)
+def post_delete_rule(sender, instance, **kwargs):
+    params_cache.invalidate(lambda key: key[0] == instance.pk)
+    rrule_cache.invalidate(lambda key: key[1] == instance.pk)
+
+
+@receiver(post_save, sender=Occurrence)
+def post_save_occurrence(sender, instance, raw=False, **kwargs):
+    bump_versions(
+        "calendar",
+        Event.calendars.through.objects.filter(event_id=instance.event_id).values_list(
+            "calendar_id", flat=True
+        ),
+    )
+    if django_settings.OCCURRENCE_INDEX_ENABLED and not raw:
+        rebuild_occurrence_index(instance.event_id)
+
+
+@receiver(m2m_changed, sender=Event.calendars.through)
+def event_calendars_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove"):
+        bump_versions("calendar", [instance.pk] if reverse else pk_set)
+    if action == "post_add":
+        touch_events(pk_set if reverse else [instance.pk])
+    elif action in ("pre_remove", "pre_clear"):
+        through = Event.calendars.through.objects.filter(
+            **{"calendar_id" if reverse else "event_id": instance.pk}
+        )
+        if pk_set is not None:
+            through = through.filter(
+                **{"event_id__in" if reverse else "calendar_id__in": pk_set}
+            )
+        removed = through.values_list("calendar_id", "event_id")
+        EventTombstone.objects.bulk_create(
+            EventTombstone(calendar_id=calendar_id, event_id=event_id)
+            for calendar_id, event_id in removed
+        )
+        if action == "pre_clear":
+            bump_versions("calendar", {calendar_id for calendar_id, _ in removed})
+
+
+@receiver(post_delete, sender=Occurrence)
+def post_delete_occurrence(sender, instance, **kwargs):
+    # Deleting a persisted occurrence brings back the generated one
+    touch_events([instance.event_id])
+    bump_versions(
+        "calendar",
+        Event.calendars.through.objects.filter(event_id=instance.event_id).values_list(
+            "calendar_id", flat=True
+        ),
+    )
+    # The event may be getting deleted along with its occurrences, so wait for
+    # the transaction to finish before looking it up again.
+    if django_settings.OCCURRENCE_INDEX_ENABLED:
+        event_id = instance.event_id
+        transaction.on_commit(lambda: rebuild_occurrence_index(event_id))
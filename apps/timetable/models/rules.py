@@ -14,8 +14,10 @@ from dateutil.rrule import (
     WEEKLY,
     YEARLY,
 )
+from django.conf import settings
 from django.db import models
 from django.utils.translation import gettext_lazy as _
+from ..utils import LRUCache
 
 freqs = (
     ("YEARLY", _("Yearly")),
@@ -27,6 +29,10 @@ freqs = (
     ("SECONDLY", _("Secondly")),
 )
 
+# Parsed Rule.params keyed by (rule pk, params). Since the raw params are part
+# of the key, entries can't go stale across processes.
+params_cache = LRUCache(settings.RRULE_CACHE_SIZE)
+
 
 class Rule(models.Model):
     """
@@ -69,6 +75,10 @@ class Rule(models.Model):
         verbose_name = _("rule")
         verbose_name_plural = _("rules")
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._saved_recurrence = (self.frequency, self.params)
+
     def rrule_frequency(self):
         compatibility_dict = {
             "DAILY": DAILY,
@@ -99,6 +109,11 @@ class Rule(models.Model):
         >>> rule.get_params()
         {'count': 1, 'byminute': [1, 2, 4, 5], 'bysecond': 1}
         """
+        if self.pk is None:
+            return self._parse_params()
+        return dict(params_cache.get_or_set((self.pk, self.params), self._parse_params))
+
+    def _parse_params(self):
         params = self.params.split(";")
         param_dict = []
         for param in params:
@@ -1,3 +1,4 @@
+import bisect
 import calendar as standardlib_calendar
 import datetime
 import pytz
@@ -7,6 +8,7 @@ from django.template.defaultfilters import date as date_filter
 from django.utils import timezone
 from django.utils.dates import WEEKDAYS, WEEKDAYS_ABBR
 from django.utils.translation import gettext
+from .blackouts import load_blackouts
 from .models import Occurrence
 
 weekday_names = []
@@ -26,6 +28,62 @@ else:
         weekday_abbrs.append(WEEKDAYS_ABBR[i])
 
 
+# Occurrences longer than this are kept out of the start index of a pool and
+# scanned one by one, so that a few of them don't widen every lookup
+LONG_OCCURRENCE_DURATION = datetime.timedelta(days=1)
+
+
+class OccurrencePool:
+    """
+    The occurrences of a top level period, indexed by start so that its sub
+    periods can look up the occurrences overlapping them in O(log n + k)
+    instead of scanning the whole pool. Occurrences are returned in the order
+    they were given in.
+    """
+
+    def __init__(self, occurrences):
+        self.occurrences = list(occurrences)
+        self.long_positions = []
+        short_positions = []
+        for i, occ in enumerate(self.occurrences):
+            if occ.end - occ.start > LONG_OCCURRENCE_DURATION:
+                self.long_positions.append(i)
+            else:
+                short_positions.append(i)
+        by_start = sorted(short_positions, key=lambda i: self.occurrences[i].start)
+        self.starts = [self.occurrences[i].start for i in by_start]
+        self.positions = by_start
+        # An occurrence overlapping a period can't start earlier than the
+        # longest occurrence before the period's start
+        self.max_duration = max(
+            (self.occurrences[i].end - self.occurrences[i].start for i in by_start),
+            default=datetime.timedelta(0),
+        )
+
+    def __iter__(self):
+        return iter(self.occurrences)
+
+    def __len__(self):
+        return len(self.occurrences)
+
+    def between(self, start, end):
+        """
+        Returns the occurrences for which ``occurrence.start <= end`` and
+        ``occurrence.end >= start``.
+        """
+        lo = bisect.bisect_left(self.starts, start - self.max_duration)
+        hi = bisect.bisect_right(self.starts, end)
+        positions = [
+            i for i in self.positions[lo:hi] if self.occurrences[i].end >= start
+        ]
+        positions.extend(
+            i
+            for i in self.long_positions
+            if self.occurrences[i].start <= end and self.occurrences[i].end >= start
+        )
+        return [self.occurrences[i] for i in sorted(positions)]
+
+
 class Period:
     """
     This class represents a period of time. It can return a set of occurrences
@@ -49,6 +107,10 @@ class Period:
 
         self.events = events
         self.tzinfo = self._get_tzinfo(tzinfo)
+        if occurrence_pool is not None and not isinstance(
+            occurrence_pool, OccurrencePool
+        ):
+            occurrence_pool = OccurrencePool(occurrence_pool)
         self.occurrence_pool = occurrence_pool
         if parent_persisted_occurrences is not None:
             self._persisted_occurrences = parent_persisted_occurrences
@@ -80,15 +142,10 @@ class Period:
     def _get_sorted_occurrences(self):
         occurrences = []
         if hasattr(self, "occurrence_pool") and self.occurrence_pool is not None:
-            for occurrence in self.occurrence_pool:
-                if (
-                    occurrence.start <= self.utc_end
-                    and occurrence.end >= self.utc_start
-                ):
-                    occurrences.append(occurrence)
-            return occurrences
+            return self.occurrence_pool.between(self.utc_start, self.utc_end)
 
         prefetch_related_objects(self.events, "occurrence_set")
+        load_blackouts(self.events)
         for event in self.events:
             event_occurrences = event.get_occurrences(
                 self.start, self.end, clear_prefetch=False
@@ -105,6 +162,15 @@ class Period:
 
     occurrences = property(cached_get_sorted_occurrences)
 
+    def get_occurrence_pool(self):
+        """
+        Returns the pool shared by this period and all of its sub periods,
+        which is built from the occurrences of the top level period.
+        """
+        if self.occurrence_pool is None:
+            self.occurrence_pool = OccurrencePool(self.occurrences)
+        return self.occurrence_pool
+
     def get_persisted_occurrences(self):
         if hasattr(self, "_persisted_occurrences"):
             return self._persisted_occurrences
@@ -162,7 +228,7 @@ class Period:
             self.events,
             start,
             self.get_persisted_occurrences(),
-            self.occurrences,
+            self.get_occurrence_pool(),
             tzinfo,
         )
 
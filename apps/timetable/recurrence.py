@@ -0,0 +1,231 @@
+import calendar
+import datetime
+from math import gcd
+
+SIMPLE_FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY")
+SIMPLE_PARAMS = {"interval", "count", "byweekday"}
+
+
+class SimpleRecurrence:
+    """
+    Expands plain DAILY, WEEKLY and MONTHLY rules, optionally limited to some
+    weekdays, with date arithmetic: the n-th candidate of the rule is computed
+    directly, so looking up the occurrences of a window doesn't step through
+    every occurrence since the start of the event like ``dateutil.rrule``
+    does.
+
+    Implements the part of the rrule API used by the events (iteration,
+    ``after``, ``before`` and ``between``) and yields exactly the datetimes
+    dateutil would. Build it with ``SimpleRecurrence.from_params``, which
+    returns None for the rules dateutil has to expand.
+    """
+
+    def __init__(
+        self, frequency, dtstart, until=None, interval=1, count=None, weekdays=None
+    ):
+        # dateutil drops the microseconds of dtstart
+        dtstart = dtstart.replace(microsecond=0)
+        self.frequency = frequency
+        self.dtstart = dtstart
+        self.until = until
+        self.interval = interval
+        self.count = count
+
+        if frequency == "MONTHLY":
+            # The candidates are the day of dtstart in every interval-th month,
+            # months without that day are skipped
+            self.first_month = dtstart.year * 12 + dtstart.month - 1
+            self.offsets = [datetime.timedelta(0)]
+            self.skip = 0
+            return
+
+        if frequency == "DAILY":
+            base = dtstart
+            days = interval * 7 // gcd(interval, 7) if weekdays else interval
+            offsets = [
+                day
+                for day in range(0, days, interval)
+                if not weekdays or (dtstart.weekday() + day) % 7 in weekdays
+            ]
+        else:
+            days = 7 * interval
+            if weekdays:
+                # Weeks are counted from the week start dateutil uses
+                wkst = calendar.firstweekday()
+                base = dtstart - datetime.timedelta(days=(dtstart.weekday() - wkst) % 7)
+                offsets = sorted((weekday - wkst) % 7 for weekday in weekdays)
+            else:
+                base = dtstart
+                offsets = [0]
+
+        # The candidates repeat every period: the r-th one is
+        # base + (r // len(offsets)) * period + offsets[r % len(offsets)]
+        self.base = base
+        self.period = datetime.timedelta(days=days)
+        self.offsets = [datetime.timedelta(days=day) for day in offsets]
+        # Candidates of the first period falling before dtstart
+        self.skip = sum(1 for offset in self.offsets if base + offset < dtstart)
+
+    @classmethod
+    def from_params(cls, frequency, dtstart, until, params):
+        """
+        Returns the SimpleRecurrence of a rule, given its frequency name and
+        rrule params, or None if the rule isn't simple enough.
+        """
+        if frequency not in SIMPLE_FREQUENCIES or not set(params) <= SIMPLE_PARAMS:
+            return None
+        interval = params.get("interval", 1)
+        count = params.get("count")
+        if not isinstance(interval, int) or interval < 1:
+            return None
+        if count is not None and (not isinstance(count, int) or count < 1):
+            return None
+
+        weekdays = None
+        if "byweekday" in params:
+            if frequency == "MONTHLY":
+                return None
+            values = params["byweekday"]
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            weekdays = set()
+            for value in values:
+                if isinstance(value, int):
+                    weekdays.add(value % 7)
+                elif getattr(value, "n", None) is None and hasattr(value, "weekday"):
+                    weekdays.add(value.weekday)
+                else:
+                    # Nth weekdays such as 1MO need dateutil
+                    return None
+            if not weekdays:
+                return None
+
+        try:
+            recurrence = cls(frequency, dtstart, until, interval, count, weekdays)
+        except OverflowError:
+            return None
+        if not recurrence.offsets:
+            # An interval multiple of 7 never reaches the given weekdays
+            return None
+        return recurrence
+
+    def __iter__(self):
+        return self._iter_from(0)
+
+    def after(self, dt, inc=False):
+        """
+        Returns the first occurrence after ``dt``, or None.
+        """
+        for value in self._iter_from(self._floor(dt)):
+            if value > dt or (inc and value == dt):
+                return value
+        return None
+
+    def before(self, dt, inc=False):
+        """
+        Returns the last occurrence before ``dt``, or None.
+        """
+        if self.until is not None and self.until < dt:
+            dt, inc = self.until, True
+        index = self._floor(dt)
+        last_index = self._last_index()
+        if last_index is not None:
+            index = min(index, last_index)
+        # Look back one period, and further if it holds no occurrence
+        step = len(self.offsets)
+        while True:
+            start = max(0, index - step)
+            last = None
+            for value in self._iter_from(start):
+                if value > dt or (value == dt and not inc):
+                    break
+                last = value
+            if last is not None or start == 0:
+                return last
+            step *= 2
+
+    def between(self, after, before, inc=False):
+        """
+        Returns the occurrences between ``after`` and ``before``.
+        """
+        values = []
+        for value in self._iter_from(self._floor(after)):
+            if value > before or (value == before and not inc):
+                break
+            if value > after or (inc and value == after):
+                values.append(value)
+        return values
+
+    def _candidate(self, index):
+        """
+        Returns the candidate at ``index``, None if it isn't an occurrence.
+        Raises OverflowError past datetime.max.
+        """
+        if self.frequency == "MONTHLY":
+            year, month = divmod(self.first_month + index * self.interval, 12)
+            if year > datetime.MAXYEAR:
+                raise OverflowError
+            if self.dtstart.day > calendar.monthrange(year, month + 1)[1]:
+                return None
+            return self.dtstart.replace(year=year, month=month + 1)
+        if index < self.skip:
+            return None
+        periods, position = divmod(index, len(self.offsets))
+        return self.base + periods * self.period + self.offsets[position]
+
+    def _floor(self, dt):
+        """
+        Returns a candidate index before which every candidate is before
+        ``dt``.
+        """
+        if self.frequency == "MONTHLY":
+            months = dt.year * 12 + dt.month - 1 - self.first_month
+            return max(0, months // self.interval)
+        return max(0, (dt - self.base) // self.period) * len(self.offsets)
+
+    def _ordinal(self, index):
+        """
+        Returns the number of occurrences before the candidate at ``index``.
+        """
+        if self.frequency == "MONTHLY":
+            if self.dtstart.day <= 28:
+                return index
+            return sum(1 for i in range(index) if self._candidate(i) is not None)
+        return max(0, index - self.skip)
+
+    def _last_index(self):
+        """
+        Returns the candidate index of the last occurrence allowed by count,
+        None if there is no count or it is past datetime.max.
+        """
+        if self.count is None:
+            return None
+        if self.frequency != "MONTHLY":
+            return self.skip + self.count - 1
+        if self.dtstart.day <= 28:
+            return self.count - 1
+        # Months too short for the day are skipped, count the others
+        index, found = -1, 0
+        try:
+            while found < self.count:
+                index += 1
+                if self._candidate(index) is not None:
+                    found += 1
+        except OverflowError:
+            return None
+        return index
+
+    def _iter_from(self, index):
+        ordinal = self._ordinal(index) if self.count is not None else 0
+        while self.count is None or ordinal < self.count:
+            try:
+                value = self._candidate(index)
+            except OverflowError:
+                return
+            index += 1
+            if value is None:
+                continue
+            if self.until is not None and value > self.until:
+                return
+            ordinal += 1
+            yield value
@@ -0,0 +1,55 @@
+import datetime
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from .models import Event, EventTombstone, OccurrenceIndex
+
+logger = get_task_logger(__name__)
+
+
+@shared_task
+def extend_occurrence_index():
+    """
+    Moves the occurrence index horizon forward: drops rows that fell behind it
+    and re-expands every event that still has occurrences within it.
+    """
+    start, end = OccurrenceIndex.objects.get_horizon()
+    OccurrenceIndex.objects.filter(end__lt=start).delete()
+
+    events = (
+        Event.objects.filter(effective_start_date__lte=end)
+        .filter(Q(effective_end_date__gte=start) | Q(effective_end_date__isnull=True))
+        .select_related("rule")
+    )
+    count = 0
+    for event in events.iterator():
+        OccurrenceIndex.objects.rebuild_for_event(event)
+        count += 1
+    logger.info("Rebuilt the occurrence index of %s events", count)
+
+
+@shared_task
+def rebuild_events_index(event_ids):
+    """
+    Rebuilds the occurrence index rows of the given events, for changes which
+    touch many events at once.
+    """
+    events = Event.objects.filter(pk__in=event_ids).select_related("rule")
+    count = 0
+    for event in events.iterator():
+        OccurrenceIndex.objects.rebuild_for_event(event)
+        count += 1
+    logger.info("Rebuilt the occurrence index of %s events", count)
+
+
+@shared_task
+def prune_event_tombstones():
+    """
+    Deletes the tombstones no sync token can still need, clients with older
+    tokens get a full resync.
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+    count, _ = EventTombstone.objects.filter(deleted_on__lt=cutoff).delete()
+    logger.info("Pruned %s event tombstones", count)
@@ -1,3 +1,1320 @@
-from django.test import TestCase
+import datetime
+import itertools
+import os
+import re
+import time
+import tracemalloc
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
+import pytz
+from dateutil import rrule
+from dateutil.parser import parse
+from icalendar import Calendar as ICalendar
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from apps.accounts.models import User
+from apps.core.versions import get_versions
+from apps.schools.models import Blackout, Classroom, Course, Level
+from rest_framework.test import APIRequestFactory, force_authenticate
+from .api.views import (
+    _api_bulk_change,
+    _api_free_busy,
+    _api_free_slots,
+    _api_move_or_resize_by_code,
+    _api_occurrences,
+    api_cache_stats,
+    api_calendar_feed_url,
+    api_create_event,
+    api_occurrences,
+    calendar_feed,
+    _api_sync_occurrences,
+    _api_upcoming_occurrences,
+)
+from .blackouts import get_blackout_table
+from .conflicts import find_conflicts, find_overlaps, free_slots, merge_intervals
+from .feeds import make_feed_token, parse_feed_token
+from .models import (
+    Calendar,
+    Event,
+    Occurrence,
+    OccurrenceIndex,
+    OccurrenceRecord,
+    Rule,
+)
+from .models.events import rrule_cache
+from .periods import Month, OccurrencePool, Year
+from .recurrence import SimpleRecurrence
+from .tasks import rebuild_events_index
+from .utils import (
+    EventListManager,
+    OffsetTable,
+    decode_occurrence_key,
+    encode_occurrence_key,
+)
 
-# Create your tests here.
+
+BENCHMARKS = os.getenv("TIMETABLE_BENCHMARKS") == "True"
+
+# Versions kept in a cache shared by the processes, like memcached, rather
+# than in the database
+SHARED_VERSIONS_CACHES = dict(
+    settings.CACHES,
+    versions={
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "versions",
+    },
+)
+
+
+def get_plan_indexes(queryset):
+    """
+    Returns the names of the indexes SQLite or MySQL plans to read to run
+    ``queryset``.
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+            return set(re.findall(r"USING (?:COVERING )?INDEX (\w+)", plan))
+        cursor.execute("EXPLAIN " + sql, params)
+        key = [column[0] for column in cursor.description].index("key")
+        rows = cursor.fetchall()
+        return {name for row in rows if row[key] for name in row[key].split(",")}
+
+
+class TimetableTestCase(TestCase):
+    def setUp(self):
+        # Creating users queues verification emails, no need for a broker here
+        patcher = mock.patch("apps.accounts.models.send_email")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.teacher_user = User.objects.create_user(
+            "teacher@darasa.test", "password", first_name="Jane", role=User.TEACHER
+        )
+        self.student_user = User.objects.create_user(
+            "student@darasa.test", "password", first_name="John", role=User.STUDENT
+        )
+        self.calendar = self.teacher_user.calendar
+        self.rule = Rule.objects.create(
+            name="weekly", description="Weekly", frequency="WEEKLY"
+        )
+        self.course = Course.objects.create(
+            name="Mathematics", teacher=self.teacher_user.teacher
+        )
+        self.course.students.add(self.student_user.student)
+        self.start = datetime.datetime(2021, 1, 4, 8, 0, tzinfo=pytz.utc)
+        # Read once per process rather than by every expansion, so it's kept
+        # out of the query counts
+        get_blackout_table()
+
+    def create_classes(self, count, rule=None):
+        events = []
+        for index in range(count):
+            classroom = Classroom.objects.create(
+                name="Class {}".format(Classroom.objects.count()),
+                course=self.course,
+                logout_url="http://localhost/",
+            )
+            start = self.start + datetime.timedelta(hours=index)
+            event = Event.objects.create(
+                start=start,
+                end=start + datetime.timedelta(hours=1),
+                classroom=classroom,
+                rule=rule or self.rule,
+                end_recurring_period=start + datetime.timedelta(days=365),
+            )
+            event.calendars.add(self.calendar)
+            events.append(event)
+        return events
+
+
+class ApiOccurrencesTest(TimetableTestCase):
+    def get_occurrences(self):
+        return _api_occurrences(
+            RequestFactory().get("/"),
+            "2021-02-01T00:00:00",
+            "2021-03-01T00:00:00",
+            self.calendar.id,
+            "Africa/Nairobi",
+            include_students=True,
+        )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            occurrences = self.get_occurrences()
+        return len(context.captured_queries), occurrences
+
+    def test_query_count_does_not_grow_with_events(self):
+        events = self.create_classes(2)
+        # A persisted occurrence must replace its generated counterpart
+        occurrence = events[0].get_occurrences(
+            datetime.datetime(2021, 2, 1, tzinfo=pytz.utc),
+            datetime.datetime(2021, 2, 2, tzinfo=pytz.utc),
+        )[0]
+        occurrence.cancel()
+
+        few_queries, few_occurrences = self.count_queries()
+
+        self.create_classes(8)
+        many_queries, many_occurrences = self.count_queries()
+
+        self.assertEqual(few_queries, many_queries)
+        self.assertEqual(len(few_occurrences), 2 * 4)
+        self.assertEqual(len(many_occurrences), 10 * 4)
+        cancelled = [o for o in many_occurrences if o["cancelled"]]
+        self.assertEqual(len(cancelled), 1)
+        self.assertTrue(cancelled[0]["existed"])
+        self.assertEqual(len(many_occurrences[0]["course"]["students"]), 1)
+
+
+class OccurrenceKeyTest(TimetableTestCase):
+    def test_keys_round_trip_through_the_api(self):
+        event = self.create_classes(1)[0]
+        original_start = self.start + datetime.timedelta(days=7, microseconds=5)
+        key = encode_occurrence_key(event.id, original_start)
+        self.assertEqual(decode_occurrence_key(key), (event.id, original_start))
+        before_epoch = datetime.datetime(1969, 7, 20, 20, 17, tzinfo=pytz.utc)
+        key = encode_occurrence_key(event.id, before_epoch)
+        self.assertEqual(decode_occurrence_key(key), (event.id, before_epoch))
+        with self.assertRaises(ValueError):
+            decode_occurrence_key("not-a-key!")
+
+        def occurrences():
+            return _api_occurrences(
+                RequestFactory().get("/"),
+                "2021-01-01T00:00:00",
+                "2021-01-15T00:00:00",
+                self.calendar.id,
+                "UTC",
+            )
+
+        first, second = occurrences()
+        self.assertEqual(first["id"], encode_occurrence_key(event.id, self.start))
+        self.assertNotEqual(first["id"], second["id"])
+
+        occurrence = event.get_occurrences(
+            self.start, self.start + datetime.timedelta(days=1)
+        )[0]
+        occurrence.cancel()
+        first, _ = occurrences()
+        self.assertTrue(first["existed"])
+        # Persisting an occurrence doesn't change its key
+        self.assertEqual(first["id"], encode_occurrence_key(event.id, self.start))
+
+        _api_move_or_resize_by_code(
+            self.teacher_user,
+            first["id"],
+            True,
+            datetime.timedelta(minutes=30),
+            False,
+            event.id,
+        )
+        occurrence = Occurrence.objects.get(event=event, original_start=self.start)
+        self.assertEqual(occurrence.start, self.start + datetime.timedelta(minutes=30))
+
+
+class OffsetTableTest(SimpleTestCase):
+    def test_conversions_match_pytz(self):
+        def describe(value):
+            return value.isoformat(), value.tzname()
+
+        def samples(tz):
+            # Every few hours past both ends of the window, where pytz takes
+            # over, and every quarter of an hour around the ends and the
+            # transitions, in UTC and in wall time
+            value = datetime.datetime(2020, 12, 1)
+            while value < datetime.datetime(2022, 2, 1):
+                yield value
+                value += datetime.timedelta(hours=5)
+            edges = [start, end] + [
+                pytz.utc.localize(transition)
+                for transition in getattr(tz, "_utc_transition_times", [])
+                if start.year - 1 <= transition.year <= end.year
+            ]
+            for edge in edges:
+                for moment in (edge, edge.astimezone(tz)):
+                    moment = moment.replace(tzinfo=None)
+                    for minutes in range(-180, 181, 15):
+                        yield moment + datetime.timedelta(minutes=minutes)
+
+        start = datetime.datetime(2021, 1, 1, tzinfo=pytz.utc)
+        end = datetime.datetime(2022, 1, 1, tzinfo=pytz.utc)
+        # Lord Howe Island moves its clocks by half an hour
+        zones = ("America/New_York", "Australia/Lord_Howe", "Africa/Nairobi", "UTC")
+        for zone in zones:
+            tz = pytz.timezone(zone)
+            offsets = OffsetTable(tz, start, end)
+            for value in samples(tz):
+                self.assertEqual(
+                    describe(offsets.localize(value)), describe(tz.localize(value))
+                )
+                aware = pytz.utc.localize(value)
+                self.assertEqual(
+                    describe(offsets.to_local(aware)), describe(aware.astimezone(tz))
+                )
+
+
+class ApiOccurrencesValidatorsTest(TimetableTestCase):
+    def get(self, **headers):
+        params = {"start": "2021-01-01T00:00:00", "end": "2021-02-01T00:00:00"}
+        request = APIRequestFactory().get("/", params, **headers)
+        force_authenticate(request, user=self.teacher_user)
+        return api_occurrences(request, calendar_id=str(self.calendar.id))
+
+    @override_settings(CACHES=SHARED_VERSIONS_CACHES)
+    def test_unchanged_calendars_are_not_modified(self):
+        caches["versions"].clear()
+        event = self.create_classes(1)[0]
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        occurrence = event.get_occurrences(
+            self.start, self.start + datetime.timedelta(days=1)
+        )[0]
+        occurrence.cancel()
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class ApiUpcomingOccurrencesTest(TimetableTestCase):
+    def get_page(self, cursor=None):
+        params = {"after": "2021-01-04T00:00:00Z", "limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        return _api_upcoming_occurrences(
+            RequestFactory().get("/", params),
+            self.calendar.id,
+            params["after"],
+            None,
+            params["limit"],
+            cursor,
+            "UTC",
+        )
+
+    def test_pages_are_merged_in_start_order(self):
+        first, second = self.create_classes(2)
+        # Moving the first class after the second must reorder the stream
+        occurrence = first.get_occurrences(
+            self.start, self.start + datetime.timedelta(days=1)
+        )[0]
+        occurrence.move(
+            self.start + datetime.timedelta(hours=2),
+            self.start + datetime.timedelta(hours=3),
+        )
+
+        page = self.get_page()
+        self.assertEqual(
+            [(o["event_id"], parse(o["start"])) for o in page["results"]],
+            [
+                (second.id, self.start + datetime.timedelta(hours=1)),
+                (first.id, self.start + datetime.timedelta(hours=2)),
+                (first.id, self.start + datetime.timedelta(days=7)),
+            ],
+        )
+
+        cursor = parse_qs(urlparse(page["next"]).query)["cursor"][0]
+        page = self.get_page(cursor)
+        self.assertEqual(
+            [(o["event_id"], parse(o["start"])) for o in page["results"]],
+            [
+                (second.id, self.start + datetime.timedelta(days=7, hours=1)),
+                (first.id, self.start + datetime.timedelta(days=14)),
+                (second.id, self.start + datetime.timedelta(days=14, hours=1)),
+            ],
+        )
+
+
+class ApiSyncOccurrencesTest(TimetableTestCase):
+    def sync(self, sync_token=None):
+        return _api_sync_occurrences(
+            RequestFactory().get("/"),
+            "2021-01-01T00:00:00",
+            "2021-02-01T00:00:00",
+            self.calendar.id,
+            sync_token,
+            "UTC",
+        )
+
+    def test_only_changes_since_the_token_are_returned(self):
+        moved, deleted, removed, untouched = self.create_classes(4)
+        response = self.sync()
+        self.assertTrue(response["full"])
+        self.assertEqual(len(response["occurrences"]), 4 * 4)
+
+        # Otherwise everything done within seconds of the first sync is resent
+        with mock.patch(
+            "apps.timetable.api.views.SYNC_TOKEN_OVERLAP", datetime.timedelta(0)
+        ):
+            sync_token = response["sync_token"]
+            self.assertEqual(self.sync(sync_token)["changed"], [])
+
+            occurrence = moved.get_occurrences(
+                self.start, self.start + datetime.timedelta(days=1)
+            )[0]
+            occurrence.move(
+                self.start + datetime.timedelta(days=1),
+                self.start + datetime.timedelta(days=1, hours=1),
+            )
+            deleted_id = deleted.id
+            deleted.delete()
+            removed.calendars.remove(self.calendar)
+
+            response = self.sync(sync_token)
+
+        self.assertFalse(response["full"])
+        self.assertEqual(response["changed"], [moved.id])
+        self.assertCountEqual(response["deleted"], [deleted_id, removed.id])
+        self.assertEqual(
+            [o["event_id"] for o in response["occurrences"]], [moved.id] * 4
+        )
+        self.assertNotIn(untouched.id, response["changed"])
+
+    def test_classroom_and_course_changes_are_returned(self):
+        renamed, untouched = self.create_classes(2)
+        sync_token = self.sync()["sync_token"]
+
+        with mock.patch(
+            "apps.timetable.api.views.SYNC_TOKEN_OVERLAP", datetime.timedelta(0)
+        ):
+            renamed.classroom.name = "Algebra"
+            renamed.classroom.save()
+            self.assertEqual(self.sync(sync_token)["changed"], [renamed.id])
+
+            self.course.name = "Mathematics"
+            self.course.save()
+            self.assertCountEqual(
+                self.sync(sync_token)["changed"], [renamed.id, untouched.id]
+            )
+
+
+@override_settings(OCCURRENCE_INDEX_ENABLED=True)
+class OccurrenceIndexTest(TimetableTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start = timezone.now().replace(microsecond=0)
+        self.range_start = self.start + datetime.timedelta(days=7)
+        self.range_end = self.start + datetime.timedelta(days=35)
+
+    def assertIndexMatchesExpansion(self, events):
+        def summary(occurrences):
+            return sorted(
+                (event.id, occ.start, occ.end, occ.cancelled, occ.pk)
+                for event, occ in occurrences
+            )
+
+        self.assertEqual(
+            summary(
+                OccurrenceIndex.objects.occurrences_between(
+                    events, self.range_start, self.range_end
+                )
+            ),
+            summary(
+                EventListManager(events).occurrences_between(
+                    self.range_start, self.range_end
+                )
+            ),
+        )
+
+    def test_index_follows_event_rule_and_occurrence_changes(self):
+        events = self.create_classes(3)
+        self.assertTrue(
+            OccurrenceIndex.objects.covers(self.range_start, self.range_end)
+        )
+        self.assertIndexMatchesExpansion(events)
+
+        occurrence = events[0].get_occurrences(self.range_start, self.range_end)[0]
+        occurrence.cancel()
+        self.assertIndexMatchesExpansion(events)
+
+        self.rule.frequency = "DAILY"
+        with mock.patch.object(
+            transaction, "on_commit", lambda func: func()
+        ), mock.patch.object(rebuild_events_index, "delay") as delay:
+            self.rule.save()
+        delay.assert_called_once_with([event.id for event in events])
+        rebuild_events_index(*delay.call_args[0])
+        self.assertIndexMatchesExpansion(list(Event.objects.all()))
+
+
+class SimpleRecurrenceTest(SimpleTestCase):
+    frequencies = {
+        "DAILY": rrule.DAILY,
+        "WEEKLY": rrule.WEEKLY,
+        "MONTHLY": rrule.MONTHLY,
+    }
+
+    def cases(self):
+        starts = (
+            datetime.datetime(2021, 1, 6, 8, 0, 0, 500),
+            datetime.datetime(2021, 1, 31, 23, 30),
+            datetime.datetime(2020, 2, 29, 12, 0),
+        )
+        untils = (None, datetime.datetime(2021, 9, 30, 8, 0))
+        weekdays = (None, [rrule.MO, rrule.WE], [rrule.SU], [5, 6, 0], rrule.TH)
+        for frequency, start, until, interval, count, days in itertools.product(
+            self.frequencies, starts, untils, (1, 2, 3, 7), (None, 9), weekdays
+        ):
+            if frequency == "MONTHLY" and days is not None:
+                continue
+            params = {"interval": interval}
+            if count:
+                params["count"] = count
+            if days is not None:
+                params["byweekday"] = days
+            yield frequency, start, until, params
+
+    def test_matches_dateutil(self):
+        probes = [
+            datetime.datetime(2020, 1, 1) + datetime.timedelta(days=d, hours=d % 24)
+            for d in range(0, 700, 31)
+        ]
+        checked = 0
+        for frequency, start, until, params in self.cases():
+            fast = SimpleRecurrence.from_params(frequency, start, until, params)
+            # Cached, so the probes below don't expand the rule again each
+            slow = rrule.rrule(
+                self.frequencies[frequency],
+                dtstart=start,
+                until=until,
+                cache=True,
+                **params
+            )
+            if fast is None:
+                # Every 7 days never falls on the other weekdays, dateutil's call
+                continue
+            checked += 1
+            case = (frequency, start, until, params)
+            expected = list(itertools.islice(slow, 200))
+            self.assertEqual(list(itertools.islice(fast, 200)), expected, case)
+            for probe in probes + expected[:10]:
+                for inc in (True, False):
+                    end = probe + datetime.timedelta(days=45)
+                    self.assertEqual(
+                        fast.between(probe, end, inc=inc),
+                        slow.between(probe, end, inc=inc),
+                        case,
+                    )
+                    self.assertEqual(
+                        fast.after(probe, inc=inc), slow.after(probe, inc=inc), case
+                    )
+                    self.assertEqual(
+                        fast.before(probe, inc=inc), slow.before(probe, inc=inc), case
+                    )
+            if until or "count" in params:
+                self.assertEqual(
+                    fast.before(datetime.datetime.max, inc=True),
+                    slow.before(datetime.datetime.max, inc=True),
+                    case,
+                )
+        self.assertGreater(checked, 100)
+
+    def test_complex_rules_are_left_to_dateutil(self):
+        start = datetime.datetime(2021, 1, 4, 8, 0)
+        for frequency, params in (
+            ("YEARLY", {}),
+            ("HOURLY", {}),
+            ("MONTHLY", {"byweekday": [rrule.MO(1)]}),
+            ("WEEKLY", {"byweekday": [rrule.MO(1)]}),
+            ("WEEKLY", {"bymonth": [1, 2]}),
+            ("WEEKLY", {"interval": [1, 2]}),
+            ("DAILY", {"interval": 7, "byweekday": [rrule.TU]}),
+        ):
+            self.assertIsNone(
+                SimpleRecurrence.from_params(frequency, start, None, params)
+            )
+
+
+class IntervalSweepTest(SimpleTestCase):
+    def interval(self, start, minutes, item=None):
+        start = datetime.datetime(2021, 1, 4) + datetime.timedelta(minutes=start)
+        return start, start + datetime.timedelta(minutes=minutes), item
+
+    def test_overlaps_match_pairwise_comparison(self):
+        candidates = [
+            self.interval(i * 37 % 600, 20 + i * 13 % 90, "c{}".format(i))
+            for i in range(60)
+        ]
+        scheduled = [
+            self.interval(i * 53 % 600, 15 + i * 7 % 60, "s{}".format(i))
+            for i in range(80)
+        ]
+        expected = [
+            (candidate[2], other[2])
+            for candidate in candidates
+            for other in scheduled
+            if candidate[0] < other[1] and other[0] < candidate[1]
+        ]
+        overlaps = find_overlaps(candidates, scheduled)
+        self.assertEqual(sorted(overlaps), sorted(expected))
+
+    def test_free_slots_are_the_gaps_between_busy_intervals(self):
+        busy = [
+            self.interval(60, 60)[:2],
+            self.interval(90, 90)[:2],
+            self.interval(180, 30)[:2],
+            self.interval(300, 60)[:2],
+        ]
+        self.assertEqual(
+            merge_intervals(busy),
+            [self.interval(60, 150)[:2], self.interval(300, 60)[:2]],
+        )
+        start, end, _ = self.interval(0, 540)
+        self.assertEqual(
+            free_slots(busy, start, end, datetime.timedelta(hours=1)),
+            [
+                self.interval(0, 60)[:2],
+                self.interval(210, 90)[:2],
+                self.interval(360, 180)[:2],
+            ],
+        )
+        self.assertEqual(
+            free_slots(busy, start, end, datetime.timedelta(hours=2)),
+            [self.interval(360, 180)[:2]],
+        )
+
+
+class ConflictTest(TimetableTestCase):
+    def create_event(self, start, end):
+        classroom = Classroom.objects.create(
+            name="Extra class", course=self.course, logout_url="http://localhost/"
+        )
+        data = {
+            "start": start,
+            "end": end,
+            "classroom_id": str(classroom.id),
+            "calendar_id": self.calendar.id,
+            "rule_id": self.rule.id,
+            "end_recurring_period": "2021-06-30T00:00:00Z",
+        }
+        request = APIRequestFactory().post("/", data, format="json")
+        force_authenticate(request, user=self.teacher_user)
+        return api_create_event(request)
+
+    def test_overlapping_classes_are_rejected(self):
+        self.create_classes(1)
+        events = Event.objects.count()
+
+        response = self.create_event("2021-03-01T08:30:00Z", "2021-03-01T09:30:00Z")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Event.objects.count(), events)
+        conflicts = response.data["conflicts"]
+        # Every week until the end of the new class overlaps
+        self.assertEqual(len(conflicts), 18)
+        self.assertEqual(parse(conflicts[0]["start"]), parse("2021-03-01T08:30:00Z"))
+
+        # Classes may follow each other back to back
+        response = self.create_event("2021-03-01T09:00:00Z", "2021-03-01T10:00:00Z")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Event.objects.count(), events + 1)
+
+    def test_occurrences_moved_before_the_first_are_checked(self):
+        event = self.create_classes(1)[0]
+        second = event.get_occurrences(
+            self.start + datetime.timedelta(days=7),
+            self.start + datetime.timedelta(days=8),
+        )[0]
+        # Moved to overlap the end of an early class on the first day
+        second.move(
+            self.start - datetime.timedelta(minutes=30),
+            self.start + datetime.timedelta(minutes=30),
+        )
+        early = Event.objects.create(
+            start=self.start - datetime.timedelta(hours=1),
+            end=self.start,
+            classroom=Classroom.objects.create(
+                name="Early class", course=self.course, logout_url="http://localhost/"
+            ),
+        )
+        early.calendars.add(self.calendar)
+
+        conflicts = find_conflicts(event, [self.calendar.id])
+        self.assertEqual(
+            [(occ.start, other.event_id) for occ, other in conflicts],
+            [(self.start - datetime.timedelta(minutes=30), early.id)],
+        )
+
+    def test_free_slots_skip_scheduled_classes(self):
+        event = self.create_classes(2)[0]
+        occurrence = event.get_occurrences(
+            self.start, self.start + datetime.timedelta(days=1)
+        )[0]
+        occurrence.cancel()
+
+        slots = _api_free_slots(
+            "2021-01-04T06:00:00",
+            "2021-01-04T14:00:00",
+            60,
+            self.calendar.id,
+            None,
+            "Africa/Nairobi",
+        )
+        # Nairobi is 3 hours ahead of UTC, the first class is cancelled and the
+        # second runs from 09:00 to 10:00 UTC
+        self.assertEqual(
+            [(parse(slot["start"]), parse(slot["end"])) for slot in slots],
+            [
+                (parse("2021-01-04T06:00+03:00"), parse("2021-01-04T12:00+03:00")),
+                (parse("2021-01-04T13:00+03:00"), parse("2021-01-04T14:00+03:00")),
+            ],
+        )
+
+
+class FreeBusyTest(TimetableTestCase):
+    def get_free_busy(self, users):
+        return _api_free_busy(
+            [str(user.id) for user in users],
+            "2021-01-04T07:00:00",
+            "2021-01-04T12:00:00",
+            30,
+            "UTC",
+        )
+
+    def intervals(self, data):
+        return [(parse(i["start"]).hour, parse(i["end"]).hour) for i in data]
+
+    def test_busy_intervals_are_merged_per_user(self):
+        first, second, third = self.create_classes(3)
+        # The student attends the second and third classes, back to back
+        for event in (second, third):
+            event.calendars.add(self.student_user.calendar)
+
+        response_data = self.get_free_busy([self.teacher_user, self.student_user])
+        busy = response_data["busy"]
+        self.assertEqual(self.intervals(busy[str(self.teacher_user.id)]), [(8, 11)])
+        self.assertEqual(self.intervals(busy[str(self.student_user.id)]), [(9, 11)])
+        self.assertEqual(self.intervals(response_data["free"]), [(7, 8), (11, 12)])
+
+    def test_query_count_does_not_grow_with_users(self):
+        event = self.create_classes(1)[0]
+        students = [
+            User.objects.create_user(
+                "student{}@darasa.test".format(index),
+                "password",
+                first_name="Student",
+                role=User.STUDENT,
+            )
+            for index in range(5)
+        ]
+        for student in students:
+            event.calendars.add(student.calendar)
+
+        with CaptureQueriesContext(connection) as few:
+            self.get_free_busy(students[:1])
+        with CaptureQueriesContext(connection) as many:
+            response_data = self.get_free_busy(students)
+
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        self.assertEqual(len(response_data["busy"]), 5)
+        self.assertEqual(self.intervals(response_data["free"]), [(7, 8), (9, 12)])
+
+
+class BulkChangeTest(TimetableTestCase):
+    def move_first_occurrence(self, event, day):
+        start = self.start + datetime.timedelta(days=day)
+        occurrence = event.get_occurrences(start, start + datetime.timedelta(days=1))[0]
+        return occurrence.move(
+            occurrence.start + datetime.timedelta(minutes=30),
+            occurrence.end + datetime.timedelta(minutes=30),
+        )
+
+    def cancel_week(self, day):
+        start = self.start.replace(tzinfo=None) + datetime.timedelta(days=day)
+        with CaptureQueriesContext(connection) as context:
+            result = _api_bulk_change(
+                "cancel",
+                0,
+                self.calendar.id,
+                None,
+                None,
+                start.isoformat(),
+                (start + datetime.timedelta(days=7)).isoformat(),
+                None,
+            )
+        return len(context.captured_queries), result
+
+    def test_occurrences_between_dates_are_cancelled(self):
+        events = self.create_classes(3)
+        moved = self.move_first_occurrence(events[0], 0)
+
+        few_queries, result = self.cancel_week(0)
+        self.assertEqual(
+            result, {"status": "OK", "events": 3, "updated": 1, "created": 2}
+        )
+        week = (self.start, self.start + datetime.timedelta(days=7))
+        for event in events:
+            occurrences = event.get_occurrences(*week)
+            self.assertEqual([occ.cancelled for occ in occurrences], [True])
+        moved.refresh_from_db()
+        self.assertTrue(moved.cancelled)
+        self.assertEqual(moved.start, self.start + datetime.timedelta(minutes=30))
+        # The next week is left alone
+        next_week = (week[1], week[1] + datetime.timedelta(days=7))
+        self.assertFalse(events[0].get_occurrences(*next_week)[0].cancelled)
+
+        events += self.create_classes(6)
+        self.move_first_occurrence(events[0], 7)
+        many_queries, result = self.cancel_week(7)
+        self.assertEqual(result["created"], 8)
+        self.assertEqual(few_queries, many_queries)
+
+    def test_course_events_are_moved(self):
+        events = self.create_classes(2)
+        week = (self.start, self.start + datetime.timedelta(days=7))
+        occurrence = events[0].get_occurrences(*week)[0].cancel()
+
+        result = _api_bulk_change(
+            "move", 60, None, str(self.course.id), None, None, None, None
+        )
+        self.assertEqual(result["events"], 2)
+        self.assertEqual(result["updated"], 1)
+        hour = datetime.timedelta(hours=1)
+        for event in events:
+            start = event.start
+            event.refresh_from_db()
+            self.assertEqual(event.start, start + hour)
+            self.assertEqual(event.effective_start_date, start + hour)
+        occurrence.refresh_from_db()
+        self.assertEqual(occurrence.original_start, self.start + hour)
+        self.assertTrue(events[0].get_occurrences(*week)[0].cancelled)
+
+    def test_invalid_changes_are_rejected(self):
+        self.create_classes(1)
+        calendar_id = self.calendar.id
+        with self.assertRaises(ValueError):
+            _api_bulk_change("cancel", 0, calendar_id, None, None, None, None, None)
+        with self.assertRaises(ValueError):
+            _api_bulk_change("move", 30, None, None, None, None, None, None)
+        with self.assertRaises(ValueError):
+            _api_bulk_change("move", 0, calendar_id, None, None, None, None, None)
+
+
+class BlackoutTest(TimetableTestCase):
+    def setUp(self):
+        super().setUp()
+        # Blackouts are kept per process under a cached version
+        self.addCleanup(cache.clear)
+        self.level = Level.objects.create(name="Form one")
+        self.event = self.create_classes(1)[0]
+        self.january = (self.start, self.start + datetime.timedelta(days=28))
+
+    def add_blackout(self, level=None):
+        return Blackout.objects.create(
+            name="Half term",
+            level=level,
+            start=self.start + datetime.timedelta(days=7),
+            end=self.start + datetime.timedelta(days=14),
+        )
+
+    def get_starts(self):
+        event = Event.objects.select_related("rule").get(pk=self.event.pk)
+        return [occ.start for occ in event.get_occurrences(*self.january)]
+
+    def test_blackouts_remove_occurrences(self):
+        self.assertEqual(len(self.get_starts()), 4)
+        self.add_blackout()
+
+        starts = self.get_starts()
+        self.assertEqual(len(starts), 3)
+        self.assertNotIn(self.start + datetime.timedelta(days=7), starts)
+        self.assertFalse(Occurrence.objects.exists())
+        upcoming = EventListManager([self.event]).occurrences_after(
+            self.start, self.january[1]
+        )
+        self.assertEqual([occ.start for occ in upcoming], starts)
+
+    def test_level_blackouts_apply_to_their_courses(self):
+        blackout = self.add_blackout(self.level)
+        self.assertEqual(len(self.get_starts()), 4)
+
+        self.course.levels.add(self.level)
+        self.assertEqual(len(self.get_starts()), 3)
+
+        blackout.delete()
+        self.assertEqual(len(self.get_starts()), 4)
+
+    def test_only_events_within_the_blackout_are_refreshed(self):
+        single = Event.objects.create(
+            start=self.start + datetime.timedelta(hours=2),
+            end=self.start + datetime.timedelta(hours=3),
+            classroom=Classroom.objects.create(
+                name="Single class", course=self.course, logout_url="http://localhost/"
+            ),
+        )
+
+        def modified():
+            return dict(Event.objects.values_list("pk", "date_modified"))
+
+        before = modified()
+        blackout = self.add_blackout()
+        after = modified()
+        self.assertGreater(after[self.event.pk], before[self.event.pk])
+        self.assertEqual(after[single.pk], before[single.pk])
+
+        # Moved over the single class, the former span is refreshed too
+        blackout.start, blackout.end = (
+            self.january[0],
+            self.january[0] + datetime.timedelta(days=1),
+        )
+        blackout.save()
+        moved = modified()
+        self.assertGreater(moved[single.pk], after[single.pk])
+        self.assertGreater(moved[self.event.pk], after[self.event.pk])
+        self.assertEqual(
+            self.get_starts(),
+            [self.start + datetime.timedelta(days=days) for days in (7, 14, 21)],
+        )
+
+    def test_blackouts_invalidate_cached_responses(self):
+        key = ("calendar", self.calendar.id)
+        version = get_versions([key])[key]
+        self.add_blackout()
+        self.assertNotEqual(get_versions([key])[key], version)
+
+    def test_feeds_exclude_blackouts(self):
+        self.add_blackout()
+        response = calendar_feed(
+            RequestFactory().get("/"), make_feed_token(self.calendar.id)
+        )
+        feed = ICalendar.from_ical(b"".join(response.streaming_content))
+        vevent = feed.walk("VEVENT")[0]
+        self.assertEqual(
+            vevent["exdate"].dts[0].dt, self.start + datetime.timedelta(days=7)
+        )
+
+
+class CalendarFeedTest(TimetableTestCase):
+    def setUp(self):
+        super().setUp()
+        # Feeds are cached by calendar id, which other tests reuse
+        cache.clear()
+
+    def get_feed(self, token=None, **headers):
+        request = RequestFactory().get("/", **headers)
+        return calendar_feed(request, token or make_feed_token(self.calendar.id))
+
+    def read(self, response):
+        if response.streaming:
+            return b"".join(response.streaming_content)
+        return response.content
+
+    def test_recurrences_are_exported_natively(self):
+        event = self.create_classes(1)[0]
+        first, second = event.get_occurrences(
+            self.start, self.start + datetime.timedelta(days=8)
+        )
+        first.cancel()
+        second.move(
+            second.start + datetime.timedelta(hours=1),
+            second.end + datetime.timedelta(hours=1),
+        )
+
+        feed = ICalendar.from_ical(self.read(self.get_feed()))
+        series, override = feed.walk("VEVENT")
+        self.assertEqual(series["UID"], override["UID"])
+        self.assertEqual(series["DTSTART"].dt, self.start)
+        self.assertEqual(series["RRULE"]["FREQ"], ["WEEKLY"])
+        # The start of the last class, on the Monday before end_recurring_period
+        self.assertEqual(
+            series["RRULE"]["UNTIL"],
+            [datetime.datetime(2022, 1, 3, 8, 0, tzinfo=pytz.utc)],
+        )
+        self.assertEqual([d.dt for d in series["EXDATE"].dts], [self.start])
+        self.assertEqual(override["RECURRENCE-ID"].dt, second.original_start)
+        self.assertEqual(
+            override["DTSTART"].dt, self.start + datetime.timedelta(days=7, hours=1),
+        )
+
+    @override_settings(CACHES=SHARED_VERSIONS_CACHES)
+    def test_unchanged_feeds_are_served_without_queries(self):
+        caches["versions"].clear()
+        self.create_classes(2)
+        response = self.get_feed()
+        content = self.read(response)
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_feed(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.read(self.get_feed()), content)
+
+        self.create_classes(1)
+        response = self.get_feed(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        feed = ICalendar.from_ical(self.read(response))
+        self.assertEqual(len(feed.walk("VEVENT")), 3)
+
+    def test_feeds_need_a_valid_token(self):
+        request = APIRequestFactory().get("/")
+        force_authenticate(request, user=self.student_user)
+        response = api_calendar_feed_url(request, calendar_id=str(self.calendar.id))
+        self.assertEqual(response.status_code, 403)
+
+        request = APIRequestFactory().get("/")
+        force_authenticate(request, user=self.teacher_user)
+        response = api_calendar_feed_url(request, calendar_id=str(self.calendar.id))
+        token = response.data["url"].rsplit("/", 1)[1][: -len(".ics")]
+        self.assertEqual(parse_feed_token(token), self.calendar.id)
+
+        with self.assertRaises(Http404):
+            self.get_feed(token + "0")
+
+
+@skipUnless(
+    connection.vendor in ("mysql", "sqlite"),
+    "Query plans are checked on MySQL and SQLite",
+)
+class QueryPlanTest(TimetableTestCase):
+    def setUp(self):
+        super().setUp()
+        self.events = self.create_classes(30)
+        self.calendars = [Calendar.objects.create(name=str(i)) for i in range(10)]
+        Event.calendars.through.objects.bulk_create(
+            Event.calendars.through(event=event, calendar=self.calendars[i % 10])
+            for i, event in enumerate(self.events)
+        )
+        occurrences = []
+        rows = []
+        for event in self.events:
+            for week in range(20):
+                start = event.start + datetime.timedelta(weeks=week)
+                end = start + datetime.timedelta(hours=1)
+                occurrences.append(
+                    Occurrence(
+                        event=event,
+                        start=start + datetime.timedelta(hours=week % 2),
+                        end=end + datetime.timedelta(hours=week % 2),
+                        original_start=start,
+                        original_end=end,
+                    )
+                )
+                rows.append(
+                    OccurrenceIndex(
+                        event=event, start=start, end=end, original_start=start
+                    )
+                )
+        Occurrence.objects.bulk_create(occurrences)
+        OccurrenceIndex.objects.bulk_create(rows)
+        if connection.vendor == "mysql":
+            # Fresh statistics, so tables aren't planned as if empty
+            with connection.cursor() as cursor:
+                for model in (Occurrence, OccurrenceIndex, Event.calendars.through):
+                    cursor.execute("ANALYZE TABLE " + model._meta.db_table)
+        self.event_ids = [event.id for event in self.events[:2]]
+        self.after = self.start + datetime.timedelta(weeks=10)
+
+    def assertUsesIndex(self, queryset, *names):
+        indexes = get_plan_indexes(queryset)
+        self.assertTrue(
+            indexes & set(names),
+            "{} reads {}".format(queryset.query, ", ".join(indexes) or "no index"),
+        )
+
+    def test_occurrence_by_original_start(self):
+        # Event.get_occurrence and the occurrence update endpoints
+        event = self.events[0]
+        self.assertUsesIndex(
+            Occurrence.objects.filter(event=event, original_start=event.start),
+            "timetable_occ_original_idx",
+        )
+
+    def test_replaced_occurrences(self):
+        # A window of OccurrenceReplacer
+        self.assertUsesIndex(
+            Occurrence.objects.filter(
+                event_id__in=self.event_ids, original_start__gte=self.after
+            ).order_by("original_start", "id"),
+            "timetable_occ_original_idx",
+        )
+
+    def test_moved_occurrences(self):
+        # The trickies of Event.occurrences_after
+        self.assertUsesIndex(
+            self.events[0].occurrence_set.filter(
+                original_start__lte=self.after, start__gte=self.after
+            ),
+            "timetable_occ_original_idx",
+            "timetable_occ_start_idx",
+        )
+        # and the moved occurrences merged by EventListManager.occurrences_after
+        self.assertUsesIndex(
+            Occurrence.objects.filter(event_id__in=self.event_ids, end__gt=self.after)
+            .exclude(start=F("original_start"))
+            .order_by("start", "id"),
+            "timetable_occ_original_idx",
+            "timetable_occ_start_idx",
+        )
+
+    def test_occurrence_index_rows(self):
+        # OccurrenceIndexManager.occurrences_between
+        self.assertUsesIndex(
+            OccurrenceIndex.objects.filter(
+                event_id__in=self.event_ids,
+                start__lt=self.after + datetime.timedelta(weeks=1),
+                end__gt=self.after,
+            ).order_by("start"),
+            "timetable_occindex_event_idx",
+        )
+
+    def test_calendar_events(self):
+        # The events of the calendars read by the occurrence endpoints
+        self.assertUsesIndex(
+            Event.objects.filter(calendars=self.calendars[0]),
+            "timetable_calendar_event_idx",
+        )
+
+
+class RRuleCacheTest(TimetableTestCase):
+    def test_compiled_rrules_are_reused_until_the_rule_changes(self):
+        event = self.create_classes(1)[0]
+        rrule_cache.clear()
+
+        weekly = event.get_rrule_object(pytz.utc)
+        self.assertIs(event.get_rrule_object(pytz.utc), weekly)
+        self.assertEqual(rrule_cache.info()["hits"], 1)
+        self.assertEqual(rrule_cache.info()["misses"], 1)
+
+        self.rule.params = "byweekday:MO,WE"
+        self.rule.save()
+        # Only the rrule compiled to refresh the effective dates is left
+        self.assertEqual(rrule_cache.info()["size"], 1)
+
+        event.rule = self.rule
+        twice_weekly = event.get_rrule_object(pytz.utc)
+        self.assertIsNot(twice_weekly, weekly)
+        self.assertIsInstance(twice_weekly, SimpleRecurrence)
+        self.assertEqual(
+            twice_weekly.between(
+                datetime.datetime(2021, 1, 4), datetime.datetime(2021, 1, 11)
+            ),
+            [datetime.datetime(2021, 1, 4, 8, 0), datetime.datetime(2021, 1, 6, 8, 0)],
+        )
+
+    def test_cache_stats_are_reported_to_staff(self):
+        rrule_cache.clear()
+        self.create_classes(1)[0].get_rrule_object(pytz.utc)
+
+        request = APIRequestFactory().get("/")
+        force_authenticate(request, user=self.teacher_user)
+        self.assertEqual(api_cache_stats(request).status_code, 403)
+
+        self.teacher_user.is_staff = True
+        request = APIRequestFactory().get("/")
+        force_authenticate(request, user=self.teacher_user)
+        response = api_cache_stats(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["pid"], os.getpid())
+        self.assertEqual(response.data["rrules"]["misses"], 1)
+        self.assertIn("hits", response.data["rule_params"])
+
+
+class EffectiveDatesTest(TimetableTestCase):
+    def test_effective_dates_are_stored_on_save(self):
+        event = self.create_classes(1)[0]
+        last = list(event._occurrences_after_generator(event.start))[-1]
+
+        self.assertEqual(event.effective_start_date, self.start)
+        self.assertEqual(event.effective_end_date, last.end)
+        self.assertEqual(
+            event.effective_end_date,
+            datetime.datetime(2022, 1, 3, 9, 0, tzinfo=pytz.utc),
+        )
+
+        self.rule.frequency = "DAILY"
+        self.rule.save()
+        event.refresh_from_db()
+        self.assertEqual(
+            event.effective_end_date,
+            datetime.datetime(2022, 1, 4, 9, 0, tzinfo=pytz.utc),
+        )
+
+        event.end_recurring_period = None
+        event.save()
+        self.assertEqual(event.effective_start_date, self.start)
+        self.assertIsNone(event.effective_end_date)
+
+    @override_settings(CACHES=SHARED_VERSIONS_CACHES)
+    def test_rule_changes_update_the_events_at_once(self):
+        events = self.create_classes(5)
+        modified = Event.objects.get(pk=events[0].pk).date_modified
+
+        self.rule.name = "Weekly classes"
+        with self.assertNumQueries(1):
+            self.rule.save()
+        self.assertEqual(Event.objects.get(pk=events[0].pk).date_modified, modified)
+
+        self.rule.frequency = "DAILY"
+        # The rule, its events and their bulk update, then the versions bump
+        with self.assertNumQueries(5):
+            self.rule.save()
+        for event in Event.objects.select_related("rule"):
+            self.assertEqual(
+                (event.effective_start_date, event.effective_end_date),
+                event.get_effective_bounds(),
+            )
+            self.assertEqual(event.effective_end_date.date(), datetime.date(2022, 1, 4))
+        self.assertGreater(Event.objects.get(pk=events[0].pk).date_modified, modified)
+
+
+class OccurrenceRecordTest(TimetableTestCase):
+    def test_records_are_immutable_and_persist_on_cancel(self):
+        event = self.create_classes(1)[0]
+        record = event.get_occurrences(
+            self.start, self.start + datetime.timedelta(days=1)
+        )[0]
+        self.assertIsInstance(record, OccurrenceRecord)
+        self.assertEqual(record.name, event.classroom.name)
+        with self.assertRaises(AttributeError):
+            record.start = self.start
+
+        occurrence = record.cancel()
+        self.assertTrue(Occurrence.objects.get(pk=occurrence.pk).cancelled)
+        self.assertEqual(
+            event.get_occurrences(self.start, self.start + datetime.timedelta(days=1)),
+            [occurrence],
+        )
+
+
+class PeriodTest(TimetableTestCase):
+    def test_sub_periods_share_the_top_level_pool(self):
+        daily = Rule.objects.create(
+            name="daily", description="Daily", frequency="DAILY"
+        )
+        self.create_classes(3, rule=daily)
+        month = Month(Event.objects.all(), self.start)
+        self.assertEqual(len(month.occurrences), 3 * 28)
+
+        with self.assertNumQueries(0):
+            days = list(month.get_days())
+        self.assertEqual(len(days), 31)
+        for day in days:
+            self.assertIs(day.occurrence_pool, month.get_occurrence_pool())
+            self.assertEqual(
+                day.occurrences,
+                [
+                    occ
+                    for occ in month.occurrences
+                    if occ.start <= day.utc_end and occ.end >= day.utc_start
+                ],
+            )
+        # January 2021 starts on a Friday, the classes start on Monday the 4th
+        self.assertEqual(len(days[0].occurrences), 0)
+        self.assertEqual(len(days[3].occurrences), 3)
+
+    def test_long_occurrences_dont_widen_pool_lookups(self):
+        event = self.create_classes(1)[0]
+        hour = datetime.timedelta(hours=1)
+        occurrences = [
+            OccurrenceRecord(event, self.start + i * hour, self.start + (i + 1) * hour)
+            for i in range(48)
+        ]
+        term = OccurrenceRecord(
+            event, self.start, self.start + datetime.timedelta(days=90)
+        )
+        occurrences.insert(10, term)
+        pool = OccurrencePool(occurrences)
+        self.assertEqual(pool.max_duration, hour)
+        self.assertEqual(pool.long_positions, [10])
+
+        for offset in (0, 5, 30, 47, 100):
+            start = self.start + offset * hour
+            end = start + 2 * hour
+            self.assertEqual(
+                pool.between(start, end),
+                [occ for occ in occurrences if occ.start <= end and occ.end >= start],
+            )
+
+
+@skipUnless(BENCHMARKS, "Set TIMETABLE_BENCHMARKS=True to run benchmarks")
+class OccurrenceRecordBenchmark(TimetableTestCase):
+    count = 10000
+
+    def measure(self, create, hashable):
+        tracemalloc.start()
+        started = time.perf_counter()
+        occurrences = []
+        seen = set()
+        for index in range(self.count):
+            start = self.start + datetime.timedelta(hours=index)
+            occurrence = create(start, start + datetime.timedelta(hours=1))
+            if hashable:
+                if occurrence not in seen:
+                    seen.add(occurrence)
+                    occurrences.append(occurrence)
+            elif occurrence not in occurrences:
+                occurrences.append(occurrence)
+        elapsed = time.perf_counter() - started
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return elapsed, memory
+
+    def test_expansion_of_10k_occurrences(self):
+        self.event = self.create_classes(1)[0]
+        model_time, model_memory = self.measure(self.event._create_occurrence, False)
+        record_time, record_memory = self.measure(
+            self.event._create_occurrence_record, True
+        )
+        print(
+            "\n{} occurrences: ".format(self.count),
+            "models {:.2f}s {:.1f}MiB,".format(model_time, model_memory / 2 ** 20),
+            "records {:.2f}s {:.1f}MiB".format(record_time, record_memory / 2 ** 20),
+        )
+        self.assertLess(record_memory, model_memory)
+        self.assertLess(record_time, model_time)
+
+
+@skipUnless(BENCHMARKS, "Set TIMETABLE_BENCHMARKS=True to run benchmarks")
+class PeriodBenchmark(TimetableTestCase):
+    def test_render_a_year_of_50k_occurrences(self):
+        daily = Rule.objects.create(
+            name="daily", description="Daily", frequency="DAILY"
+        )
+        self.start = datetime.datetime(2021, 1, 1, tzinfo=pytz.utc)
+        # 138 daily classes over 2021 make a little more than 50k occurrences
+        self.create_classes(138, rule=daily)
+        year = Year(Event.objects.all(), self.start)
+        occurrences = year.occurrences
+        self.assertGreaterEqual(len(occurrences), 50000)
+
+        def render(scan):
+            count = 0
+            for month in year.get_months():
+                for week in month.get_weeks():
+                    for day in week.get_days():
+                        if scan:
+                            # What every sub period did before sharing a pool
+                            day._occurrences = [
+                                occ
+                                for occ in occurrences
+                                if occ.start <= day.utc_end and occ.end >= day.utc_start
+                            ]
+                        count += len(day.get_occurrence_partials())
+            return count
+
+        started = time.perf_counter()
+        indexed = render(scan=False)
+        indexed_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        scanned = render(scan=True)
+        scanned_time = time.perf_counter() - started
+
+        print(
+            "\n{} occurrences: ".format(len(occurrences)),
+            "shared pool {:.2f}s,".format(indexed_time),
+            "linear scan {:.2f}s".format(scanned_time),
+        )
+        self.assertEqual(indexed, scanned)
+        self.assertLess(indexed_time, scanned_time)
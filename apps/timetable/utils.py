@@ -1,5 +1,15 @@
+import bisect
+import datetime
 import heapq
+import pytz
+import threading
+from collections import OrderedDict, defaultdict
+from django.db.models import F, Q
 from django.utils import timezone
+from .blackouts import load_blackouts
+
+OCCURRENCE_KEY_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+BASE36_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
 
 
 class EventListManager:
@@ -12,41 +22,105 @@ class EventListManager:
     def __init__(self, events):
         self.events = events
 
-    def occurrences_after(self, after=None):
+    def occurrences_after(self, after=None, before=None, limit=None):
         """
         It is often useful to know what the next occurrence is given a list of
         events.  This function produces a generator that yields the
         the most recent occurrence after the date ``after`` from any of the
-        events in ``self.events``
-        """
-        from timetable.models import Occurrence
+        events in ``self.events``, in order of ``(start, event id)``, until
+        ``before`` or ``limit`` occurrences, whichever comes first.
 
+        The occurrences of every event are merged lazily, and persisted
+        occurrences are fetched in chunks as the merge moves forward, so memory
+        use doesn't grow with the number of occurrences.
+        """
         if after is None:
             after = timezone.now()
-        occ_replacer = OccurrenceReplacer(
-            Occurrence.objects.filter(event__in=self.events)
+        events_by_id = {event.id: event for event in self.events}
+        load_blackouts(list(events_by_id.values()))
+        occ_replacer = OccurrenceReplacerWindow(events_by_id)
+
+        heap = []
+
+        def push(index, generator):
+            for occ in generator:
+                heapq.heappush(heap, (occ.start, occ.event_id, index, occ, generator))
+                return
+
+        for index, event in enumerate(events_by_id.values()):
+            push(index, event._occurrences_after_generator(after))
+        # Persisted occurrences which were moved away from where their event
+        # would have generated them are merged in as a stream of their own
+        push(-1, self._moved_occurrences_after(events_by_id, after))
+
+        count = 0
+        while heap:
+            start, _, index, occ, generator = heapq.heappop(heap)
+            if (before is not None and start >= before) or (
+                limit is not None and count >= limit
+            ):
+                return
+            push(index, generator)
+            if index != -1:
+                occ = occ_replacer.get_occurrence(occ)
+                if occ.start != start:
+                    # it's yielded from the moved occurrences stream instead
+                    continue
+            count += 1
+            yield occ
+
+    def _moved_occurrences_after(self, events_by_id, after, chunk_size=100):
+        from .models import Occurrence
+
+        queryset = (
+            Occurrence.objects.filter(event_id__in=list(events_by_id), end__gt=after)
+            .exclude(start=F("original_start"))
+            .order_by("start", "id")
         )
-        generators = [
-            event._occurrences_after_generator(after) for event in self.events
-        ]
-        occurrences = []
+        last = None
+        while True:
+            chunk = queryset
+            if last is not None:
+                chunk = chunk.filter(
+                    Q(start__gt=last.start) | Q(start=last.start, id__gt=last.id)
+                )
+            chunk = list(chunk[:chunk_size])
+            for occ in chunk:
+                occ.event = events_by_id[occ.event_id]
+                occ.set_classroom_defaults()
+                yield occ
+            if len(chunk) < chunk_size:
+                return
+            last = chunk[-1]
 
-        for generator in generators:
-            try:
-                heapq.heappush(occurrences, (next(generator), generator))
-            except StopIteration:
-                pass
+    def occurrences_between(self, start, end):
+        """
+        Expands every event in ``self.events`` between ``start`` and ``end``
+        and returns a list of ``(event, occurrence)`` pairs.
 
-        while occurrences:
-            generator = occurrences[0][1]
+        All persisted occurrences are fetched with a single query keyed by
+        event id, so the number of queries doesn't grow with the number of
+        events. Pass in ``self.events`` with ``select_related`` on whatever
+        the caller reads from the event (rule, classroom, ...).
+        """
+        from .models import Occurrence
 
-            try:
-                next_occurrence = heapq.heapreplace(
-                    occurrences, (next(generator), generator)
-                )[0]
-            except StopIteration:
-                next_occurrence = heapq.heappop(occurrences)[0]
-            yield occ_replacer.get_occurrence(next_occurrence)
+        events = list(self.events)
+        load_blackouts(events)
+        persisted = defaultdict(list)
+        events_by_id = {event.id: event for event in events}
+        for occ in Occurrence.objects.filter(event_id__in=list(events_by_id)):
+            occ.event = events_by_id[occ.event_id]
+            occ.set_classroom_defaults()
+            persisted[occ.event_id].append(occ)
+
+        occurrences = []
+        for event in events:
+            for occ in event.get_occurrences(
+                start, end, persisted_occurrences=persisted[event.id]
+            ):
+                occurrences.append((event, occ))
+        return occurrences
 
 
 class OccurrenceReplacer:
@@ -59,7 +133,7 @@ class OccurrenceReplacer:
 
     def __init__(self, persisted_occurrences):
         lookup = [
-            ((occ.event.id, occ.original_start, occ.original_end), occ)
+            ((occ.event_id, occ.original_start, occ.original_end), occ)
             for occ in persisted_occurrences
         ]
         self.lookup = dict(lookup)
@@ -70,12 +144,12 @@ class OccurrenceReplacer:
         has already been matched
         """
         return self.lookup.pop(
-            (occ.event.id, occ.original_start, occ.original_end), occ
+            (occ.event_id, occ.original_start, occ.original_end), occ
         )
 
     def has_occurrence(self, occ):
         try:
-            return (occ.event.id, occ.original_start, occ.original_end) in self.lookup
+            return (occ.event_id, occ.original_start, occ.original_end) in self.lookup
         except TypeError:
             if not self.lookup:
                 return False
@@ -93,3 +167,262 @@ class OccurrenceReplacer:
             for _, occ in list(self.lookup.items())
             if (occ.start < end and occ.end >= start and not occ.cancelled)
         ]
+
+
+class OccurrenceReplacerWindow:
+    """
+    Works like OccurrenceReplacer, but instead of loading every persisted
+    occurrence up front it only holds a chunk of them, sorted by original
+    start, and loads the next chunk as later occurrences are looked up.
+    Occurrences must therefore be looked up in order of their original start.
+    """
+
+    def __init__(self, events_by_id, chunk_size=100):
+        self.events_by_id = events_by_id
+        self.chunk_size = chunk_size
+        self.lookup = {}
+        self.window_start = None
+        # None once every persisted occurrence after window_start is loaded
+        self.window_end = None
+
+    def get_occurrence(self, occ):
+        if self.window_start is None or (
+            self.window_end is not None and occ.original_start >= self.window_end
+        ):
+            self._load(occ.original_start)
+        key = (occ.event_id, occ.original_start, occ.original_end)
+        return self.lookup.get(key, occ)
+
+    def _load(self, start):
+        from .models import Occurrence
+
+        queryset = Occurrence.objects.filter(
+            event_id__in=list(self.events_by_id)
+        ).order_by("original_start", "id")
+        occurrences = list(
+            queryset.filter(original_start__gte=start)[: self.chunk_size]
+        )
+        self.window_start = start
+        self.window_end = None
+        if len(occurrences) == self.chunk_size:
+            # The chunk may end halfway through the occurrences sharing its last
+            # original start, so the window stops right before it.
+            self.window_end = occurrences[-1].original_start
+            if self.window_end == start:
+                occurrences = list(queryset.filter(original_start=start))
+                self.window_end = start + datetime.timedelta(microseconds=1)
+            else:
+                occurrences = [
+                    occ for occ in occurrences if occ.original_start < self.window_end
+                ]
+
+        self.lookup = {}
+        for occ in occurrences:
+            occ.event = self.events_by_id[occ.event_id]
+            occ.set_classroom_defaults()
+            self.lookup[(occ.event_id, occ.original_start, occ.original_end)] = occ
+
+
+class LRUCache:
+    """
+    A small thread safe, process local, least recently used cache. It keeps
+    count of its hits and misses so that its efficiency can be monitored, see
+    ``info()``.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_set(self, key, default):
+        """
+        Returns the value cached under key, calling ``default()`` to compute
+        and store it on a miss.
+        """
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+
+        value = default()
+        with self._lock:
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def invalidate(self, predicate):
+        """
+        Removes every entry whose key matches predicate
+        """
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+
+class OffsetTable:
+    """
+    The UTC offsets a pytz timezone goes through around a window of time, so
+    that converting datetimes from and to the timezone is a bisect over the
+    few transitions of the window instead of pytz's work over the whole
+    history of the zone. Gives the same results as ``tz.localize()`` and
+    ``astimezone(tz)``, which it falls back to outside of the window and for
+    wall times that are ambiguous or skipped by a transition.
+    """
+
+    # Wider than any UTC offset, so the local window is within the UTC one
+    MARGIN = datetime.timedelta(days=2)
+
+    def __init__(self, tz, start, end):
+        self.tz = tz
+        transitions = getattr(tz, "_utc_transition_times", None)
+        if not transitions:
+            # Fixed offset timezones, localize() is a plain replace()
+            self.utc_min = self.local_min = datetime.datetime.min
+            self.utc_max = self.local_max = datetime.datetime.max
+            self.utc_starts = self.local_starts = [datetime.datetime.min]
+            self.offsets = [tz.utcoffset(None) or datetime.timedelta(0)]
+            self.tzinfos = [tz]
+            self.skipped = []
+            return
+
+        self.utc_min = _utc_naive(start) - self.MARGIN
+        self.utc_max = _utc_naive(end) + self.MARGIN
+        self.local_min = self.utc_min + self.MARGIN / 2
+        self.local_max = self.utc_max - self.MARGIN / 2
+
+        lo = max(0, bisect.bisect_right(transitions, self.utc_min) - 1)
+        hi = max(lo + 1, bisect.bisect_right(transitions, self.utc_max))
+        infos = tz._transition_info[lo:hi]
+        self.utc_starts = [self.utc_min] + transitions[lo + 1 : hi]
+        self.offsets = [info[0] for info in infos]
+        self.tzinfos = [tz._tzinfos[info] for info in infos]
+        self.local_starts = [
+            utc + offset for utc, offset in zip(self.utc_starts, self.offsets)
+        ]
+        # The wall times around each transition which happen twice or never
+        self.skipped = [
+            (utc + min(before, after), utc + max(before, after))
+            for utc, before, after in zip(
+                self.utc_starts[1:], self.offsets, self.offsets[1:]
+            )
+        ]
+
+    def localize(self, value):
+        """
+        Returns the naive wall time ``value`` made aware in the timezone.
+        """
+        if not self.local_min <= value < self.local_max:
+            return self.tz.localize(value)
+        index = max(0, bisect.bisect_right(self.local_starts, value) - 1)
+        # Only the transitions which start and end its offset can make it tricky
+        for lo, hi in self.skipped[max(0, index - 1) : index + 1]:
+            if lo <= value < hi:
+                return self.tz.localize(value)
+        return value.replace(tzinfo=self.tzinfos[index])
+
+    def to_local(self, value):
+        """
+        Returns the aware datetime ``value`` converted to the timezone.
+        """
+        utc = _utc_naive(value)
+        if not self.utc_min <= utc < self.utc_max:
+            return value.astimezone(self.tz)
+        index = max(0, bisect.bisect_right(self.utc_starts, utc) - 1)
+        return (utc + self.offsets[index]).replace(tzinfo=self.tzinfos[index])
+
+
+def _utc_naive(value):
+    if timezone.is_naive(value):
+        return value
+    return value.replace(tzinfo=None) - value.utcoffset()
+
+
+offset_tables = LRUCache(256)
+
+
+def get_offset_table(tz, start, end):
+    """
+    Returns the OffsetTable of ``tz`` for a window covering ``start`` to
+    ``end``, shared by every window starting and ending on the same days.
+    """
+    start = datetime.datetime.combine(_utc_naive(start).date(), datetime.time.min)
+    end = datetime.datetime.combine(
+        _utc_naive(end).date() + datetime.timedelta(days=1), datetime.time.min
+    )
+    key = (getattr(tz, "zone", str(tz)), start, end)
+    return offset_tables.get_or_set(key, lambda: OffsetTable(tz, start, end))
+
+
+def isoformat(value):
+    """
+    Formats a datetime the way the REST framework's JSON encoder does, so
+    that payloads can be built from strings directly.
+    """
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def _to_base36(number):
+    if number < 0:
+        return "-" + _to_base36(-number)
+    digits = []
+    while True:
+        number, digit = divmod(number, 36)
+        digits.append(BASE36_DIGITS[digit])
+        if not number:
+            return "".join(reversed(digits))
+
+
+def encode_occurrence_key(event_id, original_start):
+    """
+    Returns a short key which identifies an occurrence, persisted or not, for
+    as long as its event keeps the same recurrence, e.g. ``"2s-kjw9pa0xs0"``.
+    It is made of the event id and the microseconds between the epoch and the
+    occurrence's original start, in base 36, signed for starts before the
+    epoch.
+    """
+    if timezone.is_naive(original_start):
+        original_start = pytz.utc.localize(original_start)
+    microseconds = (original_start - OCCURRENCE_KEY_EPOCH) // datetime.timedelta(
+        microseconds=1
+    )
+    return "{}-{}".format(_to_base36(event_id), _to_base36(microseconds))
+
+
+def decode_occurrence_key(key):
+    """
+    Returns the ``(event_id, original_start)`` an occurrence key was encoded
+    from, raises ValueError for invalid keys.
+    """
+    try:
+        event_id, microseconds = str(key).split("-", 1)
+        return (
+            int(event_id, 36),
+            OCCURRENCE_KEY_EPOCH
+            + datetime.timedelta(microseconds=int(microseconds, 36)),
+        )
+    except (OverflowError, ValueError):
+        raise ValueError("Invalid occurrence key: {}".format(key))
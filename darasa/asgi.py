@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "darasa.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# The meeting room calls are served from the event loop, see the docstring
+from apps.schools.api.asgi import AsyncRoomsApplication  # noqa: E402
+
+application = AsyncRoomsApplication(django_application, settings.API_VERSION)
@@ -11,8 +11,10 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+import json
 import dj_email_url
 from datetime import timedelta
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -120,6 +122,27 @@ DATABASES = {
 }
 
 
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+# The versions validating API responses (see apps/core/versions.py) must be
+# the same in every process, so they are kept in the database when the default
+# cache is local to one. Its table is made by ``manage.py createcachetable``.
+if CACHES["default"]["BACKEND"].endswith((".LocMemCache", ".DummyCache")):
+    CACHES["versions"] = {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "core_versions",
+    }
+else:
+    CACHES["versions"] = CACHES["default"]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -188,6 +211,24 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 BBB_SECRET = os.getenv("BBB_SECRET")
 BBB_URL = os.getenv("BBB_URL")
 BBB_LOGOUT_URL = os.getenv("BBB_LOGOUT_URL")
+# The servers meetings are spread over, as a JSON list of {"url", "secret",
+# "capacity"}, capacity being the participants a server takes. The server of
+# BBB_URL alone if empty.
+BBB_SERVERS = json.loads(os.getenv("BBB_SERVERS") or "[]")
+# Seconds a created meeting is taken to still exist, so students joining a
+# class don't each create its meeting again
+BBB_MEETING_TTL = int(os.getenv("BBB_MEETING_TTL", 60))
+# Seconds the running state of the meetings is answered from the last sweep of
+# the server, rather than by calling it for every status poll
+BBB_RUNNING_TTL = int(os.getenv("BBB_RUNNING_TTL", 10))
+# Minutes before a class its meeting is created and its join links emailed,
+# spread over the first minutes of that window by classroom. Keep it within
+# the time the server lets a meeting nobody joined live.
+BBB_PREWARM_MINUTES = int(os.getenv("BBB_PREWARM_MINUTES", 10))
+BBB_PREWARM_SPREAD_MINUTES = int(os.getenv("BBB_PREWARM_SPREAD_MINUTES", 5))
+# Meetings created at once, and emails sent by a task, by the scheduler
+BBB_PREWARM_CONCURRENCY = int(os.getenv("BBB_PREWARM_CONCURRENCY", 10))
+BBB_NOTIFICATION_BATCH_SIZE = int(os.getenv("BBB_NOTIFICATION_BATCH_SIZE", 100))
 
 
 # Email config
@@ -293,11 +334,41 @@ CELERY_RESULT_BACKEND = os.getenv("CELERY_BROKER")
 CELERY_ACCEPT_CONTENT = ["application/json"]
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TASK_SERIALIZER = "json"
+CELERY_BEAT_SCHEDULE = {
+    "extend-occurrence-index": {
+        "task": "apps.timetable.tasks.extend_occurrence_index",
+        "schedule": crontab(minute=0, hour=1),
+    },
+    "prune-event-tombstones": {
+        "task": "apps.timetable.tasks.prune_event_tombstones",
+        "schedule": crontab(minute=30, hour=1),
+    },
+    "schedule-meetings": {
+        "task": "apps.schools.tasks.schedule_meetings",
+        "schedule": crontab(),
+    },
+}
 
 # Timetable settings
 
 SHOW_CANCELLED_OCCURRENCES = os.getenv("SHOW_CANCELLED_OCCURRENCES", False)
 
+# Keep a materialized index of expanded occurrences within a rolling horizon
+# around now. Run the extend_occurrence_index task once after enabling it.
+OCCURRENCE_INDEX_ENABLED = os.getenv("OCCURRENCE_INDEX_ENABLED") == "True"
+OCCURRENCE_INDEX_PAST_DAYS = int(os.getenv("OCCURRENCE_INDEX_PAST_DAYS", 30))
+OCCURRENCE_INDEX_FUTURE_DAYS = int(os.getenv("OCCURRENCE_INDEX_FUTURE_DAYS", 365))
+
+# Number of compiled rrules and parsed rule params kept in memory per process
+RRULE_CACHE_SIZE = int(os.getenv("RRULE_CACHE_SIZE", 1024))
+
+# Days deleted events are remembered for syncing calendar clients, older sync
+# tokens get a full resync
+SYNC_TOMBSTONE_DAYS = int(os.getenv("SYNC_TOMBSTONE_DAYS", 30))
+
+# Days of an event recurring forever checked for scheduling conflicts
+CONFLICT_HORIZON_DAYS = int(os.getenv("CONFLICT_HORIZON_DAYS", 365))
+
 
 # CKEditor settings
 